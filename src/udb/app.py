@@ -20,6 +20,8 @@ import jinja2
 import ujson
 from cherrypy import Application
 
+import udb.core.deployment  # noqa
+import udb.core.linter  # noqa
 import udb.core.login  # noqa
 import udb.core.notification  # noqa
 import udb.plugins.ldap  # noqa
@@ -40,7 +42,7 @@ from udb.controller.common_page import CommonApi
 from udb.controller.dashboard_page import DashboardPage
 from udb.controller.deployment_page import DeploymentApi, DeploymentPage
 from udb.controller.dhcprecord_page import DhcpRecordPage
-from udb.controller.dnsrecord_page import DnsRecordPage
+from udb.controller.dnsrecord_page import DnsRecordApi, DnsRecordPage
 from udb.controller.dnszone_page import DnsZonePage
 from udb.controller.environment_page import EnvironmentApi, EnvironmentPage
 from udb.controller.ip_page import IpPage
@@ -51,13 +53,13 @@ from udb.controller.mac_page import MacPage
 from udb.controller.mfa_page import MfaPage
 from udb.controller.notifications_page import NotificationsPage
 from udb.controller.profile_page import ProfilePage
-from udb.controller.rule_page import RuleApi, RulePage
+from udb.controller.rule_page import ConflictApi, RuleApi, RulePage
 from udb.controller.search_page import SearchPage
 from udb.controller.static import Static
-from udb.controller.subnet_page import SubnetPage
+from udb.controller.subnet_page import SubnetApi, SubnetPage
 from udb.controller.user_page import UserPage
 from udb.controller.vrf_page import VrfPage
-from udb.core.model import DhcpRecord, DnsRecord, DnsZone, Subnet, User, Vrf
+from udb.core.model import DhcpRecord, DnsZone, User, Vrf
 from udb.tools.i18n import format_datetime, gettext_lazy, ngettext
 
 try:
@@ -175,13 +177,14 @@ class Root(object):
         self.deployment = DeploymentPage()
         # Api
         self.api.dnszone = CommonApi(DnsZone, new_perm=User.PERM_DNSZONE_CREATE)
-        self.api.subnet = CommonApi(Subnet, new_perm=User.PERM_SUBNET_CREATE)
-        self.api.dnsrecord = CommonApi(DnsRecord)
+        self.api.subnet = SubnetApi()
+        self.api.dnsrecord = DnsRecordApi()
         self.api.dhcprecord = CommonApi(DhcpRecord)
         self.api.vrf = CommonApi(Vrf)
         self.api.deployment = DeploymentApi()
         self.api.environment = EnvironmentApi()
         self.api.rule = RuleApi()
+        self.api.conflict = ConflictApi()
 
     @cherrypy.expose
     @cherrypy.tools.jinja2(template='index.html')
@@ -270,6 +273,15 @@ class UdbApplication(Application):
                 'notification.env': env,
                 'notification.header_name': cfg.header_name,
                 'notification.catch_all_email': cfg.notification_catch_all_email,
+                # Configure deployment
+                'deployment.env': env,
+                'deployment.max_concurrency': cfg.deployment_max_concurrency,
+                'deployment.timeout': cfg.deployment_timeout,
+                # Configure linter
+                'linter.refresh_time': cfg.linter_refresh_time,
+                'linter.timeout': cfg.linter_timeout,
+                'linter.max_failures': cfg.linter_max_failures,
+                'linter.workers': cfg.linter_workers,
                 # Configure locales
                 'tools.i18n.default': cfg.default_lang,
                 'tools.i18n.default_timezone': cfg.default_timezone,
@@ -439,6 +439,73 @@ def parse_args(args=None, config_file_contents=None):
         default=None,
     )
 
+    parser.add_argument(
+        '--deployment-max-concurrency',
+        metavar='COUNT',
+        type=int,
+        help=_('Maximum number of deployments running at the same time. Default 4.'),
+        default=4,
+    )
+
+    parser.add_argument(
+        '--deployment-timeout',
+        metavar='SECONDS',
+        type=int,
+        help=_(
+            'Maximum execution time of a deployment in seconds. Deployment scripts running longer are killed. Use 0 to disable. Default 3600.'
+        ),
+        default=3600,
+    )
+
+    parser.add_argument(
+        '--linter-refresh-time',
+        metavar='HH:MM',
+        help=_('Time of day when every linter rules get evaluated. Default 02:00.'),
+        default='02:00',
+    )
+
+    parser.add_argument(
+        '--linter-timeout',
+        metavar='SECONDS',
+        type=int,
+        help=_('Maximum execution time of a linter rule in seconds. Use 0 to disable. Default 30.'),
+        default=30,
+    )
+
+    parser.add_argument(
+        '--linter-max-failures',
+        metavar='COUNT',
+        type=int,
+        help=_(
+            'Number of consecutive failures or timeouts before a linter rule get disabled automatically. Use 0 to disable. Default 3.'
+        ),
+        default=3,
+    )
+
+    parser.add_argument(
+        '--linter-workers',
+        metavar='COUNT',
+        type=int,
+        help=_(
+            'Number of linter rules evaluated concurrently using separate database connections. Not used with SQLite. Default 4.'
+        ),
+        default=4,
+    )
+
+    parser.add_argument(
+        '--rule-advisor',
+        action='store_true',
+        help=_(
+            'Print the sequential scans executed by the rules on large tables with the suggested indexes, then exit.'
+        ),
+    )
+
+    parser.add_argument(
+        '--rule-advisor-create-indexes',
+        action='store_true',
+        help=_('Used with --rule-advisor to create the suggested indexes.'),
+    )
+
     parser.add_argument(
         '--favicon',
         dest='favicon',
@@ -25,7 +25,7 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.inspection import inspect
 
 import udb
-from udb.core.model import Environment, Rule, RuleError
+from udb.core.model import Environment, Message, Rule, RuleError
 from udb.tools.i18n import get_translation
 from udb.tools.i18n import gettext as _
 
@@ -33,6 +33,10 @@ logger = logging.getLogger(__name__)
 
 FlashMessage = namedtuple('FlashMessage', ['message', 'level'])
 
+ChangeRow = namedtuple(
+    'ChangeRow', ['model_id', 'summary', 'model_name', 'author', 'date', 'type', 'body', 'changes', 'url']
+)
+
 # Capture epoch time to invalidate cache of static file.
 _cache_invalidate = int(time.time())
 
@@ -143,6 +147,53 @@ def template_processor(request):
     return values
 
 
+def list_changes(query):
+    """
+    Return a list of ChangeRow for the messages returned by the given query.
+
+    Summaries of related records and authors are resolved in bulk with one query
+    per model instead of loading each record.
+    """
+    messages = (
+        query.with_entities(
+            Message.id,
+            Message.model_id,
+            Message.model_name,
+            Message.author_id,
+            Message.date,
+            Message.type,
+            Message.body,
+            Message._changes.label('changes'),
+        )
+        .order_by(Message.id)
+        .all()
+    )
+    # Group messages by model_name.
+    model_ids = {}
+    author_ids = set()
+    for obj in messages:
+        model_ids.setdefault(obj.model_name, set()).add(obj.model_id)
+        if obj.author_id is not None:
+            author_ids.add(obj.author_id)
+    summaries = {model_name: Message.get_summaries(model_name, ids) for model_name, ids in model_ids.items() if ids}
+    authors = Message.get_summaries('user', author_ids)
+    system = str(_('System'))
+    return [
+        ChangeRow(
+            model_id=obj.model_id,
+            summary=summaries[obj.model_name].get(obj.model_id),
+            model_name=obj.model_name,
+            author=authors.get(obj.author_id, system),
+            date=obj.date.isoformat(),
+            type=obj.type,
+            body=obj.body,
+            changes=Message.json_changes(obj.changes),
+            url=url_for(obj.model_name, obj.model_id, 'edit', relative='server'),
+        )
+        for obj in messages
+    ]
+
+
 def show_exception(e, form=None, obj=None):
     if isinstance(e, ValueError):
         # ValueError are raised by SQLalchemy custom validation
@@ -178,7 +178,6 @@ class CommonPage(object):
             else:
                 flash(_('Record created successfully.'))
                 # Redirect user to same record
-                Rule.verify(obj)
                 raise cherrypy.HTTPRedirect(url_for(obj, 'edit'))
         elif not form.is_submitted():
             # Apply the default value from params
@@ -232,7 +231,6 @@ class CommonPage(object):
                 cherrypy.tools.db.get_session().rollback()
             else:
                 flash(_('Record updated successfully'))
-                Rule.verify(obj)
                 raise cherrypy.HTTPRedirect(url_for(obj, 'edit'))
         else:
             # Run Soft Rules
@@ -19,7 +19,7 @@ from datetime import datetime, timedelta, timezone
 import cherrypy
 from sqlalchemy import desc, func
 
-from udb.core.model import DhcpRecord, DnsRecord, DnsZone, Ip, Mac, Message, Subnet, User, Vrf
+from udb.core.model import DhcpRecord, DnsRecord, DnsZone, Ip, Mac, Message, Rule, Subnet, User, Vrf
 
 Base = cherrypy.tools.db.get_base()
 
@@ -57,4 +57,5 @@ class DashboardPage:
             'dhcprecord_count': dhcprecord_count,
             'mac_count': mac_count,
             'user_activities': user_activities,
+            'linter_date': Rule.get_linter_date(),
         }
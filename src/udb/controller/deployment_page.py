@@ -16,14 +16,20 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from collections import namedtuple
+import hashlib
+import io
+import tarfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
 
 import cherrypy
+import ujson
 
-from udb.controller import url_for, verify_perm
+from udb.controller import list_changes, url_for, validate_int, verify_perm
 from udb.controller.api import checkpassword
 from udb.controller.common_page import CommonApi
-from udb.core.model import Deployment, DnsRecord, DnsZone, Environment, User
+from udb.core.model import Deployment, DnsZone, Environment, User
 
 TOKEN_USERNAME = 'token'
 
@@ -44,9 +50,115 @@ DeploymentRow = namedtuple(
     'DeploymentRow', ['id', 'state', 'environment', 'created_at', 'change_count', 'owner', 'url']
 )
 
-ChangeRow = namedtuple(
-    'ChangeRow', ['model_id', 'summary', 'model_name', 'author', 'date', 'type', 'body', 'changes', 'url']
-)
+
+def _etag(id, body):
+    """
+    Return a strong ETag made of the deployment id and a hash of the content.
+    """
+    return '"%s-%s"' % (id, hashlib.sha256(body).hexdigest()[:32])
+
+
+class _ArtifactCache:
+    """
+    In-memory LRU cache of rendered deployment artifacts bounded by the total size of the bodies.
+
+    Deployment data never change once created. Rendered artifacts are stored
+    with a strong ETag made of the deployment id and a hash of the content.
+    Bodies larger than `max_item_size` are not kept. Each entry is accounted
+    with a fixed overhead to bound the number of entries.
+    """
+
+    # Approximate memory used by an entry in addition of the body.
+    ENTRY_OVERHEAD = 512
+
+    def __init__(self, maxbytes=64 * 1024 * 1024, max_item_size=4 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.max_item_size = max_item_size
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """
+        Return the (etag, body) for the given key. Call `render` to generate the body when missing.
+        """
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                return value
+        body = render()
+        value = (_etag(key[0], body), body)
+        if len(body) > self.max_item_size:
+            return value
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = value
+                self._size += len(body) + self.ENTRY_OVERHEAD
+            while self._size > self.maxbytes:
+                etag_unused, evicted = self._data.popitem(last=False)[1]
+                self._size -= len(evicted) + self.ENTRY_OVERHEAD
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+_artifact_cache = _ArtifactCache()
+
+
+def _send_body(etag, body, content_type, cache_control):
+    """
+    Return the body with caching headers. Respond with "304 Not Modified"
+    if the client already has the latest version.
+    """
+    response = cherrypy.serving.response
+    response.headers['Content-Type'] = content_type
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = cache_control
+    response.headers.pop('Pragma', None)
+    response.headers.pop('Expires', None)
+    cherrypy.lib.cptools.validate_etags()
+    return body
+
+
+def _send_artifact(id, artifact, content_type, render):
+    """
+    Return an immutable deployment artifact with caching headers.
+
+    `render` is called with the deployment object and must return the body as bytes.
+    It must only depend on the deployment.
+    """
+    # Query only the required fields to avoid loading the deployment data.
+    row = Deployment.query.with_entities(Deployment.id, Deployment.token).filter(Deployment.id == id).first()
+    if row is None:
+        raise cherrypy.HTTPError(404)
+    # Token is part of the key to make sure it's unique to a deployment.
+    etag, body = _artifact_cache.get(
+        (row.id, row.token, artifact),
+        lambda: render(Deployment.query.filter(Deployment.id == row.id).one()),
+    )
+    return _send_body(etag, body, content_type, 'private, max-age=31536000, immutable')
+
+
+class _StreamBuffer:
+    """
+    File-like object used to stream the content of a tar archive.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
 
 
 class DeploymentPage:
@@ -65,28 +177,16 @@ class DeploymentPage:
         return deployment
 
     @cherrypy.expose()
-    @cherrypy.tools.json_out()
     def changes_json(self, id, **kwargs):
         """
         Return list of changes for this deployment.
         """
-        deployment = self._get_or_404(id)
-        return {
-            'data': [
-                ChangeRow(
-                    model_id=obj.model_id,
-                    summary=obj.get_summary(),
-                    model_name=obj.model_name,
-                    author=obj.author_name,
-                    date=obj.date.isoformat(),
-                    type=obj.type,
-                    body=obj.body,
-                    changes=obj.changes,
-                    url=url_for(obj.model_name, obj.model_id, 'edit', relative='server'),
-                )
-                for obj in deployment.changes
-            ]
-        }
+
+        def render(deployment):
+            data = list_changes(Deployment.query.join(Deployment.changes).filter(Deployment.id == deployment.id))
+            return ujson.dumps({'data': data}).encode('utf-8')
+
+        return _send_artifact(id, 'changes_json', 'application/json', render)
 
     @cherrypy.expose()
     @cherrypy.tools.json_out()
@@ -166,25 +266,48 @@ class DeploymentApi(CommonApi):
     def __init__(self):
         super().__init__(Deployment, list_perm=User.PERM_NETWORK_LIST, edit_perm=-1, new_perm=-1)
         setattr(self, 'data.json', self.data_json)
+        setattr(self, 'zonefiles.tar', self.zonefiles_tar)
+        setattr(self, 'zonefiles.tar.gz', self.zonefiles_tar_gz)
 
     @cherrypy.expose()
     @cherrypy.tools.auth_basic(on=True, checkpassword=checkpassword_or_token)
+    @cherrypy.tools.json_out(on=False)
     def data_json(self, id=None, **kwargs):
         """
         Return deployment data as Json.
         """
         # Check role
         verify_perm(self.list_perm)
+        return _send_artifact(
+            id, 'data_json', 'application/json', lambda deployment: ujson.dumps(deployment.data).encode('utf-8')
+        )
+
+    @cherrypy.expose()
+    @cherrypy.tools.auth_basic(on=True, checkpassword=checkpassword_or_token)
+    def delta(self, id=None, since=None, **kwargs):
+        """
+        Return records added, changed and removed since the last successful deployment
+        of the same environment or since the deployment identified by `since`.
+        """
+        # Check role
+        verify_perm(self.list_perm)
         # Get object
         deployment = self._get_or_404(id)
-        # Return data
-        return deployment.data
+        # Lookup the deployment to compare with.
+        if since:
+            previous = self._get_or_404(validate_int(since, message='invalid deployment id'))
+            if previous.model_name != deployment.model_name:
+                raise cherrypy.HTTPError(400, 'cannot compare deployments of different data type')
+        else:
+            previous = deployment.get_previous()
+        delta = deployment.get_delta(previous)
+        delta['id'] = deployment.id
+        delta['since'] = previous.id if previous else None
+        return delta
 
     @cherrypy.expose()
     @cherrypy.tools.auth_basic(on=True, checkpassword=checkpassword_or_token)
-    @cherrypy.tools.jinja2(template=['dnszone/zone.j2'])
     @cherrypy.tools.json_out(on=False)
-    @cherrypy.tools.response_headers(headers=[('Content-Type', 'text/plain')])
     def zonefile(self, id=None, name=None, **kwargs):
         """
         Generate a DNS Zone file from deployment data.
@@ -192,8 +315,7 @@ class DeploymentApi(CommonApi):
         deployment = self._get_or_404(id)
 
         # Return 404 is dnsrecord is not part of this deployment.
-        dnsrecords = deployment.data.get('dnsrecord', None)
-        if dnsrecords is None:
+        if deployment.data.get('dnsrecord', None) is None:
             raise cherrypy.HTTPError(404, "Wrong deployment type")
 
         # Return 404 if name is not a Zone
@@ -202,10 +324,62 @@ class DeploymentApi(CommonApi):
             raise cherrypy.HTTPError(404, "Zone name not found")
 
         # Filter out records base on zone name
-        dnsrecords = [
-            r for r in dnsrecords if r.get('name' if r.get('type', None) != 'PTR' else 'value', '').endswith(name)
-        ]
+        dnsrecords = deployment.get_zone_records(name)
 
-        # Then simply sort the dnsrecords
-        # Make sure SOA record are first.
-        return {'dnsrecords': dnsrecords, 'dnsrecord_sort_key': DnsRecord.dnsrecord_sort_key}
+        # Records are already sorted with SOA record first.
+        env = cherrypy.request.config.get('tools.jinja2.env')
+        body = env.get_template('dnszone/zone.j2').render(dnsrecords=dnsrecords).encode('utf-8')
+        # Existence of the zone may change, let client revalidate the zone file.
+        return _send_body(_etag(deployment.id, body), body, 'text/plain;charset=utf-8', 'private, no-cache')
+
+    def _zonefiles(self, id, mode):
+        """
+        Generate a tar archive with a DNS Zone file for each zone from deployment data.
+        """
+        deployment = self._get_or_404(id)
+
+        # Return 404 is dnsrecord is not part of this deployment.
+        if deployment.data.get('dnsrecord', None) is None:
+            raise cherrypy.HTTPError(404, "Wrong deployment type")
+
+        # Assign every records to it's zone in a single pass.
+        zones = DnsZone.query.with_entities(DnsZone.name).filter(DnsZone.estatus == DnsZone.STATUS_ENABLED).all()
+        partitions = deployment.partition_zone_records([name for (name,) in zones])
+        tmpl = cherrypy.request.config.get('tools.jinja2.env').get_template('dnszone/zone.j2')
+        mtime = int(time.mktime(deployment.created_at.timetuple()))
+
+        def stream():
+            buf = _StreamBuffer()
+            with tarfile.open(fileobj=buf, mode=mode) as tar:
+                for name in sorted(partitions):
+                    data = tmpl.render(dnsrecords=partitions[name]).encode('utf-8')
+                    info = tarfile.TarInfo(name + '.zone')
+                    info.size = len(data)
+                    info.mtime = mtime
+                    tar.addfile(info, io.BytesIO(data))
+                    yield buf.pop()
+            yield buf.pop()
+
+        return stream()
+
+    @cherrypy.expose()
+    @cherrypy.tools.auth_basic(on=True, checkpassword=checkpassword_or_token)
+    @cherrypy.tools.json_out(on=False)
+    @cherrypy.tools.response_headers(headers=[('Content-Type', 'application/x-tar')])
+    @cherrypy.config(**{'response.stream': True})
+    def zonefiles_tar(self, id=None, **kwargs):
+        """
+        Return every DNS Zone files from deployment data as a tar archive.
+        """
+        return self._zonefiles(id, mode='w|')
+
+    @cherrypy.expose()
+    @cherrypy.tools.auth_basic(on=True, checkpassword=checkpassword_or_token)
+    @cherrypy.tools.json_out(on=False)
+    @cherrypy.tools.response_headers(headers=[('Content-Type', 'application/gzip')])
+    @cherrypy.config(**{'response.stream': True})
+    def zonefiles_tar_gz(self, id=None, **kwargs):
+        """
+        Return every DNS Zone files from deployment data as a compressed tar archive.
+        """
+        return self._zonefiles(id, mode='w|gz')
@@ -25,7 +25,7 @@ from udb.core.model import DhcpRecord, User, Vrf
 from udb.tools.i18n import gettext_lazy as _
 
 from .common_page import CommonPage
-from .form import CherryForm, SelectObjectField
+from .form import CherryForm, NextIpInput, SelectObjectField
 
 
 class DhcpRecordForm(CherryForm):
@@ -38,6 +38,7 @@ class DhcpRecordForm(CherryForm):
     ip = StringField(
         _('IP'),
         validators=[DataRequired(), IPAddress(ipv4=True, ipv6=True)],
+        widget=NextIpInput(),
         render_kw={"placeholder": _("Enter an IPv4 or IPv6 address"), "autofocus": True, "width": "3/4"},
     )
 
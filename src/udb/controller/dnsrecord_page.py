@@ -25,8 +25,8 @@ from udb.controller import flash, show_exception, url_for, verify_perm
 from udb.core.model import DnsRecord, User, Vrf
 from udb.tools.i18n import gettext_lazy as _
 
-from .common_page import CommonPage
-from .form import CherryForm, SelectObjectField
+from .common_page import CommonApi, CommonPage
+from .form import CherryForm, NextIpInput, SelectObjectField
 
 
 class EditDnsRecordForm(CherryForm):
@@ -69,6 +69,7 @@ class EditDnsRecordForm(CherryForm):
             DataRequired(),
             Length(max=256),
         ],
+        widget=NextIpInput(types=['A', 'AAAA']),
     )
 
     vrf_id = SelectObjectField(
@@ -185,6 +186,7 @@ class DnsRecordPage(CommonPage):
                 DnsRecord.notes,
                 User.summary.label('owner'),
             )
+            .order_by(*DnsRecord.sort_order())
         )
 
     @cherrypy.expose
@@ -217,3 +219,17 @@ class DnsRecordPage(CommonPage):
             DnsRecord.value,
         )
         return {'data': [list(row) + [url_for('dnsrecord', row[0], 'edit')] for row in query.all()]}
+
+
+class DnsRecordApi(CommonApi):
+    def __init__(self):
+        super().__init__(DnsRecord)
+
+    def list(self, domain=None, **kwargs):
+        """
+        Optionally limit the list to the records of a domain and it's subdomains.
+        """
+        query = DnsRecord.query
+        if domain:
+            query = query.filter(DnsRecord.in_domain(domain))
+        return [obj.to_json() for obj in query.order_by(*DnsRecord.sort_order()).all()]
@@ -150,6 +150,7 @@ class DnsZonePage(CommonPage):
                 DnsRecord.value,
             )
             .filter(DnsRecord.estatus == DnsRecord.STATUS_ENABLED, DnsRecord.dnszone_id == zone.id)
+            .order_by(*DnsRecord.sort_order())
             .all()
         )
-        return {'dnsrecords': [r._asdict() for r in dnsrecords], 'dnsrecord_sort_key': DnsRecord.dnsrecord_sort_key}
+        return {'dnsrecords': [r._asdict() for r in dnsrecords]}
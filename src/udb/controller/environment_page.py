@@ -15,14 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from collections import namedtuple
-
 import cherrypy
 from sqlalchemy import func
 from wtforms.fields import HiddenField, SelectField, StringField, SubmitField, TextAreaField
 from wtforms.validators import DataRequired, Length, ValidationError
 
-from udb.controller import flash, url_for, verify_perm
+from udb.controller import flash, list_changes, url_for, verify_perm
 from udb.controller.common_page import CommonApi
 from udb.core.model import Environment, Message, User
 from udb.tools.i18n import gettext
@@ -31,10 +29,6 @@ from udb.tools.i18n import gettext_lazy as _
 from .common_page import CommonPage
 from .form import CherryForm, SelectObjectField
 
-ChangeRow = namedtuple(
-    'ChangeRow', ['model_id', 'summary', 'model_name', 'author', 'date', 'type', 'body', 'changes', 'url']
-)
-
 
 class EnvironmentForm(CherryForm):
     name = StringField(
@@ -80,7 +74,7 @@ class EnvironmentForm(CherryForm):
         ]
         self.script.description = (
             _("Your shell script can use some of the predefined environment variables: %s.")
-            % "UDB_USERID, UDB_USERNAME, UDB_DEPLOYMENT_ID, UDB_DEPLOYMENT_TOKEN, UDB_DEPLOYMENT_AUTH, UDB_DEPLOYMENT_MODEL_NAME, UDB_DEPLOYMENT_DATA_URL"
+            % "UDB_USERID, UDB_USERNAME, UDB_DEPLOYMENT_ID, UDB_DEPLOYMENT_TOKEN, UDB_DEPLOYMENT_AUTH, UDB_DEPLOYMENT_MODEL_NAME, UDB_DEPLOYMENT_DATA_URL, UDB_DEPLOYMENT_DATA_FILE, UDB_DEPLOYMENT_ZONES_DIR"
         )
 
 
@@ -182,20 +176,9 @@ class EnvironmentPage(CommonPage):
         environment = self._get_or_404(key)
         # List all activities by dates
         return {
-            'data': [
-                ChangeRow(
-                    model_id=obj.model_id,
-                    summary=obj.get_summary(),
-                    model_name=obj.model_name,
-                    author=obj.author_name,
-                    date=obj.date.isoformat(),
-                    type=obj.type,
-                    body=obj.body,
-                    changes=obj.changes,
-                    url=url_for(obj.model_name, obj.model_id, 'edit', relative='server'),
-                )
-                for obj in environment.pending_changes
-            ]
+            'data': list_changes(
+                Environment.query.join(Environment.pending_changes).filter(Environment.id == environment.id)
+            )
         }
 
 
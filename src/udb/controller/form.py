@@ -16,11 +16,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import json
+
 import cherrypy
 from markupsafe import Markup
 from wtforms.fields import SelectField, SelectMultipleField
 from wtforms.form import Form
+from wtforms.widgets import TextInput
 
+from udb.controller import url_for
 from udb.tools.i18n import gettext as _
 
 
@@ -150,6 +154,32 @@ class SwitchWidget(JinjaWidget):
     filename = 'widgets/SwitchWidget.html'
 
 
+class NextIpInput(TextInput):
+    """
+    Text input with a button to replace the subnet range entered by the next
+    available IP address. When `types` is defined, the button is only enabled
+    for those DNS record types.
+    """
+
+    def __init__(self, types=None, **kwargs):
+        super().__init__(**kwargs)
+        self.types = types
+
+    def __call__(self, field, **kwargs):
+        button = Markup(
+            '<button type="button" class="btn btn-outline-secondary text-nowrap" data-next-ip-url="%s"%s title="%s">'
+            '%s</button>'
+        ) % (
+            url_for('subnet', 'next_ip.json'),
+            Markup(" data-next-ip-types='%s'") % json.dumps(self.types) if self.types else '',
+            _('Enter a subnet range to get its next available IP address'),
+            _('Next available'),
+        )
+        # Keep error message visible below the input group.
+        group_class = 'input-group is-invalid' if field.errors else 'input-group'
+        return Markup('<div class="%s">%s%s</div>') % (group_class, super().__call__(field, **kwargs), button)
+
+
 class SelectMultipleObjectField(SelectMultipleField):
     """
     Field to select one or more sqlalchemy object.
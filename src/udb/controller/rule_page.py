@@ -19,8 +19,8 @@ import cherrypy
 from wtforms.fields import BooleanField, SelectField, StringField, TextAreaField
 from wtforms.validators import DataRequired, Length
 
-from udb.controller import url_for
-from udb.core.model import Rule, User, all_models
+from udb.controller import url_for, verify_perm
+from udb.core.model import Rule, User, all_models, find_conflicts, rule_violation
 from udb.tools.i18n import gettext_lazy as _
 
 from .common_page import CommonApi, CommonPage
@@ -88,6 +88,18 @@ class RuleForm(CherryForm):
         ),
     )
 
+    object_statement = TextAreaField(
+        _('SQL Statement for a single record'),
+        validators=[Length(max=10485760)],
+        render_kw={
+            "placeholder": _("SQL Statement returning the invalid record identified by :object_id."),
+            "rows": 5,
+        },
+        description=_(
+            'Optional statement used to validate a single record. It should return the same columns as the SQL Statement but filtered on :object_id.'
+        ),
+    )
+
     notes = TextAreaField(
         _('Notes'),
         default='',
@@ -116,6 +128,7 @@ class RuleForm(CherryForm):
         super().populate_obj(obj)
         # convert severity from bool to int for database
         obj.severity = int(self.severity.data)
+        obj.object_statement = self.object_statement.data or None
 
 
 class RulePage(CommonPage):
@@ -150,25 +163,90 @@ class RulePage(CommonPage):
             Rule.builtin,
             Rule.type,
             User.summary.label('owner'),
+            Rule.linter_duration,
         ).outerjoin(Rule.owner)
 
     @cherrypy.expose()
     @cherrypy.tools.json_out()
     def linter_json(self, **kwargs):
         """
-        Execute the linter and return each row with a link to the problematic record.
+        Return the result of the linter with a link to each problematic record.
         """
+        # Rules are evaluated in background. Trigger an evaluation if never done.
+        linter_date = Rule.get_linter_date()
+        if linter_date is None:
+            cherrypy.engine.publish('refresh_linter')
+        query = (
+            Rule.session.query(
+                Rule.description,
+                rule_violation.c.model_id,
+                Rule.severity,
+                rule_violation.c.model_name,
+                rule_violation.c.name,
+            )
+            .join(rule_violation, rule_violation.c.rule_id == Rule.id)
+            .filter(Rule.estatus == Rule.STATUS_ENABLED)
+            .order_by(Rule.name, rule_violation.c.model_id)
+        )
         return {
             'data': [
                 (
                     row.description,
-                    row.id,
+                    row.model_id,
                     row.severity,
                     row.model_name,
                     row.name,
-                    url_for(row.model_name, row.id, 'edit'),
+                    url_for(row.model_name, row.model_id, 'edit'),
                 )
-                for row in Rule.verify()
+                for row in query
+            ],
+            'date': linter_date.isoformat() if linter_date else None,
+        }
+
+    @cherrypy.expose
+    @cherrypy.tools.jinja2(template='rule/advisor.html')
+    def advisor(self, **kwargs):
+        verify_perm(self.edit_perm)
+        return {'model_name': 'rule', 'form': self.edit_form()}
+
+    @cherrypy.expose()
+    @cherrypy.tools.json_out()
+    def advisor_json(self, **kwargs):
+        """
+        Return the sequential scans executed by the rules with the index to be created.
+        """
+        verify_perm(self.edit_perm)
+        return {'data': [list(advice) for advice in Rule.advise()]}
+
+    @cherrypy.expose
+    @cherrypy.tools.jinja2(template='rule/conflicts.html')
+    def conflicts(self, **kwargs):
+        verify_perm(self.list_perm)
+        return {'model_name': 'rule'}
+
+    @cherrypy.expose()
+    @cherrypy.tools.json_out()
+    def conflicts_json(self, type=None, **kwargs):
+        """
+        Return the overlapping ranges and conflicting addresses found in the network.
+        """
+        verify_perm(self.list_perm)
+        try:
+            conflicts = find_conflicts(type or None)
+        except ValueError:
+            raise cherrypy.HTTPError(400, 'invalid conflict type')
+        return {
+            'data': [
+                (
+                    c.type,
+                    c.model_name,
+                    c.name,
+                    url_for(c.model_name, c.model_id, 'edit'),
+                    c.other_model_name,
+                    c.other_name,
+                    url_for(c.other_model_name, c.other_id, 'edit'),
+                )
+                for c in conflicts
             ]
         }
 
@@ -181,3 +259,18 @@ class RuleApi(CommonApi):
             edit_perm=User.PERM_RULE_EDIT,
             new_perm=User.PERM_RULE_EDIT,
         )
+
+
+@cherrypy.expose
+class ConflictApi:
+    """
+    List the overlapping ranges and conflicting addresses found in the network.
+    """
+
+    def list(self, type=None, **kwargs):
+        verify_perm(User.PERM_NETWORK_LIST)
+        try:
+            conflicts = find_conflicts(type or None)
+        except ValueError:
+            raise cherrypy.HTTPError(400, 'invalid conflict type')
+        return [c._asdict() for c in conflicts]
@@ -372,6 +372,15 @@ $.fn.dataTable.render.primary_range = function () {
                     html += ' <span class="badge bg-danger">' + api.settings().i18n('udb.status.deleted') + '</span>';
                 }
             }
+            /* When displaying the tree, add a button to expand children. */
+            const children_idx = api.column('children:name').index();
+            if (children_idx && row[children_idx] > 0) {
+                const expanded = meta.settings.udbExpanded && meta.settings.udbExpanded[row[0]];
+                html = '<button type="button" class="btn btn-link btn-sm p-0 me-1 subnet-toggle" data-id="' + safe(row[0]) + '" aria-expanded="' + (expanded ? 'true' : 'false') + '">' +
+                    '<i class="bi ' + (expanded ? 'bi-caret-down-fill' : 'bi-caret-right-fill') + '" aria-hidden="true"></i>' +
+                    '<span class="visually-hidden">Expand</span>' +
+                    '</button>' + html;
+            }
             return html;
         },
         sort: function (data, type, row, meta) {
@@ -379,6 +388,49 @@ $.fn.dataTable.render.primary_range = function () {
         },
     };
 }
+
+/**
+ * Load children of a subnet when expanded. Remove them when collapsed.
+ */
+jQuery(function () {
+    $(document).on('click', 'table .subnet-toggle', function (event) {
+        event.preventDefault();
+        const button = $(this);
+        const api = button.closest('table').DataTable();
+        const settings = api.settings()[0];
+        const expanded = settings.udbExpanded = settings.udbExpanded || {};
+        const id = button.attr('data-id');
+        function setExpanded(value) {
+            button.attr('aria-expanded', value ? 'true' : 'false');
+            button.find('i').toggleClass('bi-caret-right-fill', !value).toggleClass('bi-caret-down-fill', value);
+        }
+        function descendants(parent_id) {
+            let ids = [];
+            for (const child_id of expanded[parent_id] || []) {
+                ids.push(child_id);
+                ids = ids.concat(descendants(child_id));
+                delete expanded[child_id];
+            }
+            return ids;
+        }
+        if (expanded[id]) {
+            const ids = descendants(id);
+            delete expanded[id];
+            api.rows(function (_idx, data) {
+                return ids.includes(String(data[0]));
+            }).remove().draw(false);
+            setExpanded(false);
+        } else {
+            $.getJSON(api.ajax.url() + '?parent=' + encodeURIComponent(id), function (data) {
+                expanded[id] = data.data.map(function (row) {
+                    return String(row[0]);
+                });
+                api.rows.add(data.data).draw(false);
+                setExpanded(true);
+            });
+        }
+    });
+});
 $.fn.dataTable.render.summary = function (render_arg) {
     /* FIXME Need to make this list canonical */
     let icon_table = {
@@ -513,6 +565,39 @@ jQuery(function () {
     });
 });
 
+/**
+ * Replace the subnet range entered by the next available IP address.
+ */
+jQuery(function () {
+    $('[data-next-ip-url]').each(function () {
+        const button = $(this);
+        const input = button.closest('.input-group').find('input');
+        const form = button.closest('form');
+        // Enable the button only for some DNS record types.
+        const types = button.data('next-ip-types');
+        const typeElem = form.find("[name='type']");
+        if (types && typeElem.length > 0) {
+            function updateDisabled() {
+                button.prop('disabled', $.inArray(typeElem.val(), types) < 0);
+            }
+            typeElem.on('change', updateDisabled);
+            updateDisabled();
+        }
+        button.on('click', function () {
+            const params = { value: input.val() };
+            const vrf_id = form.find("[name='vrf_id']").val();
+            if (vrf_id) {
+                params.vrf_id = vrf_id;
+            }
+            $.getJSON(button.data('next-ip-url'), params).done(function (data) {
+                input.val(data.ip).removeClass('is-invalid');
+            }).fail(function () {
+                input.addClass('is-invalid');
+            });
+        });
+    });
+});
+
 /**
  * Typeahead configured using data-* attributes
  */
@@ -18,17 +18,17 @@
 import ipaddress
 
 import cherrypy
-from sqlalchemy import and_, case, func, or_
+from sqlalchemy import and_, case, func, or_, select
 from sqlalchemy.orm import aliased
 from wtforms.fields import BooleanField, FieldList, FormField, IntegerField, SelectField, StringField, TextAreaField
 from wtforms.validators import DataRequired, Length, NumberRange, Optional, StopValidation, ValidationError
 from wtforms.widgets import HiddenInput
 
-from udb.controller import url_for
-from udb.core.model import DnsZone, Subnet, User, Vrf
+from udb.controller import url_for, validate_int, verify_perm
+from udb.core.model import DnsZone, IpSpace, Subnet, User, Vrf
 from udb.tools.i18n import gettext_lazy as _
 
-from .common_page import CommonPage
+from .common_page import CommonApi, CommonPage
 from .form import CherryForm, JinjaWidget, SelectMultipleObjectField, SelectObjectField, SwitchWidget
 
 
@@ -76,6 +76,14 @@ def _norm_ipaddress(value):
         return value
 
 
+def _tree_order(vrf_id, range):
+    """
+    Sort key of a subnet matching the order of the subnet list. By VRF, IPv6 first, then by range.
+    """
+    network = ipaddress.ip_network(range)
+    return '%010d-%d-%032x-%03d' % (vrf_id, network.version == 4, int(network.network_address), network.prefixlen)
+
+
 class SubnetTableWidget(JinjaWidget):
     filename = 'widgets/SubnetTableWidget.html'
 
@@ -329,6 +337,130 @@ class SubnetPage(CommonPage):
             raise cherrypy.HTTPRedirect(url_for(obj.master, 'edit'))
         return values
 
+    @cherrypy.expose
+    @cherrypy.tools.jinja2(template=['subnet/list.html'])
+    def index(self, subtree=None, tree=None):
+        """
+        Optionally limit the list to the subtree of a subnet or display the
+        hierarchy with children loaded on demand.
+        """
+        values = super().index()
+        values['tree'] = bool(tree)
+        if subtree:
+            values['subtree'] = self._get_or_404(validate_int(subtree, message=_('invalid subnet id')))
+        return values
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def data_json(self, subtree=None, **kwargs):
+        verify_perm(self.list_perm)
+        obj_list = self._list_query()
+        if subtree:
+            obj_list = obj_list.filter(Subnet.in_subtree(validate_int(subtree, message=_('invalid subnet id'))))
+        return {'data': [self._to_list(obj) for obj in obj_list]}
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def next_ip_json(self, value=None, vrf_id=None, **kwargs):
+        """
+        Return the next available IP address of the most specific subnet containing the given IP or range.
+        """
+        verify_perm(self.list_perm)
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except (TypeError, ValueError):
+            raise cherrypy.HTTPError(400, _('%s is not a valid IPv4 or IPv6 range') % value)
+        if vrf_id:
+            vrf_id = validate_int(vrf_id, message=_('invalid vrf id'))
+        space = IpSpace.lookup(network, vrf_id)
+        if space is None:
+            raise cherrypy.HTTPError(404, _('No subnet found for %s') % value)
+        ip = space.next_ip()
+        if ip is None:
+            raise cherrypy.HTTPError(404, _('No IP address available in %s') % space.network)
+        return {'ip': ip, 'subnet_id': space.subnet.id, 'range': str(space.network), 'vrf_id': space.subnet.vrf_id}
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def tree_json(self, parent=None, **kwargs):
+        """
+        Return one level of the subnet hierarchy with the number of children
+        of each subnet. Top level subnets are returned when `parent` is not
+        defined. Children of slave subnets are listed under their master.
+        """
+        verify_perm(self.list_perm)
+        query = (
+            Subnet.query.join(Subnet.vrf)
+            .filter(Subnet.slave.is_(False))
+            .with_entities(
+                Subnet.id,
+                Subnet.estatus,
+                Subnet.vrf_id,
+                Subnet.depth,
+                Subnet.range,
+                Subnet.name,
+                Vrf.name.label('vrf_name'),
+                Subnet.el3vni,
+                Subnet.el2vni,
+                Subnet.evlan,
+                Subnet.rir_status,
+            )
+        )
+        if parent:
+            parent = validate_int(parent, message=_('invalid subnet id'))
+            # Children of secondary ranges are listed under their master.
+            parent_ids = [parent] + list(
+                Subnet.session.scalars(select(Subnet.id).where(Subnet.parent_id == parent, Subnet.slave.is_(True)))
+            )
+            query = query.filter(Subnet.parent_id.in_(parent_ids))
+        else:
+            query = query.filter(Subnet.parent_id.is_(None))
+        rows = query.order_by(Subnet.vrf_id, -func.family(Subnet.range), Subnet.range).all()
+        # Load secondary ranges of this level and count children of every range with grouped queries.
+        master_ids = {row.id: row.id for row in rows}
+        slave_ranges = {}
+        if master_ids:
+            for slave_id, parent_id, estatus, slave_range in Subnet.session.execute(
+                select(Subnet.id, Subnet.parent_id, Subnet.estatus, Subnet.range).where(
+                    Subnet.parent_id.in_(list(master_ids)), Subnet.slave.is_(True)
+                )
+            ):
+                master_ids[slave_id] = parent_id
+                if estatus != Subnet.STATUS_DELETED:
+                    slave_ranges.setdefault(parent_id, []).append(str(slave_range))
+        children = {}
+        if master_ids:
+            for parent_id, count in Subnet.session.execute(
+                select(Subnet.parent_id, func.count(Subnet.id))
+                .where(Subnet.parent_id.in_(list(master_ids)), Subnet.slave.is_(False))
+                .group_by(Subnet.parent_id)
+            ):
+                master_id = master_ids[parent_id]
+                children[master_id] = children.get(master_id, 0) + count
+        data = []
+        for row in rows:
+            data.append(
+                self._to_list(
+                    [
+                        row.id,
+                        row.estatus,
+                        # Replace the order by a sort key to be merged with other levels.
+                        _tree_order(row.vrf_id, row.range),
+                        row.depth,
+                        row.range,
+                        ','.join(slave_ranges.get(row.id, [])) or None,
+                        row.name,
+                        row.vrf_name,
+                        row.el3vni,
+                        row.el2vni,
+                        row.evlan,
+                        row.rir_status,
+                        children.get(row.id, 0),
+                    ]
+                )
+            )
+        return {'data': data}
+
     def _list_query(self):
         # This implementation must return the list of subnets with
         # 1. `order` field based on range
@@ -389,3 +521,35 @@ class SubnetPage(CommonPage):
             )
         )
         return query
+
+
+class SubnetApi(CommonApi):
+    def __init__(self):
+        super().__init__(Subnet, new_perm=User.PERM_SUBNET_CREATE)
+
+    def list(self, subtree=None, **kwargs):
+        """
+        Optionally limit the list to the subtree of a subnet.
+        """
+        query = Subnet.query
+        if subtree:
+            query = query.filter(Subnet.in_subtree(validate_int(subtree, message=_('invalid subnet id'))))
+        return [obj.to_json() for obj in query.all()]
+
+    def get(self, id, action=None, prefixlen=None, **kwargs):
+        """
+        Return the subnet or, with `free` action, the utilization and free
+        blocks of each range. When `prefixlen` is defined, include the next
+        available network of this size.
+        """
+        if action is None:
+            return super().get(id, **kwargs)
+        if action != 'free':
+            raise cherrypy.HTTPError(404)
+        obj = self._get_or_404(id)
+        if prefixlen is not None:
+            prefixlen = validate_int(prefixlen, message=_('invalid prefix length'), max=128)
+        return {
+            'id': obj.id,
+            'ranges': [IpSpace(s).to_json(prefixlen) for s in [obj] + list(obj.slave_subnets)],
+        }
@@ -81,11 +81,17 @@ class WebCase(BaseClass):
     def wait_for_tasks(self):
         count = 0
         time.sleep(0.02)
-        while count < 20 and len(cherrypy.scheduler.list_tasks()) or cherrypy.scheduler.is_job_running():
+        while (
+            count < 20
+            and len(cherrypy.scheduler.list_tasks())
+            or cherrypy.scheduler.is_job_running()
+            or cherrypy.deployment.is_running()
+        ):
             time.sleep(0.02)
             count += 1
         self.assertFalse(cherrypy.scheduler.list_tasks())
         self.assertFalse(cherrypy.scheduler.is_job_running())
+        self.assertFalse(cherrypy.deployment.is_running())
 
     @classmethod
     def setup_server(cls):
@@ -172,6 +178,16 @@ class WebCase(BaseClass):
             end_id=Message.query.order_by(Message.id.desc()).first().id,
         ).add().commit()
 
+    def query_plan(self, query):
+        """
+        Return the SQLite query plan of the given query.
+        """
+        conn = DnsRecord.session.connection()
+        compiled = query.compile(conn, compile_kwargs={'render_postcompile': True})
+        # Values are not used to plan the query.
+        params = tuple(None for unused in compiled.positiontup)
+        return '\n'.join(row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN %s' % compiled, params))
+
     def assertValidHTML(self, msg=None):
         """
         Verify if the current body is compliant HTML.
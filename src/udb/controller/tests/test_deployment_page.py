@@ -15,10 +15,17 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
+import tarfile
+import unittest
 from base64 import b64encode
+from unittest import mock
 from unittest.mock import ANY
 
+from parameterized import parameterized
+
 from udb.controller import url_for
+from udb.controller.deployment_page import _artifact_cache, _ArtifactCache
 from udb.controller.tests import WebCase
 from udb.core.model import Deployment, DhcpRecord, DnsRecord, DnsZone, Environment, Message, Subnet, User, Vrf
 
@@ -211,14 +218,118 @@ class DeploymentPageTest(WebCase):
         self.assertHeaderItemValue('Content-Type', 'application/json')
         self.assertEqual(1, len(data['dhcprecord']))
 
+    def test_get_deployment_api_data_json_etag(self):
+        # Given a database with a record
+        obj = self.obj_cls(**self.new_data).add()
+        obj.commit()
+        # When querying the api/data.json
+        self.getPage(url_for('api', self.base_url, obj.id, 'data.json'), headers=self.authorization)
+        # Then a strong ETag is returned with caching headers
+        self.assertStatus(200)
+        etag = self.assertHeader('ETag')
+        self.assertTrue(etag.startswith('"%s-' % obj.id))
+        self.assertHeader('Cache-Control', 'private, max-age=31536000, immutable')
+        self.assertNoHeader('Pragma')
+        # When querying the same data with If-None-Match
+        self.getPage(
+            url_for('api', self.base_url, obj.id, 'data.json'),
+            headers=self.authorization + [('If-None-Match', etag)],
+        )
+        # Then data is not modified
+        self.assertStatus(304)
+        self.assertBody('')
+
+    def test_get_deployment_api_data_json_etag_not_cached(self):
+        # Given a deployment with artifacts too large to be cached
+        obj = self.obj_cls(**self.new_data).add()
+        obj.commit()
+        with mock.patch.object(_artifact_cache, 'max_item_size', 0):
+            # When querying the api/data.json twice
+            self.getPage(url_for('api', self.base_url, obj.id, 'data.json'), headers=self.authorization)
+            self.assertStatus(200)
+            etag = self.assertHeader('ETag')
+            body = self.body
+            self.getPage(url_for('api', self.base_url, obj.id, 'data.json'), headers=self.authorization)
+            # Then the same data is rendered again
+            self.assertStatus(200)
+            self.assertHeader('ETag', etag)
+            self.assertBody(body)
+            # When querying the same data with If-None-Match
+            self.getPage(
+                url_for('api', self.base_url, obj.id, 'data.json'),
+                headers=self.authorization + [('If-None-Match', etag)],
+            )
+            # Then data is not modified
+            self.assertStatus(304)
+
+    def test_get_deployment_changes_json_etag(self):
+        # Given a new deployment
+        obj = self.obj_cls(**self.new_data).add()
+        obj.commit()
+        # When querying changes.json twice
+        self.getPage(url_for(self.base_url, obj.id, 'changes.json'))
+        self.assertStatus(200)
+        etag = self.assertHeader('ETag')
+        self.getPage(url_for(self.base_url, obj.id, 'changes.json'), headers=[('If-None-Match', etag)])
+        # Then data is not modified
+        self.assertStatus(304)
+        # When querying another deployment
+        other = self.obj_cls(**self.new_data).add()
+        other.commit()
+        self.getPage(url_for(self.base_url, other.id, 'changes.json'), headers=[('If-None-Match', etag)])
+        # Then data is returned
+        self.assertStatus(200)
+        self.assertNotEqual(etag, self.assertHeader('ETag'))
+
+    def test_get_deployment_api_delta(self):
+        # Given a successful deployment
+        previous = self.obj_cls(**self.new_data).add()
+        previous.state = Deployment.STATE_SUCCESS
+        previous.commit()
+        # Given a new DHCP Record
+        vrf = Vrf.query.first()
+        record = DhcpRecord(ip='192.168.45.68', mac='E5:D3:56:7B:22:A4', vrf=vrf).add().commit()
+        obj = self.environment.create_deployment(User.query.first()).add().commit()
+        # When querying the delta
+        data = self.getJson(url_for('api', self.base_url, obj.id, 'delta'), headers=self.authorization)
+        # Then only the new record is returned
+        self.assertEqual(data['id'], obj.id)
+        self.assertEqual(data['since'], previous.id)
+        self.assertEqual([r['id'] for r in data['added']['dhcprecord']], [record.id])
+        self.assertEqual(data['changed']['dhcprecord'], [])
+        self.assertEqual(data['removed']['dhcprecord'], [])
+        # When querying the delta since a specific deployment
+        data = self.getJson(url_for('api', self.base_url, obj.id, 'delta', since=obj.id), headers=self.authorization)
+        # Then nothing changed
+        self.assertEqual(data['since'], obj.id)
+        self.assertEqual(data['added']['dhcprecord'], [])
+
+    def test_get_deployment_api_delta_with_deployment_token(self):
+        # Given a deployment
+        obj = self.obj_cls(**self.new_data).add()
+        obj.commit()
+        # When querying the delta using the deployment token
+        auth = ('admin:%s' % obj.token).encode('ascii')
+        data = self.getJson(
+            url_for('api', self.base_url, obj.id, 'delta'),
+            headers=[('Authorization', 'Basic %s' % b64encode(auth).decode('ascii'))],
+        )
+        # Then all records are added
+        self.assertIsNone(data['since'])
+        self.assertEqual(1, len(data['added']['dhcprecord']))
+
     def test_get_deployment_api_zonefile(self):
         # Given a datbase with a DnsRecord
         vrf = Vrf(name='test')
         builtin_zones = DnsZone.query.all()
         zone1 = DnsZone(name='test.ca').add()
         zone2 = DnsZone(name='example.com').add()
-        Subnet(range='192.0.2.0/24', dnszones=[zone1, zone2, *builtin_zones], vrf=vrf).add().commit()
+        zone3 = DnsZone(name='myexample.com').add()
+        zone4 = DnsZone(name='sub.example.com').add()
+        Subnet(range='192.0.2.0/24', dnszones=[zone1, zone2, zone3, zone4, *builtin_zones], vrf=vrf).add().commit()
         DnsRecord(name='test.ca', type='A', value='192.0.2.45', vrf=vrf).add().commit()
+        DnsRecord(name='www.myexample.com', type='A', value='192.0.2.46', vrf=vrf).add().commit()
+        DnsRecord(name='foo.sub.example.com', type='A', value='192.0.2.47', vrf=vrf).add().commit()
         DnsRecord(name='example.com', type='A', value='192.0.2.23', vrf=vrf).add().commit()
         DnsRecord(name='23.2.0.192.in-addr.arpa', type='PTR', value='example.com', vrf=vrf).add().commit()
         DnsRecord(name='*.example.com', type='CNAME', value='bar.example.com', vrf=vrf).add().commit()
@@ -237,12 +348,119 @@ class DeploymentPageTest(WebCase):
         self.getPage(
             url_for('api', self.base_url, deploy.id, 'zonefile', name='example.com'), headers=self.authorization
         )
-        # The zone file contains sorted DNS recrod for our zone
+        # The zone file contains sorted DNS recrod for our zone and it's sub zones without records of other zones
         self.assertStatus(200)
         self.assertHeaderItemValue('Content-Type', 'text/plain;charset=utf-8')
         self.assertBody(
-            ';; Generated by UDB\nexample.com. 3600 IN A 192.0.2.23\n23.2.0.192.in-addr.arpa. 3600 IN PTR example.com\n_acme-challenge.example.com. 3600 IN CNAME foo.example.com.\n*.example.com. 3600 IN CNAME bar.example.com.\n'
+            ';; Generated by UDB\n'
+            'example.com. 3600 IN A 192.0.2.23\n'
+            '23.2.0.192.in-addr.arpa. 3600 IN PTR example.com\n'
+            '_acme-challenge.example.com. 3600 IN CNAME foo.example.com.\n'
+            'foo.sub.example.com. 3600 IN A 192.0.2.47\n'
+            '*.example.com. 3600 IN CNAME bar.example.com.\n'
+        )
+        # Then the zone file must be revalidated by the client
+        etag = self.assertHeader('ETag')
+        self.assertHeader('Cache-Control', 'private, no-cache')
+        # When querying the same zone file with If-None-Match
+        self.getPage(
+            url_for('api', self.base_url, deploy.id, 'zonefile', name='example.com'),
+            headers=self.authorization + [('If-None-Match', etag)],
+        )
+        # Then data is not modified
+        self.assertStatus(304)
+
+    def test_get_deployment_api_zonefile_unsorted(self):
+        # Given a database with DnsRecord
+        vrf = Vrf(name='test')
+        zone = DnsZone(name='example.com').add()
+        Subnet(range='192.0.2.0/24', dnszones=[zone], vrf=vrf).add().commit()
+        DnsRecord(name='example.com', type='SOA', value='ns1.example.com. hostmaster.example.com. 1 2 3 4 5').add()
+        DnsRecord(name='example.com', type='A', value='192.0.2.23', vrf=vrf).add()
+        DnsRecord(name='*.example.com', type='CNAME', value='bar.example.com', vrf=vrf).add()
+        DnsRecord(name='foo.example.com', type='A', value='192.0.2.24', vrf=vrf).add()
+        DnsRecord(name='foo.example.com', type='A', value='192.0.2.25', vrf=vrf).add()
+        DnsRecord(name='foo.example.com', type='TXT', value='foo', vrf=vrf).add().commit()
+        # Given a deployment created before records were stored sorted
+        env = Environment(name='test-env', script='echo FOO', model_name='dnsrecord').add().commit()
+        deploy = Deployment(
+            environment_id=env.id,
+            owner=User.query.first(),
+            change_count=1,
+            start_id=0,
+            end_id=Message.query.order_by(Message.id.desc()).first().id,
+        )
+        deploy.data = {'dnsrecord': list(reversed(deploy.data['dnsrecord']))}
+        deploy.add().commit()
+        # When querying the zone file
+        self.getPage(
+            url_for('api', self.base_url, deploy.id, 'zonefile', name='example.com'), headers=self.authorization
+        )
+        # Then records are sorted with SOA record first, then by hostname, type and value
+        self.assertStatus(200)
+        self.assertBody(
+            ';; Generated by UDB\n'
+            'example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 1 2 3 4 5\n'
+            'example.com. 3600 IN A 192.0.2.23\n'
+            'foo.example.com. 3600 IN A 192.0.2.24\n'
+            'foo.example.com. 3600 IN A 192.0.2.25\n'
+            'foo.example.com. 3600 IN TXT foo\n'
+            '*.example.com. 3600 IN CNAME bar.example.com.\n'
+        )
+
+    @parameterized.expand(
+        [
+            ('zonefiles.tar', 'application/x-tar'),
+            ('zonefiles.tar.gz', 'application/gzip'),
+        ]
+    )
+    def test_get_deployment_api_zonefiles(self, filename, content_type):
+        # Given a database with DnsRecord in a zone and a sub zone
+        vrf = Vrf(name='test')
+        builtin_zones = DnsZone.query.all()
+        zone1 = DnsZone(name='example.com').add()
+        zone2 = DnsZone(name='sub.example.com').add()
+        Subnet(range='192.0.2.0/24', dnszones=[zone1, zone2, *builtin_zones], vrf=vrf).add().commit()
+        DnsRecord(name='example.com', type='A', value='192.0.2.23', vrf=vrf).add().commit()
+        DnsRecord(name='foo.sub.example.com', type='A', value='192.0.2.24', vrf=vrf).add().commit()
+        DnsRecord(name='*.example.com', type='CNAME', value='bar.example.com', vrf=vrf).add().commit()
+        # Given a new deployment
+        env = Environment(name='test-env', script='echo FOO', model_name='dnsrecord').add().commit()
+        deploy = Deployment(
+            environment_id=env.id,
+            owner=User.query.first(),
+            change_count=1,
+            start_id=0,
+            end_id=Message.query.order_by(Message.id.desc()).first().id,
         )
+        deploy.add().commit()
+        # When querying the archive of zone files
+        self.getPage(url_for('api', self.base_url, deploy.id, filename), headers=self.authorization)
+        # Then an archive is returned
+        self.assertStatus(200)
+        self.assertHeaderItemValue('Content-Type', content_type)
+        with tarfile.open(fileobj=io.BytesIO(self.body), mode='r:*') as tar:
+            # Then it contains a zone file for each zone
+            names = tar.getnames()
+            self.assertIn('example.com.zone', names)
+            self.assertIn('sub.example.com.zone', names)
+            # Then each record is part of the zone with the longest matching suffix.
+            self.assertEqual(
+                b';; Generated by UDB\nexample.com. 3600 IN A 192.0.2.23\n*.example.com. 3600 IN CNAME bar.example.com.\n',
+                tar.extractfile('example.com.zone').read(),
+            )
+            self.assertEqual(
+                b';; Generated by UDB\nfoo.sub.example.com. 3600 IN A 192.0.2.24\n',
+                tar.extractfile('sub.example.com.zone').read(),
+            )
+
+    def test_get_deployment_api_zonefiles_wrong_type(self):
+        # Given a deployment of DHCP records
+        obj = self.obj_cls(**self.new_data).add().commit()
+        # When querying the archive of zone files
+        self.getPage(url_for('api', self.base_url, obj.id, 'zonefiles.tar'), headers=self.authorization)
+        # Then an error is returned
+        self.assertStatus(404)
 
     def test_get_deployment_output_json(self):
         # Given a database with a record
@@ -300,3 +518,39 @@ class DeploymentPageTest(WebCase):
         self.getPage(url_for(self.base_url, 'changes.json'))
         # Then return not found
         self.assertStatus(404)
+
+
+class ArtifactCacheTest(unittest.TestCase):
+    def test_get_evict_by_size(self):
+        # Given a cache limited in size
+        cache = _ArtifactCache(maxbytes=10 + 2 * _ArtifactCache.ENTRY_OVERHEAD, max_item_size=6)
+        cache.get((1, 'token', 'a'), lambda: b'12345')
+        cache.get((2, 'token', 'b'), lambda: b'12345')
+        # When adding another body
+        cache.get((3, 'token', 'c'), lambda: b'12345')
+        # Then the least recently used is evicted
+        self.assertEqual([(2, 'token', 'b'), (3, 'token', 'c')], list(cache._data))
+        self.assertEqual(10 + 2 * _ArtifactCache.ENTRY_OVERHEAD, cache._size)
+
+    def test_get_evict_empty(self):
+        # Given a cache limited in size
+        cache = _ArtifactCache(maxbytes=2 * _ArtifactCache.ENTRY_OVERHEAD, max_item_size=6)
+        # When adding many empty bodies
+        for i in range(10):
+            cache.get((i, 'token', 'a'), lambda: b'')
+        # Then the number of entries is bounded
+        self.assertEqual([(8, 'token', 'a'), (9, 'token', 'a')], list(cache._data))
+
+    def test_get_too_large(self):
+        # Given a cache
+        cache = _ArtifactCache(maxbytes=10 + 2 * _ArtifactCache.ENTRY_OVERHEAD, max_item_size=6)
+        # When getting a body larger than the item size limit
+        etag, body = cache.get((1, 'token', 'a'), lambda: b'1234567')
+        # Then the body is returned but not kept
+        self.assertEqual(b'1234567', body)
+        self.assertEqual(0, len(cache._data))
+        # When the body change
+        other_etag, body = cache.get((1, 'token', 'a'), lambda: b'7654321')
+        # Then the etag match the new body
+        self.assertEqual(b'7654321', body)
+        self.assertNotEqual(etag, other_etag)
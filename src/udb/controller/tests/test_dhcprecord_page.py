@@ -51,6 +51,13 @@ class DhcpRecordPageTest(WebCase, CommonTest):
         # Update data
         self.new_data['vrf_id'] = self.vrf.id
 
+    def test_new_next_ip(self):
+        # When creating a new record
+        self.getPage(url_for(self.base_url, 'new'))
+        # Then a button is available to get the next available IP
+        self.assertStatus(200)
+        self.assertInBody('data-next-ip-url="%s"' % url_for('subnet', 'next_ip.json'))
+
     def test_new_duplicate(self):
         # Given a database with a record
         obj = self.obj_cls(**self.new_data)
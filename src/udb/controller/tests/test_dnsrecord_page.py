@@ -99,6 +99,14 @@ class DnsRecordPageTest(WebCase, CommonTest):
         # Then the page get loaded with those value
         self.assertInBody('192.168.34.56')
 
+    def test_new_next_ip(self):
+        # When creating a new record
+        self.getPage(url_for(self.base_url, 'new'))
+        # Then a button is available to get the next available IP for A and AAAA records
+        self.assertStatus(200)
+        self.assertInBody('data-next-ip-url="%s"' % url_for('subnet', 'next_ip.json'))
+        self.assertInBody('data-next-ip-types=')
+
     def test_new_ptr_invalid(self):
         # Given an invalid PTR record.
         data = {'name': 'foo.example.com', 'type': 'PTR', 'value': 'bar.example.com'}
@@ -599,3 +607,15 @@ class DnsRecordPageTest(WebCase, CommonTest):
         self.assertStatus(303)
         dns.expire()
         self.assertEqual(dns.vrf_id, vrf2.id)
+
+    def test_api_list_domain(self):
+        # Given records in a zone and a sub zone
+        DnsZone(name='sub.example.com', subnets=[self.subnet]).add().commit()
+        DnsRecord(name='foo.sub.example.com', type='A', value='192.168.1.24').add().commit()
+        DnsRecord(name='sub.example.com', type='A', value='192.168.1.25').add().commit()
+        DnsRecord(name='bar.example.com', type='A', value='192.168.1.26').add().commit()
+        # When querying the records of a domain from API
+        data = self.getJson(url_for('api', self.base_url, domain='sub.example.com'), headers=self.authorization)
+        # Then only the records of the domain are returned sorted by name
+        self.assertStatus(200)
+        self.assertEqual(['sub.example.com', 'foo.sub.example.com'], [row['name'] for row in data])
@@ -18,7 +18,7 @@
 
 from udb.controller import url_for
 from udb.controller.tests import WebCase
-from udb.core.model import Deployment, DhcpRecord, Environment, Message, Subnet, Vrf
+from udb.core.model import Deployment, DhcpRecord, Environment, Message, Subnet, User, Vrf
 
 from .test_common_page import CommonTest
 
@@ -144,6 +144,34 @@ class EnvironmentPageTest(WebCase, CommonTest):
         deployment.expire()
         self.assertEqual(deployment.state, Deployment.STATE_SUCCESS)
 
+    def test_get_changes_json(self):
+        # Given an environment with pending changes made by different users
+        obj = self.obj_cls(**self.new_data).add()
+        obj.commit()
+        vrf = Vrf.query.first()
+        user = User.create(username='john', fullname='John Doe').commit()
+        for i in range(3):
+            DhcpRecord(ip='192.168.45.%s' % (70 + i), mac='E5:D3:56:7B:22:B%s' % i, vrf=vrf).add()
+        Message.session.commit()
+        record = DhcpRecord.query.filter(DhcpRecord.ip == '192.168.45.70').first()
+        record.add_message(Message(author=user, changes={'notes': ['', 'modified']}, type=Message.TYPE_DIRTY))
+        record.commit()
+        # When querying the pending changes
+        data = self.getJson(url_for(self.base_url, obj.id, 'changes.json'))
+        # Then each changes is summarized with it's author
+        self.assertStatus(200)
+        self.assertEqual(
+            [(row[1], row[2], row[3]) for row in data['data']],
+            [
+                ('192.168.45.67 (E5:D3:56:7B:22:A3)', 'dhcprecord', 'System'),
+                ('test-env', 'environment', 'System'),
+                ('192.168.45.70 (E5:D3:56:7B:22:B0)', 'dhcprecord', 'System'),
+                ('192.168.45.71 (E5:D3:56:7B:22:B1)', 'dhcprecord', 'System'),
+                ('192.168.45.72 (E5:D3:56:7B:22:B2)', 'dhcprecord', 'System'),
+                ('192.168.45.70 (E5:D3:56:7B:22:B0)', 'dhcprecord', 'John Doe'),
+            ],
+        )
+
     def test_get_data_json_with_changes(self):
         # Given an environment
         Environment(name='subnet_env', model_name='subnet').add().commit()
@@ -15,11 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from unittest.mock import ANY
+
 from parameterized import parameterized
 
 from udb.controller import url_for
 from udb.controller.tests import WebCase
-from udb.core.model import Rule
+from udb.core.model import Rule, Subnet, Vrf
 
 from .test_common_page import CommonTest
 
@@ -56,8 +58,126 @@ class RulePageTest(WebCase, CommonTest):
         # Then data is returned
         self.assertIsNotNone(data)
 
+    def test_advisor(self):
+        # When querying the index advisor
+        self.getPage(url_for('rule', 'advisor'))
+        # Then the page is displayed
+        self.assertStatus(200)
+        self.assertInBody('Index Advisor')
+
+    def test_advisor_json(self):
+        # Given a rule with a sequential scan
+        Rule(
+            name='test_value_rule',
+            model_name='dnsrecord',
+            statement="SELECT id, name FROM dnsrecord WHERE value = 'invalid'",
+            description='Invalid value',
+        ).add().commit()
+        # When querying the index advisor
+        data = self.getJson(url_for('rule', 'advisor.json'))
+        # Then tables with few records are ignored
+        self.assertEqual({'data': []}, data)
+
+    def test_conflicts(self):
+        # When querying the conflicts report
+        self.getPage(url_for('rule', 'conflicts'))
+        # Then the page is displayed
+        self.assertStatus(200)
+        self.assertInBody('Network Conflicts')
+
+    def test_conflicts_json(self):
+        # Given overlapping subnets in two VRFs
+        vrf1 = Vrf(name='vrf1').add()
+        vrf2 = Vrf(name='vrf2').add().flush()
+        subnet1 = Subnet(range='10.0.0.0/16', vrf=vrf1).add()
+        subnet2 = Subnet(range='10.0.0.0/24', vrf=vrf2).add().commit()
+        # When querying the conflicts
+        data = self.getJson(url_for('rule', 'conflicts.json'))
+        # Then the overlap is returned in both directions
+        self.assertEqual(
+            [
+                [
+                    'subnet_overlap',
+                    'subnet',
+                    '10.0.0.0/16',
+                    url_for('subnet', subnet1.id, 'edit'),
+                    'subnet',
+                    '10.0.0.0/24',
+                    url_for('subnet', subnet2.id, 'edit'),
+                ],
+                [
+                    'subnet_overlap',
+                    'subnet',
+                    '10.0.0.0/24',
+                    url_for('subnet', subnet2.id, 'edit'),
+                    'subnet',
+                    '10.0.0.0/16',
+                    url_for('subnet', subnet1.id, 'edit'),
+                ],
+            ],
+            data['data'],
+        )
+        # When filtering on another type of conflict
+        data = self.getJson(url_for('rule', 'conflicts.json', type='duplicate_ip'))
+        # Then nothing is returned
+        self.assertEqual([], data['data'])
+
+    def test_conflicts_json_invalid(self):
+        # When querying an invalid type of conflict
+        self.getPage(url_for('rule', 'conflicts.json', type='invalid'))
+        # Then an error is returned
+        self.assertStatus(400)
+
+    def test_api_conflicts(self):
+        # Given overlapping subnets in two VRFs
+        vrf1 = Vrf(name='vrf1').add()
+        vrf2 = Vrf(name='vrf2').add().flush()
+        subnet1 = Subnet(range='10.0.0.0/16', vrf=vrf1).add()
+        subnet2 = Subnet(range='10.0.0.0/24', vrf=vrf2).add().commit()
+        # When querying the conflicts from API
+        data = self.getJson(url_for('api', 'conflict'), headers=self.authorization)
+        # Then conflicts are returned
+        self.assertStatus(200)
+        self.assertIn(
+            {
+                'type': 'subnet_overlap',
+                'model_name': 'subnet',
+                'model_id': subnet1.id,
+                'name': '10.0.0.0/16',
+                'other_model_name': 'subnet',
+                'other_id': subnet2.id,
+                'other_name': '10.0.0.0/24',
+            },
+            data,
+        )
+        # When querying an invalid type
+        self.getPage(url_for('api', 'conflict', type='invalid'), headers=self.authorization)
+        # Then an error is returned
+        self.assertStatus(400)
+
 
 class BuiltinRuleTest(WebCase):
+    def test_linter_json(self):
+        # Given a database with records infringing builtin rules
+        self.add_records()
+        # Given rules evaluated in background
+        self.wait_for_tasks()
+        # When querying the linter results
+        data = self.getJson(url_for('rule', 'linter.json'))
+        # Then the violations are returned with the evaluation date
+        self.assertIsNotNone(data['date'])
+        self.assertIn(
+            [
+                'You cannot define other record type when an alias for a canonical name (CNAME) is defined.',
+                ANY,
+                Rule.SEVERITY_ENFORCED,
+                'dnsrecord',
+                'bar.bfh.ch = www.bar.bfh.ch (CNAME)',
+                ANY,
+            ],
+            data['data'],
+        )
+
     def test_edit_check_constraint(self):
         # Given a database with check constraint rule
         rule = Rule.query.filter(Rule.name == 'dhcp_start_end_not_null').one()
@@ -1048,3 +1048,142 @@ class SubnetPageTest(WebCase, CommonTest):
                 ],
             ],
         )
+
+    def test_list_subtree(self):
+        # Given a hierarchy of subnets
+        subnet1 = Subnet(range='192.168.0.0/16', vrf=self.vrf).add().flush()
+        subnet2 = Subnet(range='192.168.1.0/24', vrf=self.vrf).add().flush()
+        subnet3 = Subnet(range='192.168.1.128/30', vrf=self.vrf).add().flush()
+        Subnet(range='10.0.0.0/8', vrf=self.vrf).add().commit()
+        # When browsing the subtree of a subnet
+        self.getPage(url_for(self.base_url, '', subtree=subnet2.id))
+        # Then the filter is displayed
+        self.assertStatus(200)
+        self.assertInBody('Subtree of 192.168.1.0/24')
+        self.assertInBody('data.json?subtree=%s' % subnet2.id)
+        # When querying the subtree data
+        data = self.getJson(url_for(self.base_url, 'data.json', subtree=subnet2.id))
+        # Then only the subnet and it's children are returned
+        self.assertEqual([subnet2.id, subnet3.id], [row[0] for row in data['data']])
+        data = self.getJson(url_for(self.base_url, 'data.json', subtree=subnet1.id))
+        self.assertEqual([subnet1.id, subnet2.id, subnet3.id], [row[0] for row in data['data']])
+
+    def test_list_subtree_invalid(self):
+        # When browsing the subtree of an invalid subnet
+        self.getPage(url_for(self.base_url, '', subtree='invalid'))
+        # Then an error is returned
+        self.assertStatus(400)
+        # When browsing the subtree of an unknown subnet
+        self.getPage(url_for(self.base_url, '', subtree=999))
+        # Then an error is returned
+        self.assertStatus(404)
+
+    def test_edit_subtree_link(self):
+        # Given a subnet
+        subnet = Subnet(range='192.168.0.0/16', vrf=self.vrf).add().commit()
+        # When editing the subnet
+        self.getPage(url_for(subnet, 'edit'))
+        # Then a link to the subtree is displayed
+        self.assertInBody(url_for(self.base_url, '', subtree=subnet.id))
+
+    def test_api_list_subtree(self):
+        # Given a hierarchy of subnets
+        Subnet(range='192.168.0.0/16', vrf=self.vrf).add().flush()
+        subnet2 = Subnet(range='192.168.1.0/24', vrf=self.vrf).add().flush()
+        subnet3 = Subnet(range='192.168.1.128/30', vrf=self.vrf).add().commit()
+        # When querying the subtree from API
+        data = self.getJson(url_for('api', self.base_url, subtree=subnet2.id), headers=self.authorization)
+        # Then only the subnet and it's children are returned
+        self.assertStatus(200)
+        self.assertEqual([subnet2.id, subnet3.id], sorted(row['id'] for row in data))
+
+    def test_tree(self):
+        # Given a hierarchy of subnets with a secondary range
+        subnet1 = Subnet(range='192.168.0.0/16', vrf=self.vrf, slave_subnets=[Subnet(range='10.0.0.0/8')]).add().flush()
+        subnet2 = Subnet(range='192.168.1.0/24', vrf=self.vrf).add().flush()
+        subnet3 = Subnet(range='10.1.0.0/16', vrf=self.vrf).add().flush()
+        subnet4 = Subnet(range='10.1.1.0/24', vrf=self.vrf).add().flush()
+        subnet5 = Subnet(range='2001:db8::/32', vrf=self.vrf).add().commit()
+        # When querying the top level of the tree
+        data = self.getJson(url_for(self.base_url, 'tree.json'))
+        # Then only top level subnets are returned with the number of children
+        self.assertEqual([subnet5.id, subnet1.id], [row[0] for row in data['data']])
+        self.assertEqual([0, 2], [row[-2] for row in data['data']])
+        self.assertEqual([None, '10.0.0.0/8'], [row[5] for row in data['data']])
+        self.assertEqual(
+            ['/subnet/%s/edit' % subnet5.id, '/subnet/%s/edit' % subnet1.id], [row[-1] for row in data['data']]
+        )
+        # When querying children of a subnet
+        children = self.getJson(url_for(self.base_url, 'tree.json', parent=subnet1.id))
+        # Then children of the subnet and of it's secondary ranges are returned
+        self.assertEqual([subnet3.id, subnet2.id], [row[0] for row in children['data']])
+        self.assertEqual([1, 0], [row[-2] for row in children['data']])
+        # When querying the next level
+        data = self.getJson(url_for(self.base_url, 'tree.json', parent=subnet3.id))
+        self.assertEqual([subnet4.id], [row[0] for row in data['data']])
+        # Then rows of every levels are sorted like the subnet list.
+        rows = self.getJson(url_for(self.base_url, 'data.json'))['data']
+        tree = self.getJson(url_for(self.base_url, 'tree.json'))['data'] + children['data'] + data['data']
+        self.assertEqual([row[0] for row in rows], [row[0] for row in sorted(tree, key=lambda row: row[2])])
+
+    def test_tree_invalid(self):
+        # When querying children of an invalid parent
+        self.getPage(url_for(self.base_url, 'tree.json', parent='invalid'))
+        # Then an error is returned
+        self.assertStatus(400)
+
+    def test_tree_view(self):
+        # When browsing the tree view
+        self.getPage(url_for(self.base_url, '', tree=1))
+        # Then data are loaded from the tree
+        self.assertStatus(200)
+        self.assertInBody('/subnet/tree.json')
+        self.assertInBody('List view')
+
+    def test_api_free(self):
+        # Given a subnet with a secondary range and a child subnet
+        subnet = Subnet(range='192.168.0.0/24', vrf=self.vrf, slave_subnets=[Subnet(range='10.0.0.0/30')]).add().flush()
+        Subnet(range='192.168.0.0/25', vrf=self.vrf).add().commit()
+        # When querying the free space from API
+        data = self.getJson(url_for('api', self.base_url, subnet.id, 'free', prefixlen=26), headers=self.authorization)
+        # Then free space of each range is returned
+        self.assertStatus(200)
+        self.assertEqual(subnet.id, data['id'])
+        self.assertEqual(['192.168.0.0/24', '10.0.0.0/30'], [r['range'] for r in data['ranges']])
+        self.assertEqual(['192.168.0.128/25'], data['ranges'][0]['free_blocks'])
+        self.assertEqual('192.168.0.128', data['ranges'][0]['next_ip'])
+        self.assertEqual('192.168.0.128/26', data['ranges'][0]['next_subnet'])
+        self.assertEqual(50.0, data['ranges'][0]['utilization'])
+        self.assertEqual('10.0.0.1', data['ranges'][1]['next_ip'])
+        self.assertIsNone(data['ranges'][1]['next_subnet'])
+
+    def test_api_free_invalid(self):
+        # Given a subnet
+        subnet = Subnet(range='192.168.0.0/24', vrf=self.vrf).add().commit()
+        # When querying an invalid prefix length
+        self.getPage(url_for('api', self.base_url, subnet.id, 'free', prefixlen='a'), headers=self.authorization)
+        # Then an error is returned
+        self.assertStatus(400)
+        # When querying an unknown action
+        self.getPage(url_for('api', self.base_url, subnet.id, 'unknown'), headers=self.authorization)
+        # Then an error is returned
+        self.assertStatus(404)
+
+    def test_next_ip(self):
+        # Given a subnet with a DHCP reservation
+        subnet = Subnet(range='192.168.0.0/24', vrf=self.vrf).add().flush()
+        DhcpRecord(ip='192.168.0.1', mac='00:00:5e:00:53:01', vrf=self.vrf).add().commit()
+        # When querying the next available IP
+        data = self.getJson(url_for(self.base_url, 'next_ip.json', value='192.168.0.0/24', vrf_id=self.vrf.id))
+        # Then the next available address is returned
+        self.assertEqual(
+            {'ip': '192.168.0.2', 'subnet_id': subnet.id, 'range': '192.168.0.0/24', 'vrf_id': self.vrf.id}, data
+        )
+        # When querying an address outside any subnet
+        self.getPage(url_for(self.base_url, 'next_ip.json', value='10.0.0.0/24'))
+        # Then an error is returned
+        self.assertStatus(404)
+        # When querying an invalid value
+        self.getPage(url_for(self.base_url, 'next_ip.json', value='invalid'))
+        # Then an error is returned
+        self.assertStatus(400)
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Plugin to execute deployment scripts.
+
+Deployments are supervised by an asyncio event loop running in a dedicated
+thread. Deployments of the same environment are executed one by one while
+deployments of different environments are executed in parallel.
+'''
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cherrypy
+from cherrypy.process.plugins import SimplePlugin
+from sqlalchemy import update
+
+from udb.core.model import Deployment, DnsZone
+
+logger = logging.getLogger(__name__)
+
+# Maximum length of a line of output.
+LINE_LIMIT = 65536
+
+
+def _db_task(func):
+    """
+    Wrapper used to execute database operation in a worker thread and release
+    the database session once completed.
+    """
+
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            cherrypy.tools.db.on_end_resource()
+
+    return wrapper
+
+
+def _chown(path, user):
+    """
+    Change ownership of `path` to the given user when running as root.
+    """
+    if user is not None:
+        os.chown(path, user, user)
+
+
+@_db_task
+def _start_deployment(deployment_id, base_url, working_dir, env, user=None):
+    """
+    Mark the deployment as running and write the deployment data into the working directory.
+
+    Return the script with the environment variables to be used.
+    """
+    deployment = Deployment.query.filter(Deployment.id == deployment_id).one()
+    deployment.state = Deployment.STATE_RUNNING
+    deployment.commit()
+    _chown(working_dir, user)
+    # Write deployment data.
+    data_file = os.path.join(working_dir, 'data.json')
+    with open(data_file, 'w', encoding='utf-8') as f:
+        json.dump(deployment.data, f)
+    _chown(data_file, user)
+    environ = {
+        "UDB_USERID": str(deployment.owner.id),
+        "UDB_USERNAME": deployment.owner.username,
+        "UDB_DEPLOYMENT_ID": str(deployment.id),
+        "UDB_DEPLOYMENT_TOKEN": deployment.token,
+        "UDB_DEPLOYMENT_AUTH": "%s:%s" % (deployment.owner.username, deployment.token),
+        "UDB_DEPLOYMENT_MODEL_NAME": deployment.environment.model_name,
+        "UDB_DEPLOYMENT_DATA_URL": cherrypy.url("api/deployment/%s" % deployment.id, base=base_url),
+        "UDB_DEPLOYMENT_DATA_FILE": data_file,
+    }
+    # Write a zone file for each DNS Zone.
+    if 'dnsrecord' in deployment.data and env is not None:
+        zones_dir = os.path.join(working_dir, 'zones')
+        os.mkdir(zones_dir)
+        _chown(zones_dir, user)
+        tmpl = env.get_template('dnszone/zone.j2')
+        zones = DnsZone.query.with_entities(DnsZone.name).filter(DnsZone.estatus == DnsZone.STATUS_ENABLED).all()
+        partitions = deployment.partition_zone_records([name for (name,) in zones])
+        for name, dnsrecords in partitions.items():
+            zone_file = os.path.join(zones_dir, name + '.zone')
+            with open(zone_file, 'w', encoding='utf-8') as f:
+                f.write(tmpl.render(dnsrecords=dnsrecords))
+            _chown(zone_file, user)
+        environ["UDB_DEPLOYMENT_ZONES_DIR"] = zones_dir
+    # Write script using "newline" instead of "cariage return"
+    script = deployment.environment.script.replace('\r\n', '\n').encode('utf8')
+    return script, environ, deployment.token
+
+
+@_db_task
+def _append_output(deployment_id, output, state=None):
+    """
+    Append output to the deployment. Make use of a plain UPDATE statement to
+    avoid loading the complete output in memory.
+    """
+    values = {'output': Deployment.output + output}
+    if state is not None:
+        values['state'] = state
+    Deployment.session.execute(update(Deployment).where(Deployment.id == deployment_id).values(**values))
+    Deployment.session.commit()
+
+
+async def _readline(stream):
+    """
+    Read a line from the given stream. Line longer then the stream limit get split.
+    """
+    try:
+        return await stream.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        return await stream.readexactly(e.consumed)
+
+
+class _OutputWriter:
+    """
+    Write the output of a deployment to database. While a write operation is
+    in progress, output get accumulated to be written in a single operation.
+    """
+
+    def __init__(self, executor, deployment_id, token):
+        self._executor = executor
+        self._deployment_id = deployment_id
+        self._token = token
+        self._buffer = []
+        self._future = None
+
+    def write(self, data):
+        # Obfuscate deployment token
+        self._buffer.append(data.replace(self._token, '********'))
+        if self._future is None or self._future.done():
+            self._flush()
+
+    def _flush(self):
+        if self._future is not None:
+            # Raise exception of previous write operation.
+            self._future.result()
+        output = ''.join(self._buffer)
+        self._buffer = []
+        self._future = asyncio.get_running_loop().run_in_executor(
+            self._executor, _append_output, self._deployment_id, output
+        )
+
+    async def close(self, data, state):
+        """
+        Write remaining output with the final state of the deployment.
+        """
+        if self._future is not None:
+            try:
+                await self._future
+            except Exception:
+                logger.warning('fail to write output of deployment %s', self._deployment_id, exc_info=1)
+        output = ''.join(self._buffer) + data.replace(self._token, '********')
+        self._buffer = []
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, _append_output, self._deployment_id, output, state
+        )
+
+
+class DeploymentPlugin(SimplePlugin):
+    """
+    Plugin to execute deployments concurrently.
+    """
+
+    # Maximum number of deployments running at the same time.
+    max_concurrency = 4
+    # Maximum execution time of a deployment in seconds. Zero to disable.
+    timeout = 3600
+    # Jinja2 environment used to generate the zone files.
+    env = None
+
+    def __init__(self, bus):
+        super().__init__(bus)
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._running = set()
+
+    def start(self):
+        self.bus.log('Start Deployment plugins')
+        # Database operations are executed in a single thread to avoid write contention.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deployment-db')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='deployment', daemon=True)
+        self._thread.start()
+        self._locks = {}
+        self._semaphore = None
+        self._tasks = set()
+        self.bus.subscribe('schedule_deployment', self.schedule_deployment)
+
+    def stop(self):
+        self.bus.log('Stop Deployment plugins')
+        self.bus.unsubscribe('schedule_deployment', self.schedule_deployment)
+        if self._loop is None:
+            return
+        # Interrupt running deployments.
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result(timeout=30)
+        except Exception:
+            logger.warning('fail to interrupt running deployments', exc_info=1)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=True)
+        self._loop = self._thread = self._executor = None
+        self._running.clear()
+
+    def is_running(self):
+        """
+        Return list of deployments scheduled or running.
+        """
+        return list(self._running)
+
+    def schedule_deployment(self, deployment_id, environment_id, base_url):
+        """
+        Schedule execution of the given deployment.
+        """
+        assert self._loop is not None, 'deployment plugin is not started'
+        future = asyncio.run_coroutine_threadsafe(self._run(deployment_id, environment_id, base_url), self._loop)
+        self._running.add(future)
+        future.add_done_callback(self._running.discard)
+        return future
+
+    async def _cancel_all(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, deployment_id, environment_id, base_url):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            # Create synchronisation primitives within the event loop.
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(max(1, int(self.max_concurrency)))
+            lock = self._locks.setdefault(environment_id, asyncio.Lock())
+            # Execute deployments of the same environment one by one.
+            async with lock:
+                async with self._semaphore:
+                    await self._deploy(deployment_id, base_url)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('fail to execute deployment %s', deployment_id)
+        finally:
+            self._tasks.discard(task)
+
+    async def _deploy(self, deployment_id, base_url):
+        """
+        Execute the deployment script and supervise it's execution.
+        """
+        loop = asyncio.get_running_loop()
+        # Switch permissions to nobody when running as root on Python>=3.9
+        kwargs = {}
+        if sys.version_info[0:2] >= (3, 9) and os.getuid() == 0:
+            kwargs = {'user': 65534, 'group': 65534}
+        # Create a temporary folder
+        working_dir = tempfile.mkdtemp(prefix='udb-deployment-%s-' % deployment_id)
+        try:
+            script, env, token = await loop.run_in_executor(
+                self._executor, _start_deployment, deployment_id, base_url, working_dir, self.env, kwargs.get('user')
+            )
+        except Exception as e:
+            shutil.rmtree(working_dir, ignore_errors=True)
+            await loop.run_in_executor(
+                self._executor, _append_output, deployment_id, str(e) + '\nFAILED', Deployment.STATE_FAILURE
+            )
+            return
+        writer = _OutputWriter(self._executor, deployment_id, token)
+        process = None
+        try:
+            # Start the process with bash in a new process group.
+            process = await asyncio.create_subprocess_exec(
+                '/bin/bash',
+                env=env,
+                cwd=working_dir,
+                start_new_session=True,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                limit=LINE_LIMIT,
+                **kwargs
+            )
+            process.stdin.write(script)
+            process.stdin.close()
+            try:
+                await asyncio.wait_for(self._communicate(process, writer), timeout=self.timeout or None)
+            except asyncio.TimeoutError:
+                self._kill(process)
+                await process.wait()
+                await writer.close('\ntimeout after %s seconds\nFAILED' % self.timeout, Deployment.STATE_FAILURE)
+                return
+            if process.returncode != 0:
+                await writer.close(
+                    '\nreturn code: %s\nFAILED' % process.returncode,
+                    Deployment.STATE_FAILURE,
+                )
+            else:
+                await writer.close('\nSUCCESS', Deployment.STATE_SUCCESS)
+        except asyncio.CancelledError:
+            if process is not None and process.returncode is None:
+                self._kill(process)
+                await process.wait()
+            await writer.close('\ninterrupted\nFAILED', Deployment.STATE_FAILURE)
+            raise
+        except Exception as e:
+            await writer.close('\n' + str(e) + '\nFAILED', Deployment.STATE_FAILURE)
+        finally:
+            # Delete temporary folder
+            shutil.rmtree(working_dir, ignore_errors=True)
+
+    async def _communicate(self, process, writer):
+        """
+        Read output of process until it exit.
+        """
+        while True:
+            line = await _readline(process.stdout)
+            if not line:
+                break
+            writer.write(line.decode('utf-8', errors='replace'))
+        await process.wait()
+
+    def _kill(self, process):
+        """
+        Kill the process and all of it's children.
+        """
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+# Register Deployment plugin
+cherrypy.deployment = DeploymentPlugin(cherrypy.engine)
+cherrypy.deployment.subscribe()
+
+cherrypy.config.namespaces['deployment'] = lambda key, value: setattr(cherrypy.deployment, key, value)
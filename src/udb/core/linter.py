@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Plugin to evaluate the linter rules in background.
+
+Rules related to modified data are evaluated after each commit. Every rules
+get evaluated once a day.
+'''
+import threading
+
+import cherrypy
+from cherrypy.process.plugins import SimplePlugin
+from sqlalchemy.event import listen, remove
+
+from udb.core.model import Message, Rule
+
+Session = cherrypy.tools.db.get_session()
+
+
+class LinterPlugin(SimplePlugin):
+    # Time of day when every rules get evaluated.
+    refresh_time = '02:00'
+    # Maximum execution time of a rule in seconds. Zero to disable.
+    timeout = 30
+    # Number of consecutive failures before a rule get disabled. Zero to disable.
+    max_failures = 3
+    # Number of rules evaluated concurrently. Not used with SQLite.
+    workers = 4
+
+    _lock = threading.Lock()
+
+    def start(self):
+        self.bus.log('Start Linter plugins')
+        self._pending = False
+        listen(Session, "after_flush", self._after_flush)
+        listen(Session, "after_commit", self._after_commit)
+        listen(Session, "after_rollback", self._after_rollback)
+        self.bus.subscribe('refresh_linter', self.refresh_linter)
+        self.bus.publish('schedule_job', self.refresh_time, self._full_refresh_task)
+
+    def stop(self):
+        self.bus.log('Stop Linter plugins')
+        remove(Session, "after_flush", self._after_flush)
+        remove(Session, "after_commit", self._after_commit)
+        remove(Session, "after_rollback", self._after_rollback)
+        self.bus.unsubscribe('refresh_linter', self.refresh_linter)
+        self.bus.publish('unschedule_job', self._full_refresh_task)
+
+    def _after_flush(self, session, flush_context):
+        """
+        Keep track if this database session modified any data.
+        """
+        if any(isinstance(obj, Message) and obj.type != Message.TYPE_COMMENT for obj in session.new):
+            session.info['linter'] = True
+
+    def _after_commit(self, session):
+        """
+        On commit, trigger a background task to evaluate the rules related to modified data.
+        """
+        if session.info.pop('linter', False):
+            self.refresh_linter()
+
+    def _after_rollback(self, session):
+        session.info.pop('linter', None)
+
+    def refresh_linter(self):
+        """
+        Schedule evaluation of the rules unless a task is already pending.
+        """
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        self.bus.publish('schedule_task', self._refresh_task)
+
+    def _refresh_task(self):
+        with self._lock:
+            self._pending = False
+        Rule.refresh_violations(timeout=self.timeout, max_failures=self.max_failures, workers=self.workers)
+
+    def _full_refresh_task(self):
+        Rule.refresh_violations(full=True, timeout=self.timeout, max_failures=self.max_failures, workers=self.workers)
+
+
+cherrypy.linter = LinterPlugin(cherrypy.engine)
+cherrypy.linter.subscribe()
+
+cherrypy.config.namespaces['linter'] = lambda key, value: setattr(cherrypy.linter, key, value)
@@ -22,15 +22,17 @@ from . import _bool_or  # noqa
 from . import _format  # noqa
 from . import _group_concat  # noqa
 from . import _least  # noqa
+from ._conflict import Conflict, find_conflicts  # noqa
 from ._deployment import Deployment, Environment  # noqa
 from ._dhcprecord import DhcpRecord  # noqa
 from ._dnsrecord import DnsRecord  # noqa
 from ._dnszone import DnsZone, dnszone_subnet  # noqa
 from ._follower import Follower  # noqa
 from ._ip import Ip  # noqa
+from ._ip_space import IpSpace  # noqa
 from ._mac import Mac  # noqa
 from ._message import Message  # noqa
-from ._rule import Rule, RuleError  # noqa
+from ._rule import Rule, RuleAdvice, RuleError, rule_violation  # noqa
 from ._subnet import Subnet  # noqa
 from ._user import User  # noqa
 from ._vrf import Vrf  # noqa
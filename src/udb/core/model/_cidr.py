@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import ipaddress
+from functools import lru_cache
 
 from sqlalchemy import Boolean, String, TypeDecorator, event, func
 from sqlalchemy.dialects.postgresql import CIDR, INET
@@ -22,11 +23,8 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.functions import GenericFunction
 
-
-def _bytes_to_ip_network(value):
-    if value[1] == 6:
-        return ipaddress.ip_network(value[2:18]).supernet(new_prefix=int.from_bytes(value[18:], "big"))
-    return ipaddress.ip_network(value[2:6]).supernet(new_prefix=int.from_bytes(value[6:], "big"))
+# Maximum number of values kept in cache by encoding and decoding functions.
+CACHE_SIZE = 65536
 
 
 def _ip_network_to_bytes(value):
@@ -47,6 +45,108 @@ def _ip_network_to_bytes(value):
     )
 
 
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_network(value, strict=True):
+    """
+    Encode the given network string into bytes.
+    """
+    return _ip_network_to_bytes(ipaddress.ip_network(value, strict=strict))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_address(value):
+    """
+    Encode the given IP address string into bytes.
+    """
+    return _ip_network_to_bytes(ipaddress.ip_address(value))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _decode(value):
+    """
+    Decode bytes made of 2-byte family, packed address and 2-byte prefix length.
+    Return tuple (version, address, prefixlen, max_prefixlen) with the address as integer.
+    """
+    version = value[1]
+    max_prefixlen = 128 if version == 6 else 32
+    size = max_prefixlen >> 3
+    hostbits = max_prefixlen - int.from_bytes(value[2 + size :], 'big')
+    # Clear host bits like ip_network().supernet()
+    address = (int.from_bytes(value[2 : 2 + size], 'big') >> hostbits) << hostbits
+    return 6 if version == 6 else 4, address, max_prefixlen - hostbits, max_prefixlen
+
+
+def _encode(version, address, prefixlen):
+    return b'%s%s%s' % (
+        version.to_bytes(2, byteorder='big'),
+        address.to_bytes(16 if version == 6 else 4, byteorder='big'),
+        prefixlen.to_bytes(2, byteorder='big'),
+    )
+
+
+def _format_address(version, address):
+    if version == 4:
+        return '%d.%d.%d.%d' % (address >> 24, (address >> 16) & 0xFF, (address >> 8) & 0xFF, address & 0xFF)
+    # Compressed notation of IPv6 is delegated to ipaddress. Result is cached by callers.
+    return ipaddress.IPv6Address(address).compressed
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_host(value):
+    """
+    Return host value of encoded network: 192.168.1.0
+    """
+    version, address, prefixlen, max_prefixlen = _decode(value)
+    return _format_address(version, address)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_network(value):
+    """
+    Return text value of encoded network: 192.168.1.0/24
+    """
+    version, address, prefixlen, max_prefixlen = _decode(value)
+    return '%s/%s' % (_format_address(version, address), prefixlen)
+
+
+def _contains(value, other, strict):
+    """
+    Return True if `other` network contains `value` network.
+    """
+    version, address, prefixlen, max_prefixlen = _decode(value)
+    other_version, other_address, other_prefixlen, unused = _decode(other)
+    if version != other_version or other_prefixlen > prefixlen or (strict and other_prefixlen == prefixlen):
+        return False
+    hostbits = max_prefixlen - other_prefixlen
+    return (address >> hostbits) == (other_address >> hostbits)
+
+
+def to_interval(value):
+    """
+    Return (version, first, last) addresses as integer of a network or an IP
+    address. Accept the encoded bytes stored in SQLite or any value accepted by
+    ip_network() as returned by PostgreSQL. Results are not cached to support
+    bulk conversion.
+    """
+    if isinstance(value, bytes):
+        version, address, prefixlen, max_prefixlen = _decode.__wrapped__(value)
+        return version, address, address | ((1 << (max_prefixlen - prefixlen)) - 1)
+    network = ipaddress.ip_network(value, strict=False)
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+def to_text(value, host=True):
+    """
+    Return the text value of a raw network or IP address.
+    """
+    if isinstance(value, bytes):
+        version, address, prefixlen, max_prefixlen = _decode.__wrapped__(value)
+        if host:
+            return _format_address(version, address)
+        return '%s/%s' % (_format_address(version, address), prefixlen)
+    return str(value)
+
+
 def _sqlite_inet(value):
     """
     Convert value into exploded ip_address.
@@ -55,7 +155,7 @@ def _sqlite_inet(value):
         return None
     if isinstance(value, bytes):
         return value
-    return _ip_network_to_bytes(ipaddress.ip_network(value, strict=False))
+    return _parse_network(value, strict=False)
 
 
 def _sqlite_host(value):
@@ -64,11 +164,9 @@ def _sqlite_host(value):
     """
     if value is None:
         return None
-    if isinstance(value, bytes):
-        n = _bytes_to_ip_network(value)
-    else:
-        n = ipaddress.ip_network(value, strict=False)
-    return n.network_address.compressed
+    if not isinstance(value, bytes):
+        value = _parse_network(value, strict=False)
+    return _format_host(value)
 
 
 def _sqlite_text(value):
@@ -77,11 +175,15 @@ def _sqlite_text(value):
     """
     if value is None:
         return None
-    if isinstance(value, bytes):
-        n = _bytes_to_ip_network(value)
-    else:
-        n = ipaddress.ip_network(value, strict=False)
-    return n.compressed
+    if not isinstance(value, bytes):
+        value = _parse_network(value, strict=False)
+    return _format_network(value)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _broadcast(value):
+    version, address, prefixlen, max_prefixlen = _decode(value)
+    return _encode(version, address | ((1 << (max_prefixlen - prefixlen)) - 1), max_prefixlen)
 
 
 def _sqlite_broadcast(value):
@@ -90,11 +192,9 @@ def _sqlite_broadcast(value):
     """
     if value is None:
         return None
-    if isinstance(value, bytes):
-        n = _bytes_to_ip_network(value)
-    else:
-        n = ipaddress.ip_network(value)
-    return _ip_network_to_bytes(n.broadcast_address)
+    if not isinstance(value, bytes):
+        value = _parse_network(value)
+    return _broadcast(value)
 
 
 def _sqlite_family(value):
@@ -103,9 +203,9 @@ def _sqlite_family(value):
     """
     if value is None:
         return None
-    if isinstance(value, bytes):
-        return value[1]
-    return ipaddress.ip_network(value, strict=False).version
+    if not isinstance(value, bytes):
+        value = _parse_network(value, strict=False)
+    return value[1]
 
 
 def _sqlite_masklen(value):
@@ -114,11 +214,9 @@ def _sqlite_masklen(value):
     """
     if value is None:
         return None
-    if isinstance(value, bytes):
-        n = _bytes_to_ip_network(value)
-    else:
-        n = ipaddress.ip_network(value)
-    return n.prefixlen
+    if not isinstance(value, bytes):
+        value = _parse_network(value)
+    return _decode(value)[2]
 
 
 def _sqlite_subnet_of(value, other):
@@ -127,9 +225,11 @@ def _sqlite_subnet_of(value, other):
     """
     if value is None or other is None:
         return False
-    n = _bytes_to_ip_network(value) if isinstance(value, bytes) else ipaddress.ip_network(value)
-    o = _bytes_to_ip_network(other) if isinstance(other, bytes) else ipaddress.ip_network(other)
-    return n.version == o.version and n != o and n.subnet_of(o)
+    if not isinstance(value, bytes):
+        value = _parse_network(value)
+    if not isinstance(other, bytes):
+        other = _parse_network(other)
+    return _contains(value, other, strict=True)
 
 
 def _sqlite_subnet_of_or_equals(value, other):
@@ -138,9 +238,11 @@ def _sqlite_subnet_of_or_equals(value, other):
     """
     if value is None or other is None:
         return False
-    n = _bytes_to_ip_network(value) if isinstance(value, bytes) else ipaddress.ip_network(value)
-    o = _bytes_to_ip_network(other) if isinstance(other, bytes) else ipaddress.ip_network(other)
-    return n.version == o.version and n.subnet_of(o)
+    if not isinstance(value, bytes):
+        value = _parse_network(value)
+    if not isinstance(other, bytes):
+        other = _parse_network(other)
+    return _contains(value, other, strict=False)
 
 
 class subnet_of(GenericFunction):
@@ -173,6 +275,57 @@ def _render_subnet_of_or_equals_postgresql(element, compiler, **kw):
     return "%s <<= %s" % (compiler.process(left, **kw), compiler.process(right, **kw))
 
 
+class supernet_of(GenericFunction):
+    """
+    supernet_of(range, first, last, value, value_first, value_last) return True
+    if the network `range` strictly contains `value`.
+    """
+
+    type = Boolean
+    name = "supernet_of"
+    inherit_cache = True
+
+
+class supernet_of_or_equals(GenericFunction):
+    """
+    supernet_of_or_equals(range, first, last, value, value_first, value_last)
+    return True if the network `range` contains or equals `value`.
+    """
+
+    type = Boolean
+    name = "supernet_of_or_equals"
+    inherit_cache = True
+
+
+@compiles(supernet_of)
+@compiles(supernet_of_or_equals)
+def _render_supernet_of(element, compiler, **kw):
+    """
+    By default, compare the first and last address of both networks to make use of B-tree index.
+    """
+    clauses = list(element.clauses)
+    # Parameters must be rendered in order of appearance.
+    first, last, value_first, value_last = [
+        (lambda c=c: compiler.process(c, **kw)) for c in (clauses[1], clauses[2], clauses[4], clauses[5])
+    ]
+    sql = "%s <= %s AND %s >= %s" % (first(), value_first(), last(), value_last())
+    if isinstance(element, supernet_of):
+        sql += " AND NOT (%s = %s AND %s = %s)" % (first(), value_first(), last(), value_last())
+    return "(%s)" % sql
+
+
+@compiles(supernet_of, "postgresql")
+@compiles(supernet_of_or_equals, "postgresql")
+def _render_supernet_of_postgresql(element, compiler, **kw):
+    """
+    On Postgresql, `supernet_of` is implemented with operator '>>' and
+    `supernet_of_or_equals` with '>>=' to make use of GiST index.
+    """
+    clauses = list(element.clauses)
+    op = '>>' if isinstance(element, supernet_of) else '>>='
+    return "%s %s %s" % (compiler.process(clauses[0], **kw), op, compiler.process(clauses[3], **kw))
+
+
 @event.listens_for(Engine, "connect")
 def _register_sqlite_cidr_functions(dbapi_con, unused):
     """
@@ -212,8 +365,7 @@ class CidrType(TypeDecorator):
         # SQlite convert to bytes
         if isinstance(value, bytes):
             return value
-        n = ipaddress.ip_network(value)
-        return _ip_network_to_bytes(n)
+        return _parse_network(value)
 
     def process_result_value(self, value, dialect):
         if value is None or value == '':
@@ -221,7 +373,7 @@ class CidrType(TypeDecorator):
         if dialect.name == "postgresql":
             return value
         # SQlite convert from bytes
-        return _bytes_to_ip_network(value).compressed
+        return _format_network(value)
 
     class comparator_factory(String.Comparator):
         def host(self):
@@ -262,8 +414,7 @@ class InetType(TypeDecorator):
         # SQlite convert to bytes
         if isinstance(value, bytes):
             return value
-        n = ipaddress.ip_address(value)
-        return _ip_network_to_bytes(n)
+        return _parse_address(value)
 
     def process_result_value(self, value, dialect):
         if value is None or value == '':
@@ -271,7 +422,7 @@ class InetType(TypeDecorator):
         if dialect.name == "postgresql":
             return value
         # SQlite convert from bytes
-        return _bytes_to_ip_network(value).network_address.compressed
+        return _format_host(value)
 
     class comparator_factory(String.Comparator):
         def host(self):
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Network-wide analysis of overlapping ranges and conflicting addresses.
+
+Ranges and addresses are loaded as integer intervals (first, last) and sorted
+once. Overlapping intervals are found with a single sweep over the sorted list,
+so the cost grows with the number of objects and the number of conflicts found
+instead of the number of pairs. Raw values are read from the database and
+decoded directly into integers without the conversion into text.
+'''
+import heapq
+from collections import namedtuple
+
+from sqlalchemy import select, type_coerce
+from sqlalchemy.types import NullType
+
+from udb.tools.i18n import gettext_lazy as _
+
+from ._cidr import to_interval, to_text
+from ._dhcprecord import DhcpRecord
+from ._dnsrecord import DnsRecord
+from ._ip import Ip
+from ._rule import RuleAnalysis
+from ._subnet import Subnet
+
+Conflict = namedtuple(
+    'Conflict',
+    ['type', 'model_name', 'model_id', 'name', 'other_model_name', 'other_id', 'other_name'],
+)
+
+TYPE_SUBNET_OVERLAP = 'subnet_overlap'
+TYPE_DHCP_POOL = 'dhcp_pool'
+TYPE_DUPLICATE_IP = 'duplicate_ip'
+
+
+def sweep_overlaps(intervals):
+    """
+    Find every pair of overlapping intervals. `intervals` is a list of
+    (group, first, last, key). Only intervals of the same group are compared.
+
+    Return a list of (key, other_key) pairs where `key` starts first.
+    """
+    pairs = []
+    # Intervals still open at the current position as (last, idx, key).
+    active = []
+    group = None
+    for idx, (i_group, first, last, key) in enumerate(sorted(intervals, key=lambda i: (i[0], i[1], -i[2]))):
+        if i_group != group:
+            active = []
+            group = i_group
+        while active and active[0][0] < first:
+            heapq.heappop(active)
+        for unused, unused, other in active:
+            pairs.append((other, key))
+        heapq.heappush(active, (last, idx, key))
+    return pairs
+
+
+def _raw(column):
+    """
+    Select the column value as stored in database without conversion.
+    """
+    return type_coerce(column, NullType())
+
+
+def subnet_overlaps():
+    """
+    Return the subnets overlapping a subnet of another VRF.
+    """
+    rows = Subnet.session.execute(
+        select(Subnet.id, Subnet.vrf_id, _raw(Subnet.range)).where(Subnet.estatus != Subnet.STATUS_DELETED)
+    ).all()
+    intervals = []
+    for subnet_id, vrf_id, range in rows:
+        version, first, last = to_interval(range)
+        intervals.append((version, first, last, (subnet_id, vrf_id, range)))
+    conflicts = []
+    for a, b in sweep_overlaps(intervals):
+        if a[1] != b[1]:
+            a_name, b_name = to_text(a[2], host=False), to_text(b[2], host=False)
+            conflicts.append(Conflict(TYPE_SUBNET_OVERLAP, 'subnet', a[0], a_name, 'subnet', b[0], b_name))
+            conflicts.append(Conflict(TYPE_SUBNET_OVERLAP, 'subnet', b[0], b_name, 'subnet', a[0], a_name))
+    return conflicts
+
+
+def dhcp_pool_overlaps():
+    """
+    Return the static DHCP reservations allocated within the DHCP pool of a subnet.
+    """
+    pools = Subnet.session.execute(
+        select(Subnet.id, Subnet.vrf_id, Subnet.range, _raw(Subnet.dhcp_start_ip), _raw(Subnet.dhcp_end_ip)).where(
+            Subnet.estatus != Subnet.STATUS_DELETED,
+            Subnet.dhcp.is_(True),
+            Subnet.dhcp_start_ip.is_not(None),
+            Subnet.dhcp_end_ip.is_not(None),
+        )
+    ).all()
+    records = DhcpRecord.session.execute(
+        select(DhcpRecord.id, DhcpRecord.vrf_id, _raw(DhcpRecord.ip)).where(
+            DhcpRecord.estatus != DhcpRecord.STATUS_DELETED
+        )
+    ).all()
+    intervals = []
+    for subnet_id, vrf_id, range, start_ip, end_ip in pools:
+        version, first, unused = to_interval(start_ip)
+        unused, unused, last = to_interval(end_ip)
+        intervals.append(((vrf_id, version), first, last, ('subnet', subnet_id, range)))
+    for record_id, vrf_id, ip in records:
+        version, first, last = to_interval(ip)
+        intervals.append(((vrf_id, version), first, last, ('dhcprecord', record_id, ip)))
+    conflicts = []
+    for a, b in sweep_overlaps(intervals):
+        if a[0] == 'dhcprecord':
+            a, b = b, a
+        if a[0] == 'subnet' and b[0] == 'dhcprecord':
+            conflicts.append(Conflict(TYPE_DHCP_POOL, 'dhcprecord', b[1], to_text(b[2]), 'subnet', a[1], a[2]))
+    return conflicts
+
+
+def duplicate_ips():
+    """
+    Return the IP addresses used by DNS or DHCP records of more than one VRF.
+    """
+    used = {
+        (ip, vrf_id)
+        for ip, vrf_id in DhcpRecord.session.execute(
+            select(_raw(DhcpRecord.ip), DhcpRecord.vrf_id).where(DhcpRecord.estatus != DhcpRecord.STATUS_DELETED)
+        )
+    }
+    used.update(
+        (ip, vrf_id)
+        for ip, vrf_id in DnsRecord.session.execute(
+            select(_raw(DnsRecord.generated_ip), DnsRecord.vrf_id).where(
+                DnsRecord.estatus != DnsRecord.STATUS_DELETED,
+                DnsRecord.generated_ip.is_not(None),
+            )
+        )
+    )
+    intervals = []
+    for ip_id, ip, vrf_id in Ip.session.execute(select(Ip.id, _raw(Ip.ip), Ip.vrf_id)).all():
+        if (ip, vrf_id) in used:
+            version, first, last = to_interval(ip)
+            intervals.append((version, first, last, (ip_id, vrf_id, ip)))
+    conflicts = []
+    for a, b in sweep_overlaps(intervals):
+        if a[1] != b[1]:
+            a_name, b_name = to_text(a[2]), to_text(b[2])
+            conflicts.append(Conflict(TYPE_DUPLICATE_IP, 'ip', a[0], a_name, 'ip', b[0], b_name))
+            conflicts.append(Conflict(TYPE_DUPLICATE_IP, 'ip', b[0], b_name, 'ip', a[0], a_name))
+    return conflicts
+
+
+def find_conflicts(type=None):
+    """
+    Return the list of conflicts found in the network. When `type` is defined, run only this analysis.
+    """
+    analysis = {
+        TYPE_SUBNET_OVERLAP: subnet_overlaps,
+        TYPE_DHCP_POOL: dhcp_pool_overlaps,
+        TYPE_DUPLICATE_IP: duplicate_ips,
+    }
+    if type is not None:
+        if type not in analysis:
+            raise ValueError('type', type)
+        return analysis[type]()
+    return [conflict for func in analysis.values() for conflict in func()]
+
+
+def _violations(conflicts):
+    return [(c.model_id, c.name) for c in conflicts]
+
+
+RuleAnalysis(
+    'subnet_overlap_other_vrf',
+    Subnet,
+    lambda: _violations(subnet_overlaps()),
+    depends=['subnet'],
+    info={
+        'description': _('Subnet range overlaps a subnet of another VRF.'),
+        'field': 'range',
+    },
+)
+
+RuleAnalysis(
+    'dhcprecord_ip_in_dhcp_pool',
+    DhcpRecord,
+    lambda: _violations(dhcp_pool_overlaps()),
+    depends=['subnet', 'dhcprecord'],
+    info={
+        'description': _('Static DHCP reservation is allocated within the DHCP pool of the subnet.'),
+        'field': 'ip',
+    },
+)
+
+RuleAnalysis(
+    'ip_duplicate_other_vrf',
+    Ip,
+    lambda: _violations(duplicate_ips()),
+    depends=['dhcprecord', 'dnsrecord', 'ip'],
+    info={
+        'description': _('IP address is also used in another VRF.'),
+        'field': 'ip',
+    },
+)
@@ -18,13 +18,10 @@
 
 import binascii
 import os
-import shutil
-import subprocess
-import sys
-import tempfile
+import threading
 
 import cherrypy
-from sqlalchemy import Column, ForeignKey, and_, func, or_, select
+from sqlalchemy import Column, ForeignKey, and_, case, event, func, inspect, or_, select, update
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import declared_attr, foreign, relationship, remote
 from sqlalchemy.types import JSON, Integer, SmallInteger, String, Text
@@ -33,85 +30,37 @@ import udb.tools.db  # noqa: import cherrypy.tools.db
 
 from ._common import CommonMixin
 from ._dhcprecord import DhcpRecord
-from ._dnsrecord import DnsRecord
+from ._dnsrecord import DnsRecord, _sort_name
 from ._json import JsonMixin
-from ._message import Message, MessageMixin
+from ._message import CHANGE_TYPES, Message, MessageMixin
 from ._search_string import SearchableMixing
 from ._status import StatusMixing
 from ._subnet import Subnet
+from ._update import column_add, column_exists
 from ._vrf import Vrf
 
 Base = cherrypy.tools.db.get_base()
+Session = cherrypy.tools.db.get_session()
 
 
-def _deploy(deployment_id, base_url):
+def _hostname(record):
     """
-    Called by the scheduler to execute the deployment.
+    Return the hostname of a DNS record from deployment data according to it's type.
     """
-    # Get the deployment object
-    deployment = Deployment.query.filter(Deployment.id == deployment_id).one()
-    deployment.state = Deployment.STATE_RUNNING
-    deployment.commit()
-
-    # Create a temporary folder
-    working_dir = tempfile.mkdtemp(prefix='udb-deployment-%s-' % deployment.id)
-
-    try:
-        # Switch permissions to nobody when running as root on Python>=3.9
-        kwargs = {}
-        if sys.version_info[0:2] >= (3, 9) and os.getuid() == 0:
-            kwargs = {'user': 65534, 'group': 65534}
-        # Define environment variables.
-        env = {
-            "UDB_USERID": str(deployment.owner.id),
-            "UDB_USERNAME": deployment.owner.username,
-            "UDB_DEPLOYMENT_ID": str(deployment.id),
-            "UDB_DEPLOYMENT_TOKEN": deployment.token,
-            "UDB_DEPLOYMENT_AUTH": "%s:%s" % (deployment.owner.username, deployment.token),
-            "UDB_DEPLOYMENT_MODEL_NAME": deployment.environment.model_name,
-            "UDB_DEPLOYMENT_DATA_URL": cherrypy.url("api/deployment/%s" % deployment.id, base=base_url),
-        }
-        # Start the process with bash.
-        process = subprocess.Popen(
-            '/bin/bash',
-            env=env,
-            cwd=working_dir,
-            start_new_session=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            **kwargs
-        )
-        # Write script using "newline" instead of "cariage return"
-        script = deployment.environment.script.replace('\r\n', '\n').encode('utf8')
-        process.stdin.write(script)
-        process.stdin.close()
-        # Read output.
-        while True:
-            line = process.stdout.readline(65365)
-            if not line:
-                break
-            # Obfuscate deployment token and store output to database
-            line = line.decode('utf-8').replace(deployment.token, '********')
-            deployment.output += line
-            deployment.commit()
-        process.wait()
-        if process.returncode != 0:
-            deployment.output += '\nreturn code: %s' % process.returncode
-            deployment.output += '\nFAILED'
-            deployment.state = Deployment.STATE_FAILURE
-        else:
-            deployment.output += '\nSUCCESS'
-            deployment.state = Deployment.STATE_SUCCESS
-        deployment.commit()
-    except Exception as e:
-        deployment.output += '\n' + str(e)
-        deployment.output += '\nFAILED'
-        deployment.state = Deployment.STATE_FAILURE
-        deployment.commit()
-    finally:
-        # Delete temporary folder
-        shutil.rmtree(working_dir, ignore_errors=True)
+    return record.get('name' if record.get('type', None) != 'PTR' else 'value', '')
+
+
+def _sort_zone_records(records):
+    """
+    Sort DNS records from deployment data with SOA record first.
+
+    Deployment data are stored sorted, except for deployments created before
+    the sort name was introduced. Sorting is stable and linear on sorted data.
+    """
+    return sorted(
+        records,
+        key=lambda r: (r.get('type', None) != 'SOA', _sort_name(_hostname(r)), r.get('type', ''), r.get('value', '')),
+    )
 
 
 class Deployment(CommonMixin, JsonMixin, Base):
@@ -143,7 +92,7 @@ class Deployment(CommonMixin, JsonMixin, Base):
         return relationship(
             Message,
             primaryjoin=and_(
-                Message.type.in_([Message.TYPE_NEW, Message.TYPE_DIRTY]),
+                Message.type.in_(CHANGE_TYPES),
                 or_(
                     # Include any changes made to related model
                     cls.model_name == remote(foreign(Message.model_name)),
@@ -193,6 +142,7 @@ class Deployment(CommonMixin, JsonMixin, Base):
                     DnsRecord.dnszone_name,
                 )
                 .filter(DnsRecord.estatus == DnsRecord.STATUS_ENABLED)
+                .order_by(*DnsRecord.sort_order())
                 .all()
             )
             self.data = {'dnsrecord': [s._asdict() for s in dnsrecord]}
@@ -253,6 +203,72 @@ class Deployment(CommonMixin, JsonMixin, Base):
         else:
             raise ValueError('unsupported model_name: %s' % self.model_name)
 
+    def get_previous(self):
+        """
+        Return the last successful deployment of the same environment preceding this one.
+        """
+        return (
+            Deployment.query.filter(
+                Deployment.environment_id == self.environment_id,
+                Deployment.model_name == self.model_name,
+                Deployment.state == Deployment.STATE_SUCCESS,
+                Deployment.id < self.id,
+            )
+            .order_by(Deployment.id.desc())
+            .first()
+        )
+
+    def get_delta(self, previous=None):
+        """
+        Compare the snapshot of this deployment with the snapshot of a `previous` deployment.
+
+        Records are matched using their id. Return a dictionary with the list of
+        `added` and `changed` records and the list of `removed` ids for each data type.
+        When `previous` is None, every record is reported as added.
+        """
+        assert previous is None or previous.model_name == self.model_name, 'cannot compare different data type'
+        previous_data = previous.data if previous else {}
+        delta = {'added': {}, 'changed': {}, 'removed': {}}
+        for key, records in self.data.items():
+            old_records = {r['id']: r for r in previous_data.get(key, [])}
+            added = delta['added'][key] = []
+            changed = delta['changed'][key] = []
+            for record in records:
+                old_record = old_records.pop(record['id'], None)
+                if old_record is None:
+                    added.append(record)
+                elif old_record != record:
+                    changed.append(record)
+            delta['removed'][key] = sorted(old_records.keys())
+        return delta
+
+    def get_zone_records(self, name):
+        """
+        Return the DNS records from the deployment data to be included in the zone `name`,
+        including the records of it's sub zones. Hostnames are matched on label boundaries.
+        """
+        suffix = '.' + name
+        return _sort_zone_records(
+            [r for r in self.data.get('dnsrecord', []) if _hostname(r) == name or _hostname(r).endswith(suffix)]
+        )
+
+    def partition_zone_records(self, zones):
+        """
+        Partition the DNS records from the deployment data by zone in a single pass.
+
+        Each record is assigned to the zone with the longest matching suffix. Return a
+        dictionary of zone name with the list of records sorted with SOA record first.
+        """
+        partitions = {name: [] for name in zones}
+        for record in self.data.get('dnsrecord', []):
+            labels = _hostname(record).split('.')
+            for i in range(len(labels)):
+                records = partitions.get('.'.join(labels[i:]))
+                if records is not None:
+                    records.append(record)
+                    break
+        return {name: _sort_zone_records(records) for name, records in partitions.items()}
+
     def schedule_task(self, base_url):
         """
         Used to schedule this deployment.
@@ -261,8 +277,7 @@ class Deployment(CommonMixin, JsonMixin, Base):
         """
         assert self.id, 'deployment must be commit'
         assert self.state == Deployment.STATE_STARTING, 'cannot schedule deployment twice'
-        # Detach the object from the session. Otherwise it cause trouble with multi-threading.
-        cherrypy.engine.publish('schedule_task', _deploy, self.id, base_url)
+        cherrypy.engine.publish('schedule_deployment', self.id, self.environment_id, base_url)
 
     def to_json(self):
         return {
@@ -281,6 +296,8 @@ class Environment(CommonMixin, JsonMixin, MessageMixin, StatusMixing, Searchable
     script = Column(Text, nullable=False, default='')
     model_name = Column(String, nullable=False)
     deployments = relationship("Deployment", back_populates='environment', lazy=True)
+    # Highest message id deployed for the current model_name. Updated when a deployment get created.
+    last_deployed_message_id = Column(Integer, nullable=True)
 
     @classmethod
     def _search_string(cls):
@@ -298,21 +315,14 @@ class Environment(CommonMixin, JsonMixin, MessageMixin, StatusMixing, Searchable
         return relationship(
             Message,
             primaryjoin=and_(
-                Message.type.in_([Message.TYPE_NEW, Message.TYPE_DIRTY]),
+                Message.type.in_(CHANGE_TYPES),
                 or_(
                     # Include any changes made to related model
                     cls.model_name == remote(foreign(Message.model_name)),
                     # Include change made to environment it self.
                     and_(Message.model_name == 'environment', cls.id == remote(foreign(Message.model_id))),
                 ),
-                Message.id.__gt__(
-                    func.coalesce(
-                        select(func.max(Deployment.end_id))
-                        .filter(Deployment.environment_id == cls.id, Deployment.model_name == cls.model_name)
-                        .scalar_subquery(),
-                        0,
-                    )
-                ),
+                Message.id > func.coalesce(cls.last_deployed_message_id, 0),
             ),
             lazy=True,
             viewonly=True,
@@ -344,4 +354,121 @@ class Environment(CommonMixin, JsonMixin, MessageMixin, StatusMixing, Searchable
 
     @classmethod
     def count_pending_changes(cls, limit=10):
-        return Environment.query.with_entities(func.count(Message.id)).join(Environment.pending_changes).scalar()
+        """
+        Return the number of pending changes for all environments. The value is cached
+        until new changes or new deployments get commit.
+        """
+        return _pending_changes_counter.get(
+            lambda: Environment.query.with_entities(func.count(Message.id)).join(Environment.pending_changes).scalar()
+        )
+
+
+class _PendingChangesCounter:
+    """
+    Process-wide cache of the number of pending changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._generation = 0
+
+    def get(self, func):
+        with self._lock:
+            value, generation = self._value, self._generation
+        if value is not None:
+            return value
+        value = func()
+        with self._lock:
+            # Do not keep the value if invalidated in the meantime.
+            if generation == self._generation:
+                self._value = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._value = None
+
+
+_pending_changes_counter = _PendingChangesCounter()
+
+
+@event.listens_for(Session, 'after_flush')
+def _pending_changes_after_flush(session, flush_context):
+    """
+    Keep track if the session created changes or deployments.
+    """
+    for obj in session.new:
+        if isinstance(obj, Deployment) or (
+            isinstance(obj, Message)
+            and obj.type in [Message.TYPE_NEW, Message.TYPE_DIRTY]
+            and obj.model_name in ['environment', 'subnet', 'dnsrecord', 'dhcprecord']
+        ):
+            session.info['pending_changes'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _pending_changes_after_commit(session):
+    if session.info.pop('pending_changes', False):
+        _pending_changes_counter.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _pending_changes_after_rollback(session):
+    session.info.pop('pending_changes', None)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+@event.listens_for(Base.metadata, 'after_drop')
+def _pending_changes_reset(target, conn, **kw):
+    _pending_changes_counter.invalidate()
+
+
+def _last_deployed_message_id_query(environment_id, model_name):
+    return select(func.max(Deployment.end_id)).filter(
+        Deployment.environment_id == environment_id, Deployment.model_name == model_name
+    )
+
+
+@event.listens_for(Deployment, 'after_insert')
+def deployment_after_insert(mapper, connection, target):
+    """
+    Keep track of the last message deployed by the environment.
+    """
+    column = Environment.__table__.c.last_deployed_message_id
+    connection.execute(
+        update(Environment.__table__)
+        .where(Environment.id == target.environment_id, Environment.model_name == target.model_name)
+        .values(
+            last_deployed_message_id=case(
+                (or_(column.is_(None), column < target.end_id), target.end_id),
+                else_=column,
+            )
+        )
+    )
+
+
+@event.listens_for(Environment, 'before_update')
+def environment_before_update(mapper, connection, target):
+    """
+    When the model_name get updated, lookup the last deployment for this type of data.
+    """
+    if inspect(target).attrs['model_name'].history.has_changes():
+        target.last_deployed_message_id = connection.execute(
+            _last_deployed_message_id_query(target.id, target.model_name)
+        ).scalar()
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_last_deployed_message_id_field(target, conn, **kw):
+    if not column_exists(conn, Environment.last_deployed_message_id):
+        column_add(conn, Environment.last_deployed_message_id)
+        conn.execute(
+            update(Environment.__table__).values(
+                last_deployed_message_id=_last_deployed_message_id_query(
+                    Environment.id, Environment.model_name
+                ).scalar_subquery()
+            )
+        )
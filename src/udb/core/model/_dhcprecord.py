@@ -27,6 +27,7 @@ from sqlalchemy import (
     Index,
     Integer,
     and_,
+    bindparam,
     event,
     func,
     insert,
@@ -56,8 +57,9 @@ from ._message import Message, MessageMixin
 from ._rule import RuleConstraint
 from ._search_string import SearchableMixing
 from ._status import StatusMixing
-from ._subnet import Subnet
-from ._update import trigger_on_update
+from ._subnet import Subnet, range_contains
+from ._subnet_index import nearest_supernets
+from ._update import index_exists, index_gist_add, is_sqlite, trigger_on_update
 from ._vrf import Vrf
 
 Base = cherrypy.tools.db.get_base()
@@ -183,7 +185,7 @@ class DhcpRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMix
         Lookup database to find the best subnet range to be linked with this DHCP record.
         """
         query = Subnet.query.with_entities(Subnet.id, Subnet.estatus, Subnet.range).filter(
-            func.subnet_of_or_equals(func.inet(cls.ip), Subnet.range),
+            range_contains(Subnet, cls.ip),
             Subnet.estatus != DnsRecord.STATUS_DELETED,
         )
         # VRF is optional. Will pick first matching subnet.
@@ -193,6 +195,11 @@ class DhcpRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMix
             query = query.filter(Subnet.vrf_id == cls.vrf.id)
         if not_id:
             query = query.filter(Subnet.id != not_id)
+        # For a single record, only consider the candidates from the index.
+        if not isinstance(cls, type):
+            ids = Subnet._supernet_ids(cls.vrf.id if cls.vrf else None, cls.ip)
+            if ids is not None:
+                query = query.filter(Subnet.id.in_(ids))
         return query.order_by(Subnet.range.desc()).limit(1)
 
     def add_change(self, new_message):
@@ -202,6 +209,23 @@ class DhcpRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMix
         super().add_change(new_message)
 
 
+# Index used to assign DHCP records to a subnet.
+dhcprecord_vrf_id_ip_ix = Index(
+    'dhcprecord_vrf_id_ip_ix',
+    DhcpRecord.vrf_id,
+    DhcpRecord.ip,
+)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_dhcprecord_vrf_id_ip_ix(target, conn, **kw):
+    if not index_exists(conn, dhcprecord_vrf_id_ip_ix.name):
+        dhcprecord_vrf_id_ip_ix.create(conn)
+    # On Postgresql, create a GiST index to lookup records within a subnet.
+    if not is_sqlite(conn) and not index_exists(conn, 'dhcprecord_ip_gist_ix'):
+        index_gist_add(conn, 'dhcprecord_ip_gist_ix', DhcpRecord.ip)
+
+
 Index(
     'dhcprecord_mac_unique_ix',
     DhcpRecord.mac,
@@ -327,27 +351,43 @@ def dhcprecord_before_flush(session, flush_context, obj):
 def dhcprecord_subnet_after_update(mapper, conn, subnet):
     if subnet.estatus != Subnet.STATUS_DELETED:
         # When subnet-range get update or created, make sure to re-assign the DHCP accordingly.
-        assign_dhcprecord = (
-            update(DhcpRecord)
-            .inline()
-            .filter(
+        records = conn.execute(
+            select(DhcpRecord.id, DhcpRecord.ip, DhcpRecord.subnet_id).where(
                 DhcpRecord.vrf_id == subnet.vrf_id,
-                func.subnet_of_or_equals(DhcpRecord.ip, subnet.range),
+                range_contains(subnet.range, DhcpRecord.ip),
                 DhcpRecord.estatus != Subnet.STATUS_DELETED,
             )
-            .values(
-                {
-                    tuple_(
-                        DhcpRecord.subnet_id,
-                        DhcpRecord.subnet_estatus,
-                        DhcpRecord.subnet_range,
-                    )
-                    .self_group(): DhcpRecord._find_parent_subnet()
-                    .scalar_subquery(),
-                }
+        ).all()
+        if not records:
+            return
+        # Lookup best matching subnet of every records in memory.
+        subnets = conn.execute(
+            select(Subnet.id, Subnet.range).where(
+                Subnet.vrf_id == subnet.vrf_id,
+                Subnet.estatus != Subnet.STATUS_DELETED,
+                or_(range_contains(subnet.range, Subnet), range_contains(Subnet, subnet.range)),
             )
-        )
-        conn.execute(assign_dhcprecord, execution_options={'synchronize_session': False})
+        ).all()
+        found = nearest_supernets(subnets, [(r.id, r.ip) for r in records])
+        changes = [{'b_id': r.id, 'b_subnet_id': found[r.id]} for r in records if found[r.id] != r.subnet_id]
+        if changes:
+            assign_dhcprecord = (
+                update(DhcpRecord)
+                .where(DhcpRecord.id == bindparam('b_id'))
+                .values(
+                    {
+                        tuple_(
+                            DhcpRecord.subnet_id,
+                            DhcpRecord.subnet_estatus,
+                            DhcpRecord.subnet_range,
+                        )
+                        .self_group(): select(Subnet.id, Subnet.estatus, Subnet.range)
+                        .where(Subnet.id == bindparam('b_subnet_id'))
+                        .scalar_subquery(),
+                    }
+                )
+            )
+            conn.execute(assign_dhcprecord, changes)
 
 
 @event.listens_for(Base.metadata, 'after_create')
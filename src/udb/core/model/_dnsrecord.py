@@ -26,6 +26,7 @@ from sqlalchemy import (
     ForeignKeyConstraint,
     Index,
     and_,
+    bindparam,
     case,
     event,
     func,
@@ -56,8 +57,16 @@ from ._message import Message, MessageMixin
 from ._rule import Rule, RuleConstraint
 from ._search_string import SearchableMixing
 from ._status import StatusMixing
-from ._subnet import Subnet
-from ._update import trigger_on_update
+from ._subnet import Subnet, range_contains
+from ._subnet_index import nearest_supernets
+from ._update import (
+    column_add,
+    column_exists,
+    index_exists,
+    index_gist_add,
+    is_sqlite,
+    trigger_on_update,
+)
 from ._vrf import Vrf
 
 Base = cherrypy.tools.db.get_base()
@@ -92,8 +101,12 @@ def _collapse_slave_subnets(obj):
             func.coalesce(ranges_subquery, a1.summary).label('ranges'),
         )
         .filter(a1.estatus != DnsZone.STATUS_DELETED, _match_zone(literal(obj.name), a1.name))
-        .first()
+        .order_by(-func.length(a1.name))
     )
+    ids = DnsZone._suffix_ids(obj.name)
+    if ids is not None:
+        row = row.filter(a1.id.in_(ids))
+    row = row.first()
     if row is None:
         return None
     # Get list of range
@@ -177,6 +190,15 @@ def _reverse_ipv6(value):
     return str(ipaddress.ip_address(full_address))
 
 
+def _sort_name(hostname):
+    """
+    Return the hostname with labels in reverse order separated by space. The
+    wildcard (*) is replaced by a higher character to be placed at the end of
+    the subdomains.
+    """
+    return ' '.join(p if p != '*' else '~' for p in (hostname or '').split('.')[::-1])
+
+
 def _match_zone(name, zonename):
     if isinstance(name, str):
         name = literal(name)
@@ -209,6 +231,14 @@ class DnsRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixi
     ttl = Column(Integer, nullable=False, default=3600)
     value = Column(String, nullable=False)
 
+    # Hostname with labels in reverse order. Used to sort records and lookup records of a domain.
+    _sort_name = Column(
+        String().with_variant(String(collation='C'), 'postgresql'),
+        nullable=False,
+        server_default='',
+        doc="store hostname with labels in reverse order used for sorting",
+    )
+
     # A DNS Record must be asigned to a specific VRF
     vrf_id = Column(Integer, ForeignKey("vrf.id"))
     vrf = relationship(Vrf)
@@ -302,6 +332,11 @@ class DnsRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixi
     def generated_ip(cls):
         return Column(InetType, Computed(cls.ip_value, persisted=True))
 
+    # Hostname of the record used to lookup related records with an index.
+    @declared_attr
+    def _hostname(cls):
+        return Column(String, Computed(cls.hostname_value))
+
     @declared_attr
     def _ip(cls):
         return relationship(
@@ -327,24 +362,25 @@ class DnsRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixi
         """
         Return DnsZone matching our name.
         """
-        return (
-            DnsZone.query.filter(
-                or_(
-                    _match_zone(self.hostname_value, DnsZone.name),
-                    _match_zone(self.name, DnsZone.name),
-                ),
-                DnsZone.estatus != DnsZone.STATUS_DELETED,
-            )
-            .order_by(func.length(DnsZone.name))
-            .all()
+        query = DnsZone.query.filter(
+            or_(
+                _match_zone(self.hostname_value, DnsZone.name),
+                _match_zone(self.name, DnsZone.name),
+            ),
+            DnsZone.estatus != DnsZone.STATUS_DELETED,
         )
+        # Only consider the candidates from the index.
+        ids = [DnsZone._suffix_ids(self.hostname_value), DnsZone._suffix_ids(self.name)]
+        if None not in ids:
+            query = query.filter(DnsZone.id.in_(set(ids[0] + ids[1])))
+        return query.order_by(func.length(DnsZone.name)).all()
 
     def related_dns_record_query(self):
         """
         Return a list of DNS Record with the same `hostname_value` excluding our self.
         """
         return DnsRecord.query.filter(
-            DnsRecord.hostname_value == literal(self.hostname_value),
+            DnsRecord._hostname == literal(self.hostname_value),
             DnsRecord.estatus != DnsRecord.STATUS_DELETED,
             DnsRecord.id != self.id,
         )
@@ -547,28 +583,32 @@ class DnsRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixi
             pass
         return objects
 
-    @classmethod
-    def dnsrecord_sort_key(cls, record):
+    def _update_sort_name(self):
         """
-        Return a key appropriate to be used for sorting dns records.
+        Should be called everytime the record get insert or updated
+        to keep the sort name in sync with the hostname.
         """
         # Pick hostname according to record type
-        hostname = record.get('name' if record.get('type', None) != 'PTR' else 'value', '')
-        # Reverse order the hostname
-        parts = hostname.split('.')[::-1]
-        # Replace the wildcard (*) with a higher character to be sure to place the wildcard at the end of the subdomains.
-        parts = [p if p != '*' else '\xff' for p in parts]
-
-        return (
-            # Make sure to place SOA records first
-            record.get('type', None) != 'SOA',
-            # Reverse domain name
-            parts,
-            # Then sort by type
-            record.get('type', ''),
-            # and value
-            record.get('value', ''),
-        )
+        self._sort_name = _sort_name(self.value if self.type == 'PTR' else self.name)
+
+    @classmethod
+    def sort_order(cls):
+        """
+        Return the expressions used to sort dns records: SOA records first,
+        then by reversed domain name, type and value.
+        """
+        return [cls.type != 'SOA', cls._sort_name, cls.type, cls.value]
+
+    @classmethod
+    def in_domain(cls, name):
+        """
+        Return an expression verifying if the record hostname is the given
+        domain or one of it's subdomains. Make use of a range scan on the sort name.
+        """
+        # Hostnames are stored in lower case without the trailing dot.
+        key = _sort_name(name.strip().rstrip('.').lower())
+        # Space is the separator of labels, the next character is the upper bound.
+        return and_(cls._sort_name >= key, cls._sort_name < key + '!')
 
     def _validate(self):
         # This is the only application level validation to be done to avoid raising an exception calling Postgresql.::inet() function.
@@ -590,6 +630,10 @@ class DnsRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixi
             _match_zone(self.name, remote(foreign(DnsZone.name))),
             DnsZone.estatus != DnsZone.STATUS_DELETED,
         ).order_by(-func.length(DnsZone.name))
+        # Only consider the candidates from the index.
+        ids = DnsZone._suffix_ids(self.name)
+        if ids is not None:
+            q = q.filter(DnsZone.id.in_(ids))
         return q.first()
 
     @hybrid_method
@@ -597,12 +641,12 @@ class DnsRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixi
         """
         Lookup database to find the best matching Subnet for this record.
         """
-        ip_field = cls.generated_ip if isinstance(cls, type) else func.inet(literal(cls.ip_value))
+        ip_field = cls.generated_ip if isinstance(cls, type) else cls.ip_value
         query = (
             Subnet.query.with_entities(Subnet.id, Subnet.estatus, Subnet.range)
             .join(Subnet.dnszones)
             .filter(
-                func.subnet_of_or_equals(ip_field, Subnet.range),
+                range_contains(Subnet, ip_field),
                 Subnet.estatus != DnsRecord.STATUS_DELETED,
             )
         )
@@ -616,6 +660,11 @@ class DnsRecord(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixi
             query = query.filter(DnsZone.id == (cls.dnszone_id or cls._dnszone.id))
         if not_id:
             query = query.filter(Subnet.id != not_id)
+        # For a single record, only consider the candidates from the index.
+        if not isinstance(cls, type):
+            ids = Subnet._supernet_ids(cls.vrf.id if cls.vrf else None, cls.ip_value)
+            if ids is not None:
+                query = query.filter(Subnet.id.in_(ids))
         return query.order_by(Subnet.range.desc()).limit(1)
 
     def add_change(self, new_message):
@@ -637,6 +686,7 @@ def dns_reload_ip(self, new_value, old_value, initiator):
 def dnsrecord_before_flush(session, flush_context, obj):
     # Run default validation of field.
     obj._validate()
+    obj._update_sort_name()
 
     if obj.status == DnsRecord.STATUS_DELETED:
         # Dissociate the record from it's parent when getting deleted.
@@ -688,29 +738,50 @@ def dnsrecord_after_flush(session, flush_context, obj):
         for related in inspect(obj).attrs.subnets.history.added:
             inserts.add((related, obj))
     # Then update all dns record
+    conn = session.connection()
     for subnet, dnszone in inserts:
-        assign_dnsrecord = (
-            update(DnsRecord)
-            .filter(
+        records = conn.execute(
+            select(DnsRecord.id, DnsRecord.generated_ip, DnsRecord.subnet_id).where(
                 DnsRecord.vrf_id == subnet.vrf_id,
                 DnsRecord.dnszone_id == dnszone.id,
-                func.subnet_of_or_equals(DnsRecord.generated_ip, subnet.range),
+                range_contains(subnet.range, DnsRecord.generated_ip),
                 DnsRecord.estatus != Subnet.STATUS_DELETED,
                 DnsRecord.subnet_id != subnet.id,
             )
-            .values(
-                {
-                    tuple_(
-                        DnsRecord.subnet_id,
-                        DnsRecord.subnet_estatus,
-                        DnsRecord.subnet_range,
-                    )
-                    .self_group(): DnsRecord._find_parent_subnet()
-                    .scalar_subquery(),
-                }
+        ).all()
+        if not records:
+            continue
+        # Lookup best matching subnet of every records in memory.
+        subnets = conn.execute(
+            select(Subnet.id, Subnet.range)
+            .join(Subnet.dnszones)
+            .where(
+                DnsZone.id == dnszone.id,
+                Subnet.vrf_id == subnet.vrf_id,
+                Subnet.estatus != Subnet.STATUS_DELETED,
+                or_(range_contains(subnet.range, Subnet), range_contains(Subnet, subnet.range)),
             )
-        )
-        session.execute(assign_dnsrecord, execution_options={'synchronize_session': False})
+        ).all()
+        found = nearest_supernets(subnets, [(r.id, r.generated_ip) for r in records])
+        changes = [{'b_id': r.id, 'b_subnet_id': found[r.id]} for r in records if found[r.id] != r.subnet_id]
+        if changes:
+            assign_dnsrecord = (
+                update(DnsRecord)
+                .where(DnsRecord.id == bindparam('b_id'))
+                .values(
+                    {
+                        tuple_(
+                            DnsRecord.subnet_id,
+                            DnsRecord.subnet_estatus,
+                            DnsRecord.subnet_range,
+                        )
+                        .self_group(): select(Subnet.id, Subnet.estatus, Subnet.range)
+                        .where(Subnet.id == bindparam('b_subnet_id'))
+                        .scalar_subquery(),
+                    }
+                )
+            )
+            conn.execute(assign_dnsrecord, changes)
 
 
 @event.listens_for(Base.metadata, 'after_create')
@@ -938,6 +1009,61 @@ Index(
     },
 )
 
+# Indexes used by the builtin rules to lookup related records.
+dnsrecord_generated_ip_vrf_id_type_estatus_ix = Index(
+    'dnsrecord_generated_ip_vrf_id_type_estatus_ix',
+    DnsRecord.generated_ip,
+    DnsRecord.vrf_id,
+    DnsRecord.type,
+    DnsRecord.estatus,
+)
+dnsrecord_name_type_ix = Index(
+    'dnsrecord_name_type_ix',
+    DnsRecord.name,
+    DnsRecord.type,
+)
+dnsrecord_hostname_ix = Index(
+    'dnsrecord_hostname_ix',
+    DnsRecord._hostname,
+)
+
+dnsrecord_sort_name_ix = Index(
+    'dnsrecord_sort_name_ix',
+    DnsRecord._sort_name,
+)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_dnsrecord_sort_name(target, conn, **kw):
+    if not column_exists(conn, DnsRecord._sort_name):
+        column_add(conn, DnsRecord._sort_name)
+        # Compute the sort name of existing records.
+        rows = conn.execute(select(DnsRecord.id, DnsRecord.type, DnsRecord.name, DnsRecord.value)).all()
+        changes = [{'b_id': r.id, 'b_sort_name': _sort_name(r.value if r.type == 'PTR' else r.name)} for r in rows]
+        if changes:
+            # Keep modification date untouched.
+            update_sort_name = (
+                update(DnsRecord)
+                .where(DnsRecord.id == bindparam('b_id'))
+                .values(_sort_name=bindparam('b_sort_name'), modified_at=DnsRecord.modified_at)
+            )
+            conn.execute(update_sort_name, changes)
+    if not index_exists(conn, dnsrecord_sort_name_ix.name):
+        dnsrecord_sort_name_ix.create(conn)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_dnsrecord_rule_ix(target, conn, **kw):
+    if not column_exists(conn, DnsRecord._hostname):
+        column_add(conn, DnsRecord._hostname)
+    for index in [dnsrecord_generated_ip_vrf_id_type_estatus_ix, dnsrecord_name_type_ix, dnsrecord_hostname_ix]:
+        if not index_exists(conn, index.name):
+            index.create(conn)
+    # On Postgresql, create a GiST index to lookup records within a subnet.
+    if not is_sqlite(conn) and not index_exists(conn, 'dnsrecord_generated_ip_gist_ix'):
+        index_gist_add(conn, 'dnsrecord_generated_ip_gist_ix', DnsRecord.generated_ip)
+
+
 RuleConstraint(
     name='dnsrecord_ptr_dnszone_required_rule',
     model=DnsRecord,
@@ -18,15 +18,16 @@
 import re
 
 import cherrypy
-from sqlalchemy import CheckConstraint, Column, ForeignKey, Index, Table, event, func
+from sqlalchemy import CheckConstraint, Column, ForeignKey, Index, Table, event, func, inspect, select
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import object_session, relationship
 from sqlalchemy.types import String
 
 import udb.tools.db  # noqa: import cherrypy.tools.db
 from udb.tools.i18n import gettext_lazy as _
 
 from ._common import CommonMixin
+from ._dnszone_index import DnsZoneIndex
 from ._follower import FollowerMixin
 from ._json import JsonMixin
 from ._message import MessageMixin
@@ -45,6 +46,8 @@ NAME_PATTERN = re.compile(
 
 Base = cherrypy.tools.db.get_base()
 
+Session = cherrypy.tools.db.get_session()
+
 dnszone_subnet = Table(
     'dnszone_subnet',
     Base.metadata,
@@ -76,6 +79,17 @@ class DnsZone(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixin,
     def summary(self):
         return self.name
 
+    @classmethod
+    def _suffix_ids(cls, name):
+        """
+        Lookup the in-memory index to find the zones matching the given
+        hostname, the longest zone name first. Return None when the index
+        cannot be used.
+        """
+        if not name:
+            return []
+        return dnszone_index.lookup(name, Session().info.get('dnszone_index', {}))
+
 
 # Make DNS Zone name (FQDN) unique without case-sensitive
 Index(
@@ -121,6 +135,42 @@ CheckConstraint(
 )
 
 
+def _load_dnszone_names():
+    # Use a dedicated connection to only load committed zones.
+    with Session.get_bind().connect() as conn:
+        return conn.execute(select(DnsZone.id, DnsZone.name).where(DnsZone.estatus != DnsZone.STATUS_DELETED)).all()
+
+
+dnszone_index = DnsZoneIndex(_load_dnszone_names)
+
+
+@event.listens_for(DnsZone, 'after_insert')
+@event.listens_for(DnsZone, 'after_update')
+@event.listens_for(DnsZone, 'after_delete')
+def dnszone_index_after_update(mapper, conn, obj):
+    # Keep track of zones modified by this transaction until commit.
+    deleted = obj.estatus == DnsZone.STATUS_DELETED or inspect(obj).deleted
+    object_session(obj).info.setdefault('dnszone_index', {})[obj.id] = None if deleted else obj.name
+
+
+@event.listens_for(Session, 'after_commit')
+def dnszone_index_after_commit(session):
+    changes = session.info.pop('dnszone_index', None)
+    if changes:
+        dnszone_index.update(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def dnszone_index_after_rollback(session):
+    session.info.pop('dnszone_index', None)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+@event.listens_for(Base.metadata, 'after_drop')
+def dnszone_index_clear(target, conn, **kw):
+    dnszone_index.clear()
+
+
 @event.listens_for(Base.metadata, 'after_create')
 def create_arpa_zone(target, conn, **kw):
     # To allow usage of ORM session within DDL scope, we need to manually assign the connection to our current session.
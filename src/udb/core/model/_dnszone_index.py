@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+In-memory index of DNS zone names used to find the zones matching a hostname
+without evaluating every zone.
+
+The index only reflect committed data. Zones flushed by the current
+transaction are kept in the session until commit. Lookups return candidate
+identifiers that must still be validated against the database.
+'''
+import threading
+
+
+def _labels(name):
+    """
+    Return the labels of a domain name from the top level domain.
+    """
+    return name.lower().split('.')[::-1]
+
+
+def _match(name, zonename):
+    return name == zonename or name.endswith('.' + zonename)
+
+
+class LabelTrie:
+    """
+    Trie of domain names indexed by reversed labels. Each node represent a
+    domain and hold the keys of zones defined for this domain.
+    """
+
+    def __init__(self):
+        # Node are [children, keys]
+        self._root = [{}, None]
+
+    def add(self, name, key):
+        node = self._root
+        for label in _labels(name):
+            node = node[0].setdefault(label, [{}, None])
+        if node[1] is None:
+            node[1] = set()
+        node[1].add(key)
+
+    def discard(self, name, key):
+        node = self._root
+        path = []
+        for label in _labels(name):
+            path.append((node, label))
+            node = node[0].get(label)
+            if node is None:
+                return
+        if node[1]:
+            node[1].discard(key)
+        # Prune nodes left without keys nor children.
+        for parent, label in reversed(path):
+            node = parent[0][label]
+            if node[0] or node[1]:
+                break
+            del parent[0][label]
+
+    def suffixes(self, name):
+        """
+        Return keys of zones matching the given hostname. Most specific first.
+        """
+        found = []
+        node = self._root
+        for label in _labels(name):
+            node = node[0].get(label)
+            if node is None:
+                break
+            if node[1]:
+                found.append(node[1])
+        return [key for keys in reversed(found) for key in keys]
+
+
+class DnsZoneIndex:
+    """
+    Reversed-label trie of active DNS zone names.
+    """
+
+    def __init__(self, loader):
+        # Function returning (id, name) of every active zones.
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._trie = None
+        self._names = {}
+        self._generation = 0
+
+    def clear(self):
+        """
+        Discard the index. It get rebuilt on next lookup.
+        """
+        with self._lock:
+            self._trie = None
+            self._names = {}
+            self._generation += 1
+
+    def _load(self):
+        with self._lock:
+            if self._trie is not None:
+                return True
+            generation = self._generation
+        trie = LabelTrie()
+        names = {}
+        for zone_id, name in self._loader():
+            trie.add(name, zone_id)
+            names[zone_id] = name
+        with self._lock:
+            # Discard the result if a commit happen while loading.
+            if generation != self._generation:
+                return False
+            self._trie = trie
+            self._names = names
+        return True
+
+    def update(self, changes):
+        """
+        Apply committed changes. `changes` is a dict of zone id to name or None when deleted.
+        """
+        with self._lock:
+            self._generation += 1
+            if self._trie is None:
+                return
+            for zone_id, name in changes.items():
+                previous = self._names.pop(zone_id, None)
+                if previous:
+                    self._trie.discard(previous, zone_id)
+                if name:
+                    self._trie.add(name, zone_id)
+                    self._names[zone_id] = name
+
+    def lookup(self, name, pending=None):
+        """
+        Return identifiers of the zones matching the given hostname, the
+        longest zone name first. `pending` are the changes not yet committed
+        by the current transaction.
+
+        Return None if the index is not available.
+        """
+        if pending is None:
+            pending = {}
+        if not self._load():
+            return None
+        with self._lock:
+            if self._trie is None:
+                return None
+            found = [(self._names[key], key) for key in self._trie.suffixes(name) if key not in pending]
+        # Add zones modified by current transaction.
+        hostname = name.lower()
+        for zone_id, zonename in pending.items():
+            if zonename and _match(hostname, zonename):
+                found.append((zonename, zone_id))
+        found.sort(key=lambda item: len(item[0]), reverse=True)
+        return [zone_id for unused, zone_id in found]
@@ -18,7 +18,7 @@
 import ipaddress
 
 import cherrypy
-from sqlalchemy import Column, ForeignKey, Index, Integer, func
+from sqlalchemy import Column, ForeignKey, Index, Integer, event
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, validates
 
@@ -31,7 +31,8 @@ from ._follower import FollowerMixin
 from ._json import JsonMixin
 from ._message import MessageMixin
 from ._search_string import SearchableMixing
-from ._subnet import Subnet
+from ._subnet import Subnet, range_contains
+from ._update import index_exists, index_gist_add, is_sqlite
 from ._vrf import Vrf
 
 Base = cherrypy.tools.db.get_base()
@@ -93,7 +94,7 @@ class Ip(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, SearchableMixing,
     @property
     def related_subnets(self):
         return Subnet.query.filter(
-            func.subnet_of(self.ip, Subnet.range),
+            range_contains(Subnet, self.ip, strict=True),
             Subnet.vrf_id == self.vrf_id,
             Subnet.estatus != Subnet.STATUS_DELETED,
         ).all()
@@ -115,3 +116,10 @@ Index(
         'description': _('An IP address must be unique within a VRF.'),
     },
 )
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_ip_ip_gist_ix(target, conn, **kw):
+    # On Postgresql, create a GiST index to lookup IP within a subnet.
+    if not is_sqlite(conn) and not index_exists(conn, 'ip_ip_gist_ix'):
+        index_gist_add(conn, 'ip_ip_gist_ix', Ip.ip)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Utilization and free space of a subnet range.
+
+Used space is represented as intervals of integer addresses (first, last).
+Free space is computed with interval arithmetic without enumerating the
+addresses, so it's usable with large IPv6 ranges.
+'''
+import ipaddress
+
+from sqlalchemy import select
+
+from ._dhcprecord import DhcpRecord
+from ._dnsrecord import DnsRecord
+from ._subnet import Subnet, range_contains
+
+
+def merge_ranges(ranges):
+    """
+    Merge overlapping and adjacent intervals. Return a sorted list of (first, last).
+    """
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1][1] = last
+        else:
+            merged.append([first, last])
+    return [tuple(r) for r in merged]
+
+
+def free_ranges(first, last, used):
+    """
+    Return the intervals between `first` and `last` not covered by `used` intervals.
+    """
+    free = []
+    start = first
+    for u_first, u_last in merge_ranges(used):
+        if u_last < start:
+            continue
+        if u_first > last:
+            break
+        if u_first > start:
+            free.append((start, u_first - 1))
+        start = u_last + 1
+    if start <= last:
+        free.append((start, last))
+    return free
+
+
+def range_to_networks(version, first, last):
+    """
+    Split an interval into the smallest list of CIDR networks.
+    """
+    max_prefixlen = 32 if version == 4 else 128
+    cls = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+    networks = []
+    while first <= last:
+        # Largest block aligned on `first` fitting in the interval.
+        size = first & -first if first else 1 << max_prefixlen
+        while first + size - 1 > last:
+            size >>= 1
+        networks.append(cls((first, max_prefixlen - size.bit_length() + 1)))
+        first += size
+    return networks
+
+
+def first_fit(free, size):
+    """
+    Return the first address of the first block of `size` addresses aligned on it's size.
+    """
+    for first, last in free:
+        start = -(-first // size) * size
+        if start + size - 1 <= last:
+            return start
+    return None
+
+
+class IpSpace:
+    """
+    Used and free space of a subnet range. Child subnets, DHCP reservations,
+    DNS records and the DHCP pool of the subnet are considered used.
+    """
+
+    def __init__(self, subnet):
+        self.subnet = subnet
+        self.network = ipaddress.ip_network(subnet.range)
+        self.first = int(self.network.network_address)
+        self.last = int(self.network.broadcast_address)
+        self._used = None
+
+    @classmethod
+    def lookup(cls, value, vrf_id=None):
+        """
+        Return the space of the most specific subnet containing the given IP
+        address or network. Return None if not found.
+        """
+        query = Subnet.query.filter(
+            range_contains(Subnet, str(value)),
+            Subnet.estatus != Subnet.STATUS_DELETED,
+        )
+        if vrf_id:
+            query = query.filter(Subnet.vrf_id == vrf_id)
+        subnet = query.order_by(Subnet.range.desc()).first()
+        return cls(subnet) if subnet else None
+
+    def _load(self):
+        """
+        Lookup used ranges and addresses within the subnet range.
+        """
+        subnet = self.subnet
+        session = Subnet.session
+        used = []
+        children = session.execute(
+            select(Subnet.range).where(
+                Subnet.vrf_id == subnet.vrf_id,
+                Subnet.estatus != Subnet.STATUS_DELETED,
+                range_contains(subnet.range, Subnet, strict=True),
+            )
+        ).scalars()
+        for value in children:
+            network = ipaddress.ip_network(value)
+            used.append((int(network.network_address), int(network.broadcast_address)))
+        dhcp_ips = session.execute(
+            select(DhcpRecord.ip).where(
+                DhcpRecord.vrf_id == subnet.vrf_id,
+                DhcpRecord.estatus != DhcpRecord.STATUS_DELETED,
+                range_contains(subnet.range, DhcpRecord.ip),
+            )
+        ).scalars()
+        dns_ips = session.execute(
+            select(DnsRecord.generated_ip).where(
+                DnsRecord.vrf_id == subnet.vrf_id,
+                DnsRecord.estatus != DnsRecord.STATUS_DELETED,
+                range_contains(subnet.range, DnsRecord.generated_ip),
+            )
+        ).scalars()
+        for value in list(dhcp_ips) + list(dns_ips):
+            address = int(ipaddress.ip_address(value))
+            used.append((address, address))
+        if subnet.dhcp and subnet.dhcp_start_ip and subnet.dhcp_end_ip:
+            start = int(ipaddress.ip_address(subnet.dhcp_start_ip))
+            end = int(ipaddress.ip_address(subnet.dhcp_end_ip))
+            used.append((start, end))
+        return [(max(first, self.first), min(last, self.last)) for first, last in merge_ranges(used)]
+
+    @property
+    def used(self):
+        """
+        Sorted list of used intervals.
+        """
+        if self._used is None:
+            self._used = self._load()
+        return self._used
+
+    @property
+    def free(self):
+        """
+        Sorted list of free intervals.
+        """
+        return free_ranges(self.first, self.last, self.used)
+
+    def free_blocks(self):
+        """
+        Return the free space as a list of CIDR networks.
+        """
+        return [n for first, last in self.free for n in range_to_networks(self.network.version, first, last)]
+
+    def next_ip(self):
+        """
+        Return the first free address. Network and broadcast addresses of IPv4 are excluded.
+        """
+        reserved = set()
+        if self.network.version == 4 and self.network.prefixlen < 31:
+            reserved = {self.first, self.last}
+        for first, last in self.free:
+            for address in (first, first + 1):
+                if address <= last and address not in reserved:
+                    return str(self.network.network_address.__class__(address))
+        return None
+
+    def next_subnet(self, prefixlen):
+        """
+        Return the first free network with the given prefix length.
+        """
+        if prefixlen < self.network.prefixlen or prefixlen > self.network.max_prefixlen:
+            return None
+        start = first_fit(self.free, 1 << (self.network.max_prefixlen - prefixlen))
+        if start is None:
+            return None
+        return str(self.network.__class__((start, prefixlen)))
+
+    def to_json(self, prefixlen=None):
+        size = self.last - self.first + 1
+        used = sum(last - first + 1 for first, last in self.used)
+        data = {
+            'range': str(self.network),
+            'size': size,
+            'used': used,
+            'free': size - used,
+            'utilization': round(used * 100 / size, 2),
+            'free_blocks': [str(n) for n in self.free_blocks()],
+            'next_ip': self.next_ip(),
+        }
+        if prefixlen is not None:
+            data['next_subnet'] = self.next_subnet(prefixlen)
+        return data
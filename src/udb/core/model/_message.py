@@ -19,7 +19,7 @@ import itertools
 import json
 
 import cherrypy
-from sqlalchemy import Boolean, Column, String, and_, event, inspect
+from sqlalchemy import Boolean, Column, Index, String, and_, event, inspect, literal_column, select
 from sqlalchemy.orm import backref, declared_attr, foreign, relationship, remote
 from sqlalchemy.sql.functions import func
 from sqlalchemy.sql.schema import ForeignKey
@@ -31,6 +31,7 @@ from udb.tools.i18n import gettext as _
 from ._json import JsonMixin
 from ._search_string import SearchableMixing
 from ._timestamp import Timestamp
+from ._update import index_exists
 
 Base = cherrypy.tools.db.get_base()
 Session = cherrypy.tools.db.get_session()
@@ -142,6 +143,25 @@ class Message(JsonMixin, SearchableMixing, Base):
         if model_object:
             return model_object.summary
 
+    @classmethod
+    def get_summaries(cls, model_name, model_ids, chunk_size=500):
+        """
+        Return a dictionary with the summary of each record of the given model_name.
+        Summaries are fetched in bulk to avoid loading every record one by one.
+        """
+        relationship = cls.__mapper__.relationships.get('%s_object' % model_name)
+        if relationship is None:
+            return {}
+        model = relationship.mapper.class_
+        model_ids = list(set(model_ids))
+        summaries = {}
+        for i in range(0, len(model_ids), chunk_size):
+            rows = cls.session.execute(
+                select(model.id, model.summary).where(model.id.in_(model_ids[i : i + chunk_size]))
+            ).all()
+            summaries.update(rows)
+        return summaries
+
     @property
     def author_name(self):
         if self.author is None:
@@ -255,3 +275,22 @@ class MessageMixin:
         Object could return it self or it's parent.
         """
         return [(self.__tablename__, self.id)]
+
+
+# Literal values of change types. Must be used in queries for the database to make use of the partial index.
+CHANGE_TYPES = [literal_column("'%s'" % t) for t in (Message.TYPE_NEW, Message.TYPE_DIRTY)]
+
+# Index used to lookup changes made to a given model type.
+message_model_name_id_change_ix = Index(
+    'message_model_name_id_change_ix',
+    Message.model_name,
+    Message.id,
+    sqlite_where=Message.type.in_(CHANGE_TYPES),
+    postgresql_where=Message.type.in_(CHANGE_TYPES),
+)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_message_model_name_id_change_ix(target, conn, **kw):
+    if not index_exists(conn, message_model_name_id_change_ix.name):
+        message_model_name_id_change_ix.create(conn)
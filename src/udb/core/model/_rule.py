@@ -15,10 +15,34 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
 import cherrypy
-from sqlalchemy import Boolean, CheckConstraint, Column, SmallInteger, String, event, text
+from sqlalchemy import (
+    Boolean,
+    CheckConstraint,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    SmallInteger,
+    String,
+    Table,
+    event,
+    func,
+    inspect,
+    literal_column,
+    select,
+    text,
+    update,
+)
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql import ddl
 
@@ -27,8 +51,10 @@ from udb.tools.i18n import gettext as _
 from ._common import CommonMixin
 from ._follower import FollowerMixin
 from ._json import JsonMixin
-from ._message import MessageMixin
+from ._message import Message, MessageMixin
 from ._status import StatusMixing
+from ._timestamp import Timestamp
+from ._update import column_add, column_exists, is_sqlite
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +76,135 @@ def _list_indexes():
                 yield item
 
 
+@contextmanager
+def _statement_timeout(session, timeout):
+    """
+    Abort execution of statements running longer than `timeout` seconds within the current transaction.
+    """
+    if not timeout:
+        yield
+        return
+    conn = session.connection()
+    if is_sqlite(conn):
+        # SQLite doesn't support statement timeout. Use progress handler to interrupt the execution.
+        deadline = time.monotonic() + timeout
+        dbapi_conn = conn.connection.driver_connection
+        dbapi_conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            yield
+        finally:
+            dbapi_conn.set_progress_handler(None, 0)
+    else:
+        conn.execute(text("SET LOCAL statement_timeout = %d" % int(timeout * 1000)))
+        yield
+        # Restore the timeout for the following statements of the transaction.
+        # On error, the transaction is aborted and the rollback restore it.
+        conn.execute(text("SET LOCAL statement_timeout TO DEFAULT"))
+
+
+def _execute_parallel(session, statements, workers, timeout=None):
+    """
+    Execute each statement on a separate connection using a pool of threads.
+
+    Return a list of (rows, duration, exception) in the same order as the statements.
+    """
+    engine = session.get_bind()
+
+    def execute(statement):
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                with conn.begin():
+                    if timeout:
+                        conn.execute(text("SET LOCAL statement_timeout = %d" % int(timeout * 1000)))
+                    rows = conn.execute(text(statement)).all()
+            return rows, int((time.perf_counter() - start) * 1000), None
+        except Exception as e:
+            return None, int((time.perf_counter() - start) * 1000), e
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='linter') as executor:
+        return list(executor.map(execute, statements))
+
+
+RuleAdvice = namedtuple('RuleAdvice', ['rule_name', 'table', 'rows', 'detail', 'index'])
+
+AnalysisRow = namedtuple('AnalysisRow', ['id', 'name'])
+
+
+def _explain_scans(conn, statement):
+    """
+    Return the list of (table, alias, detail) scanned sequentially by the given statement.
+    """
+    scans = []
+    if is_sqlite(conn):
+        # SQLite only report the alias of the table.
+        aliases = {m.group(2): m.group(1) for m in re.finditer(r'\b(\w+) AS (\w+)\b', statement)}
+        for row in conn.execute(text('EXPLAIN QUERY PLAN ' + statement)):
+            m = re.match(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$', row.detail)
+            if m and m.group(1) in aliases:
+                scans.append((aliases[m.group(1)], m.group(1), row.detail))
+            elif m:
+                scans.append((m.group(1), m.group(2), row.detail))
+    else:
+        plan = conn.execute(text('EXPLAIN (FORMAT JSON) ' + statement)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop(0)
+            if node.get('Node Type') == 'Seq Scan':
+                detail = 'Seq Scan on %s' % node['Relation Name']
+                if node.get('Filter'):
+                    detail += ' Filter: %s' % node['Filter']
+                scans.append((node['Relation Name'], node.get('Alias'), detail))
+            nodes.extend(node.get('Plans', []))
+    return scans
+
+
+def _predicate_columns(statement, table, alias=None):
+    """
+    Return the columns of the table used to filter or join rows in the statement.
+    """
+    # Ignore the selected columns and the string literals.
+    m = re.search(r'\bfrom\b', statement, re.IGNORECASE)
+    statement = re.sub(r"'[^']*'", "''", statement[m.start() :] if m else statement)
+    qualifier = alias or table.name
+    columns = []
+    for m in re.finditer(r'\b(?:(\w+)\.)?(\w+)\b', statement):
+        prefix, name = m.groups()
+        if prefix not in [None, qualifier] or name not in table.c or name in columns:
+            continue
+        if table.c[name].primary_key:
+            continue
+        columns.append(name)
+    return columns[:3]
+
+
+def _create_index_statement(dialect, table, columns):
+    """
+    Return the statement creating an index on the given columns. Identifiers are quoted when required.
+    """
+    preparer = dialect.identifier_preparer
+    return 'CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+        preparer.quote('%s_%s_ix' % (table.name, '_'.join(columns))),
+        preparer.format_table(table),
+        ', '.join(preparer.quote(column) for column in columns),
+    )
+
+
+# Materialized list of records infringing the rules.
+rule_violation = Table(
+    'rule_violation',
+    Base.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('rule_id', Integer, ForeignKey('rule.id', ondelete='CASCADE'), nullable=False),
+    Column('model_name', String, nullable=False),
+    Column('model_id', Integer, nullable=False),
+    Column('name', String, nullable=True),
+    Index('rule_violation_rule_id_ix', 'rule_id'),
+)
+
+
 class RuleError(Exception):
     def __init__(self, row):
         self.id = row.id
@@ -86,6 +241,31 @@ class RuleConstraint:
         RuleConstraint._inventory[self.name] = self
 
 
+class RuleAnalysis:
+    """
+    Create a builtin rule evaluated by a python function instead of an SQL
+    statement. Used for analysis too expensive to be expressed in SQL.
+    The function must return a list of (id, name) of the records infringing the rule.
+    """
+
+    _inventory = {}
+
+    def __init__(self, name, model, func, depends=None, severity=None, info=None):
+        assert name
+        assert callable(func)
+        self.name = name
+        model_name = getattr(model, '__tablename__', model)
+        assert model_name and isinstance(model_name, str), 'rule required a valid model name'
+        self.model_name = model_name
+        self.func = func
+        # Name of the models used by the analysis.
+        self.depends = depends or [model_name]
+        self.severity = severity or Rule.SEVERITY_SOFT
+        self.info = info or {}
+        # Register rule
+        RuleAnalysis._inventory[self.name] = self
+
+
 class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Base):
     SEVERITY_SOFT = 0
     SEVERITY_ENFORCED = 1
@@ -93,6 +273,7 @@ class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Ba
     TYPE_SQL = 0
     TYPE_UNIQUE = 1
     TYPE_CHECK = 2
+    TYPE_ANALYSIS = 3
 
     name = Column(String, nullable=False, unique=True)
     model_name = Column(String, nullable=False)
@@ -102,13 +283,22 @@ class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Ba
     severity = Column(SmallInteger, nullable=False, default=SEVERITY_SOFT, server_default=str(SEVERITY_SOFT))
     type = Column(SmallInteger, nullable=False, default=TYPE_SQL, server_default=str(TYPE_SQL))
     field = Column(String, nullable=True)
+    # Variant of the statement limited to a single record identified by `:object_id`.
+    object_statement = Column(String, nullable=True)
+    # Last message and time when the violations of this rule were evaluated.
+    linter_message_id = Column(Integer, nullable=True)
+    linter_date = Column(Timestamp(timezone=True), nullable=True)
+    # Execution time in milliseconds of the last evaluation.
+    linter_duration = Column(Integer, nullable=True)
+    # Number of consecutive evaluations that failed or timed out.
+    linter_failures = Column(SmallInteger, nullable=False, default=0, server_default='0')
 
     @hybrid_property
     def summary(self):
         return self.name
 
     @classmethod
-    def verify(cls, obj=None, errors=None, severity=None):
+    def verify(cls, obj=None, errors=None, severity=None, workers=None):
         """
         Run linter rule.
         When `obj` is defined, return rule related to this specific model
@@ -118,6 +308,10 @@ class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Ba
         When `errors` is set to "raise", will raise an exception on first error.
 
         When `severity` is defined filter rule base of the given severity.
+
+        When `workers` is greater then one, rules are executed concurrently on
+        separate connections. Only used to verify every records on database other
+        then SQLite.
         """
         assert obj is None or (hasattr(obj.__class__, '__tablename__') and obj.id), 'obj must be None or a model'
         assert errors is None or errors == 'raise'
@@ -130,20 +324,223 @@ class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Ba
         if obj:
             model_name = obj.__class__.__tablename__
             query_rules = query_rules.filter(Rule.model_name == model_name)
+        matching_rules = query_rules.all()
+
+        # Execute each rule concurrently and merge the results.
+        if obj is None and errors is None and len(matching_rules) > 1 and cls._use_parallel(workers):
+            results = _execute_parallel(Rule.session, [rule._wrap_statement() for rule in matching_rules], workers)
+            for unused, unused, e in results:
+                if e:
+                    raise e
+            return [row for rows, unused, unused in results for row in rows]
 
         # Combine matching rules with UNION ALL to return list of errors.
-        matching_rules = query_rules.all()
         sql = ' UNION ALL '.join(rule._wrap_statement(obj) for rule in matching_rules)
         # If the SQL is empty, we don't have anything to execute.
         if not sql:
             return []
+        params = {'object_id': obj.id} if obj else {}
 
         # On error do something for each row.
         if errors == 'raise':
-            row = Rule.session.execute(text(sql)).first()
+            row = Rule.session.execute(text(sql), params).first()
             if row:
                 raise RuleError(row)
-        return Rule.session.execute(text(sql)).all()
+            return []
+        return Rule.session.execute(text(sql), params).all()
+
+    @classmethod
+    def _use_parallel(cls, workers):
+        """
+        Check if rules could be executed concurrently. SQLite doesn't benefit from it.
+        """
+        return bool(workers and workers > 1 and not is_sqlite(Rule.session.connection()))
+
+    @classmethod
+    def refresh_violations(cls, full=False, timeout=None, max_failures=None, workers=None):
+        """
+        Evaluate the rules and store the records infringing them into `rule_violation` table.
+
+        Unless `full` is True, only the rules related to data modified since
+        their last evaluation are evaluated. Return the number of rules evaluated.
+
+        Each rule is evaluated separately to measure it's execution time. When
+        `timeout` is defined, the execution of a rule is interrupted after the
+        given number of seconds. Rules failing `max_failures` times in a row get
+        disabled. When `workers` is greater then one, rules are evaluated
+        concurrently on separate connections.
+        """
+        session = Rule.session
+        last_message_id = session.query(func.max(Message.id)).scalar() or 0
+        rules = Rule.query.filter(
+            Rule.estatus == Rule.STATUS_ENABLED, Rule.type.in_([Rule.TYPE_SQL, Rule.TYPE_ANALYSIS])
+        ).all()
+        # Remove violations of disabled or deleted rules.
+        session.execute(rule_violation.delete().where(rule_violation.c.rule_id.not_in([rule.id for rule in rules])))
+        # Lookup the data modified since the oldest evaluation.
+        modified = {}
+        if not full:
+            min_message_id = min((rule.linter_message_id or 0 for rule in rules), default=0)
+            modified = dict(
+                session.query(Message.model_name, func.max(Message.id))
+                .filter(Message.id > min_message_id)
+                .group_by(Message.model_name)
+                .all()
+            )
+        rules = [rule for rule in rules if full or rule._is_modified(modified)]
+        sql_rules = [rule for rule in rules if rule.type == Rule.TYPE_SQL]
+        parallel = len(sql_rules) > 1 and cls._use_parallel(workers)
+        session.commit()
+        # Execute the SQL rules concurrently then store the results one by one.
+        results = {}
+        if parallel:
+            outcomes = _execute_parallel(session, [rule.statement for rule in sql_rules], workers, timeout)
+            results = dict(zip([rule.id for rule in sql_rules], outcomes))
+        count = 0
+        for rule in rules:
+            rows, duration, e = results[rule.id] if rule.id in results else rule._execute(timeout)
+            if e:
+                logger.warning('fail to evaluate rule %s', rule.name, exc_info=e)
+                rule._linter_failed(duration, max_failures)
+                continue
+            rule._linter_success(rows, duration, last_message_id)
+            count += 1
+        return count
+
+    def _execute(self, timeout=None):
+        """
+        Execute the rule statement within the current session.
+
+        Return (rows, duration, exception).
+        """
+        statement = self.statement
+        start = time.perf_counter()
+        try:
+            if self.type == Rule.TYPE_ANALYSIS:
+                # Analysis are not interrupted by the timeout.
+                rows = [AnalysisRow(*row) for row in dict(RuleAnalysis._inventory[self.name].func()).items()]
+                return rows, int((time.perf_counter() - start) * 1000), None
+            with _statement_timeout(Rule.session, timeout):
+                rows = Rule.session.execute(text(statement)).all()
+            return rows, int((time.perf_counter() - start) * 1000), None
+        except Exception as e:
+            Rule.session.rollback()
+            return None, int((time.perf_counter() - start) * 1000), e
+
+    def _linter_success(self, rows, duration, last_message_id):
+        """
+        Replace the violations of this rule by the given rows.
+        """
+        rule_id, model_name = self.id, self.model_name
+        session = Rule.session
+        session.execute(rule_violation.delete().where(rule_violation.c.rule_id == rule_id))
+        if rows:
+            session.execute(
+                rule_violation.insert(),
+                [{'rule_id': rule_id, 'model_name': model_name, 'model_id': row.id, 'name': row.name} for row in rows],
+            )
+        # Use plain UPDATE statement to avoid creating an audit message.
+        session.execute(
+            update(Rule)
+            .where(Rule.id == rule_id)
+            .values(
+                linter_message_id=last_message_id,
+                linter_date=datetime.now(timezone.utc),
+                linter_duration=duration,
+                linter_failures=0,
+                modified_at=Rule.modified_at,
+            )
+        )
+        session.commit()
+
+    def _linter_failed(self, duration, max_failures=None):
+        """
+        Keep track of failed evaluation and disable the rule when failing too many times.
+        """
+        failures = (self.linter_failures or 0) + 1
+        if max_failures and failures >= max_failures:
+            # Disable the rule with a message to notify the followers.
+            self.status = Rule.STATUS_DISABLED
+            self.linter_duration = duration
+            self.linter_failures = failures
+            self.add_message(
+                Message(
+                    body=_('Rule disabled automatically after failing to be evaluated %s times in a row.') % failures
+                )
+            )
+            self.add()
+        else:
+            Rule.session.execute(
+                update(Rule)
+                .where(Rule.id == self.id)
+                .values(linter_duration=duration, linter_failures=failures, modified_at=Rule.modified_at)
+            )
+        Rule.session.commit()
+
+    @classmethod
+    def get_linter_date(cls):
+        """
+        Return the time of the oldest evaluation of the enabled rules. None if some rules were never evaluated.
+        """
+        row = (
+            Rule.query.with_entities(func.min(Rule.linter_date), func.count(Rule.id) - func.count(Rule.linter_date))
+            .filter(Rule.estatus == Rule.STATUS_ENABLED, Rule.type.in_([Rule.TYPE_SQL, Rule.TYPE_ANALYSIS]))
+            .first()
+        )
+        return None if row[1] else row[0]
+
+    def _is_modified(self, modified):
+        """
+        Check if any of the tables used by this rule was modified since last evaluation.
+        """
+        if self.linter_message_id is None:
+            return True
+        if self.type == Rule.TYPE_ANALYSIS:
+            analysis = RuleAnalysis._inventory.get(self.name)
+            depends = analysis.depends if analysis else []
+            return any(
+                message_id > self.linter_message_id and model_name in depends
+                for model_name, message_id in modified.items()
+            )
+        return any(
+            message_id > self.linter_message_id and re.search(r'\b%s\b' % re.escape(model_name), self.statement, re.I)
+            for model_name, message_id in modified.items()
+        )
+
+    @classmethod
+    def advise(cls, min_rows=1000):
+        """
+        Explain the statement of enabled rules to find sequential scans on
+        tables with at least `min_rows` rows. Return a list of RuleAdvice with
+        the index to be created when possible.
+        """
+        conn = Rule.session.connection()
+        tables = Base.metadata.tables
+        counts = {}
+        advices = []
+        rules = Rule.query.filter(Rule.estatus == Rule.STATUS_ENABLED, Rule.type == Rule.TYPE_SQL).order_by(Rule.name)
+        for rule in rules:
+            try:
+                scans = _explain_scans(conn, rule.statement)
+            except Exception:
+                logger.warning('fail to explain rule %s', rule.name, exc_info=1)
+                continue
+            for table_name, alias, detail in scans:
+                if table_name not in tables:
+                    continue
+                table = tables[table_name]
+                if table_name not in counts:
+                    counts[table_name] = conn.execute(select(func.count()).select_from(table)).scalar()
+                if counts[table_name] < min_rows:
+                    continue
+                # Suggest an index unless one already exists for these columns.
+                index = None
+                columns = _predicate_columns(rule.statement, table, alias)
+                existing = [i['column_names'][: len(columns)] for i in inspect(conn).get_indexes(table_name)]
+                if columns and columns not in existing:
+                    index = _create_index_statement(conn.dialect, table, columns)
+                advices.append(RuleAdvice(rule.name, table_name, counts[table_name], detail, index))
+        return advices
 
     def _wrap_statement(self, obj=None, new_statement=None):
         name = self.name.replace("'", "''")
@@ -152,13 +549,34 @@ class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Ba
         severity = int(self.severity or Rule.SEVERITY_SOFT)
         model_name = self.model_name
         statement = new_statement or self.statement
+        # When validating a single record, use the variant of the statement filtering on the object id.
+        if obj and self.object_statement and not new_statement:
+            statement = self.object_statement
         # Support 2 columns (id, summary)
         sql = f"SELECT '{name}' as rule_name, '{description}' as description, id, '{model_name}' as model_name, name, '{field}' as field, {severity} as severity FROM ({statement}) as r{self.id}"
         # Add filter if an object is specified.
         if obj:
-            sql += f" WHERE id = {obj.id}"
+            sql += " WHERE id = :object_id"
         return sql
 
+    @staticmethod
+    def _verify_fields(statement, params=None):
+        """
+        Execute the statement to verify the column name.
+        """
+        fields = list(Rule.session.execute(text(statement), params or {}).keys())
+        expected_fields = [
+            'id',
+            'name',
+        ]
+        if fields != expected_fields:
+            raise ValueError(
+                _(
+                    "your statement returned %s column(s) label as %s, but it's expected to return 2 columns labeled as: %s"
+                )
+                % (len(fields), ', '.join(fields), ', '.join(expected_fields)),
+            )
+
     def _validate(self):
         """
         Used to validate the SQL statement before saving it into database to make sure it's a "valid" SQL.
@@ -179,19 +597,7 @@ class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Ba
 
         # Execute the raw version to verify the column name
         try:
-            fields = list(Rule.session.execute(text(self.statement)).keys())
-            expected_fields = [
-                'id',
-                'name',
-            ]
-            if fields != expected_fields:
-                raise ValueError(
-                    'statement',
-                    _(
-                        "your statement returned %s column(s) label as %s, but it's expected to return 2 columns labeled as: %s"
-                    )
-                    % (len(fields), ', '.join(fields), ', '.join(expected_fields)),
-                )
+            self._verify_fields(self.statement)
         except Exception as e:
             raise ValueError('statement', str(e))
 
@@ -202,13 +608,27 @@ class Rule(CommonMixin, JsonMixin, MessageMixin, FollowerMixin, StatusMixing, Ba
         except Exception as e:
             raise ValueError('statement', str(e))
 
+        # Validate the statement used to verify a single record.
+        if self.object_statement:
+            if not self.object_statement.lower().startswith('select '):
+                raise ValueError('object_statement', _('your SQL statement should start with SELECT'))
+            if ':object_id' not in self.object_statement:
+                raise ValueError('object_statement', _('your SQL statement should filter records using :object_id'))
+            try:
+                self._verify_fields(self.object_statement, {'object_id': 0})
+            except Exception as e:
+                raise ValueError('object_statement', str(e))
+
 
 @event.listens_for(Rule, "before_update")
 def before_update(mapper, connection, instance):
     """
     Validate SQL Statement
     """
-    instance._validate()
+    if instance.attr_has_changes('statement', 'object_statement', 'model_name', 'type'):
+        instance._validate()
+    # Force evaluation of the rule by the linter.
+    instance.linter_message_id = None
 
 
 @event.listens_for(Rule, "before_insert")
@@ -219,6 +639,24 @@ def before_insert(mapper, connection, instance):
     instance._validate()
 
 
+@event.listens_for(Base.metadata, 'after_create')
+def create_object_statement_field(target, conn, **kw):
+    if not column_exists(conn, Rule.object_statement):
+        column_add(conn, Rule.object_statement)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_linter_fields(target, conn, **kw):
+    if not column_exists(conn, Rule.linter_message_id):
+        column_add(conn, Rule.linter_message_id)
+    if not column_exists(conn, Rule.linter_date):
+        column_add(conn, Rule.linter_date)
+    if not column_exists(conn, Rule.linter_duration):
+        column_add(conn, Rule.linter_duration)
+    if not column_exists(conn, Rule.linter_failures):
+        column_add(conn, Rule.linter_failures)
+
+
 @event.listens_for(Base.metadata, 'after_create')
 def create_update_rule(target, conn, **kw):
     """
@@ -241,18 +679,42 @@ def create_update_rule(target, conn, **kw):
             if hasattr(statement, '__call__'):
                 statement = statement()
             sql = str(statement.compile(conn.engine, compile_kwargs={"literal_binds": True}))
+            # Generate SQL with the object filter pushed into the statement.
+            table = Base.metadata.tables[rule.model_name]
+            object_statement = statement.where(table.c.id == literal_column(':object_id'))
+            object_sql = str(object_statement.compile(conn.engine, compile_kwargs={"literal_binds": True}))
             # Update database
             obj.description = str(rule.info.get('description', ''))
             obj.severity = rule.severity
             obj.field = str(rule.info.get('field', None))
             obj.model_name = rule.model_name
             obj.statement = sql
+            obj.object_statement = object_sql
             obj.builtin = True
             obj.type = Rule.TYPE_SQL
             obj.add().flush()
         except Exception:
             logger.exception('fail to add rule in database')
 
+    # For each analysis register, make sure to create it in database
+    for analysis in RuleAnalysis._inventory.values():
+        obj = Rule.query.filter(Rule.name == analysis.name).first()
+        if not obj:
+            obj = Rule(name=analysis.name)
+        try:
+            # Update database
+            obj.description = str(analysis.info.get('description', ''))
+            obj.severity = analysis.severity
+            obj.field = str(analysis.info.get('field', None))
+            obj.model_name = analysis.model_name
+            obj.statement = "ANALYSIS %s" % ', '.join(analysis.depends)
+            obj.object_statement = None
+            obj.builtin = True
+            obj.type = Rule.TYPE_ANALYSIS
+            obj.add().flush()
+        except Exception:
+            logger.exception('fail to add analysis rule in database')
+
     # For each CheckConstraint, create rule to be displayed in UI.
     for constraint in _list_constraints():
         obj = Rule.query.filter(Rule.name == constraint.name).first()
@@ -24,22 +24,30 @@ from sqlalchemy import (
     Computed,
     ForeignKeyConstraint,
     Index,
+    Table,
     and_,
+    bindparam,
     case,
+    delete,
     event,
+    false,
     func,
+    insert,
+    inspect,
+    literal,
     or_,
+    select,
     tuple_,
     update,
 )
 from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
-from sqlalchemy.orm import aliased, relationship, validates
+from sqlalchemy.orm import aliased, object_session, relationship, validates
 from sqlalchemy.types import Boolean, Integer, String
 
 import udb.tools.db  # noqa: import cherrypy.tools.db
 from udb.tools.i18n import gettext_lazy as _
 
-from ._cidr import CidrType, InetType
+from ._cidr import CidrType, InetType, supernet_of, supernet_of_or_equals
 from ._common import CommonMixin
 from ._events import listens_for_after_flush, listens_for_before_flush
 from ._follower import FollowerMixin
@@ -48,6 +56,8 @@ from ._message import MessageMixin
 from ._network_id import NetworkId
 from ._search_string import SearchableMixing
 from ._status import StatusMixing
+from ._subnet_index import SubnetIndex, nearest_supernets, range_sort_key
+from ._update import column_add, column_exists, index_exists, index_gist_add, is_sqlite
 from ._vrf import Vrf
 
 Base = cherrypy.tools.db.get_base()
@@ -140,6 +150,10 @@ class Subnet(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixin,
         doc="store string representation of the subnet ranges used for search",
     )
 
+    # First and last address of the range. Used for containment lookup with B-tree index.
+    _range_start = Column(InetType, Computed(func.inet(func.host(range))))
+    _range_end = Column(InetType, Computed(func.inet(func.host(func.broadcast(range)))))
+
     __table_args__ = (
         # Index for parent child inheritance.
         Index(
@@ -304,18 +318,74 @@ class Subnet(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixin,
             raise ValueError('rir_status', "`%s` " % value + _('is not a valid RIR status'))
         return value
 
+    @classmethod
+    def _supernet_ids(cls, vrf_id, value, strict=False):
+        """
+        Lookup the in-memory index to find the subnets containing the given IP
+        address or network. Return None when the index cannot be used.
+        """
+        try:
+            return subnet_index.lookup(vrf_id, value, strict, Session().info.get('subnet_index', {}))
+        except ValueError:
+            return None
+
+    @classmethod
+    def in_subtree(cls, subnet_id):
+        """
+        Return an expression verifying if a subnet is the given subnet or one of it's descendants.
+        """
+        return cls.id.in_(select(subnet_closure.c.descendant_id).where(subnet_closure.c.ancestor_id == subnet_id))
+
+    @property
+    def ancestors(self):
+        """
+        Return the parents of this subnet starting from the root.
+        """
+        return (
+            Subnet.query.join(subnet_closure, subnet_closure.c.ancestor_id == Subnet.id)
+            .filter(subnet_closure.c.descendant_id == self.id, subnet_closure.c.depth > 0)
+            .order_by(subnet_closure.c.depth.desc())
+            .all()
+        )
+
+    @property
+    def descendants(self):
+        """
+        Return the children of this subnet recursively.
+        """
+        return (
+            Subnet.query.join(subnet_closure, subnet_closure.c.descendant_id == Subnet.id)
+            .filter(subnet_closure.c.ancestor_id == self.id, subnet_closure.c.depth > 0)
+            .order_by(subnet_closure.c.depth, Subnet.range)
+            .all()
+        )
+
+    @property
+    def subtree_count(self):
+        """
+        Return the number of children of this subnet recursively.
+        """
+        return Subnet.session.execute(
+            select(func.count()).where(subnet_closure.c.ancestor_id == self.id, subnet_closure.c.depth > 0)
+        ).scalar()
+
     @hybrid_method
     def _find_parent(cls, not_id=None):
         """Subquery to find imediate parent of Subnet."""
         p1 = aliased(Subnet)
         query = p1.query.with_entities(p1.id, p1.evlan, p1.el2vni, p1.el3vni, p1.estatus, p1.range, p1.depth).filter(
-            func.subnet_of(cls.range, p1.range),
+            range_contains(p1, cls if isinstance(cls, type) else cls.range, strict=True),
             p1.estatus != Subnet.STATUS_DELETED,
         )
         if cls.id:
             query = query.filter(p1.id != cls.id)
         assert cls.vrf_id or cls.vrf.id, 'vrf_id or vrf is required for this query'
         query = query.filter(p1.vrf_id == (cls.vrf_id or cls.vrf.id))
+        # For a single subnet, only consider the candidates from the index.
+        if not isinstance(cls, type):
+            ids = Subnet._supernet_ids(cls.vrf_id or cls.vrf.id, cls.range, strict=True)
+            if ids is not None:
+                query = query.filter(p1.id.in_(ids))
         if not_id:
             query = query.filter(p1.id != not_id)
         return query.order_by(p1.range.desc()).limit(1)
@@ -339,6 +409,197 @@ class Subnet(CommonMixin, JsonMixin, StatusMixing, MessageMixin, FollowerMixin,
             super().add_change(new_message)
 
 
+def range_bounds(value):
+    """
+    Return the first and last address of the given network.
+    """
+    if not value:
+        return None, None
+    n = ipaddress.ip_network(value)
+    return n.network_address.compressed, n.broadcast_address.compressed
+
+
+def _range_operands(value):
+    """
+    Return the network, first and last address expressions of `value`.
+    """
+    if hasattr(value, '_range_start'):
+        # Subnet entity or alias
+        return value.range, value._range_start, value._range_end
+    if isinstance(value, str):
+        start, end = range_bounds(value)
+        return literal(value, CidrType), literal(start, InetType), literal(end, InetType)
+    # IP Address column
+    return value, value, value
+
+
+def range_contains(container, value, strict=False):
+    """
+    Return an expression verifying if the range of `container` contains
+    `value`. Both could be a Subnet entity, an IP address column or a network
+    string. Addresses of different family never match.
+
+    On Postgresql the expression make use of the GiST index of the network
+    columns. On SQLite, it make use of the first and last address of subnets.
+    """
+    if container is None or value is None or (isinstance(value, str) and not value):
+        return false()
+    op = supernet_of if strict else supernet_of_or_equals
+    return op(*_range_operands(container), *_range_operands(value))
+
+
+def _load_subnet_ranges():
+    # Use a dedicated connection to only load committed subnets.
+    with Session.get_bind().connect() as conn:
+        return conn.execute(
+            select(Subnet.id, Subnet.vrf_id, Subnet.range).where(Subnet.estatus != Subnet.STATUS_DELETED)
+        ).all()
+
+
+subnet_index = SubnetIndex(_load_subnet_ranges)
+
+
+@event.listens_for(Subnet, 'after_insert')
+@event.listens_for(Subnet, 'after_update')
+@event.listens_for(Subnet, 'after_delete')
+def subnet_index_after_update(mapper, conn, obj):
+    # Keep track of subnet modified by this transaction until commit.
+    deleted = obj.estatus == Subnet.STATUS_DELETED or inspect(obj).deleted
+    object_session(obj).info.setdefault('subnet_index', {})[obj.id] = None if deleted else (obj.vrf_id, obj.range)
+
+
+@event.listens_for(Session, 'after_commit')
+def subnet_index_after_commit(session):
+    changes = session.info.pop('subnet_index', None)
+    if changes:
+        subnet_index.update(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def subnet_index_after_rollback(session):
+    session.info.pop('subnet_index', None)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+@event.listens_for(Base.metadata, 'after_drop')
+def subnet_index_clear(target, conn, **kw):
+    subnet_index.clear()
+
+
+# Ancestors of every subnets. Each subnet is also it's own ancestor with depth 0.
+subnet_closure = Table(
+    'subnet_closure',
+    Base.metadata,
+    Column('ancestor_id', Integer, primary_key=True),
+    Column('descendant_id', Integer, primary_key=True),
+    Column('depth', Integer, nullable=False),
+    Index('subnet_closure_descendant_id_ix', 'descendant_id', 'depth'),
+)
+
+
+def _closure_move(conn, changes):
+    """
+    Move subtree of subnets below their new parent. `changes` is a list of
+    {'b_id': subnet_id, 'b_parent_id': parent_id} sorted parent first.
+    """
+    subtree = select(subnet_closure.c.descendant_id).where(subnet_closure.c.ancestor_id == bindparam('b_id'))
+    detach = delete(subnet_closure).where(
+        subnet_closure.c.descendant_id.in_(subtree),
+        subnet_closure.c.ancestor_id.not_in(subtree),
+    )
+    conn.execute(detach, [{'b_id': c['b_id']} for c in changes])
+    _closure_attach(conn, [c for c in changes if c['b_parent_id']])
+
+
+def _closure_attach(conn, changes):
+    if not changes:
+        return
+    a = subnet_closure.alias('a')
+    d = subnet_closure.alias('d')
+    attach = insert(subnet_closure).from_select(
+        ['ancestor_id', 'descendant_id', 'depth'],
+        select(a.c.ancestor_id, d.c.descendant_id, a.c.depth + d.c.depth + 1)
+        .select_from(a)
+        .join(d, d.c.ancestor_id == bindparam('b_id'))
+        .where(a.c.descendant_id == bindparam('b_parent_id')),
+    )
+    conn.execute(attach, changes)
+
+
+@event.listens_for(Subnet, 'after_insert')
+def subnet_closure_after_insert(mapper, conn, obj):
+    conn.execute(insert(subnet_closure).values(ancestor_id=obj.id, descendant_id=obj.id, depth=0))
+    if obj.parent_id:
+        _closure_attach(conn, [{'b_id': obj.id, 'b_parent_id': obj.parent_id}])
+
+
+@event.listens_for(Subnet, 'after_update')
+def subnet_closure_after_update(mapper, conn, obj):
+    if obj.attr_has_changes('parent_id'):
+        _closure_move(conn, [{'b_id': obj.id, 'b_parent_id': obj.parent_id}])
+
+
+@event.listens_for(Subnet, 'after_delete')
+def subnet_closure_after_delete(mapper, conn, obj):
+    conn.execute(
+        delete(subnet_closure).where(
+            or_(subnet_closure.c.ancestor_id == obj.id, subnet_closure.c.descendant_id == obj.id)
+        )
+    )
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_subnet_closure(target, conn, **kw):
+    # Populate the closure table of existing database.
+    if conn.execute(select(subnet_closure.c.ancestor_id).limit(1)).first():
+        return
+    tree = select(
+        Subnet.id.label('ancestor_id'),
+        Subnet.id.label('descendant_id'),
+        literal(0).label('depth'),
+    ).cte('tree', recursive=True)
+    child = aliased(Subnet)
+    tree = tree.union_all(
+        select(tree.c.ancestor_id, child.id, tree.c.depth + 1).where(child.parent_id == tree.c.descendant_id)
+    )
+    conn.execute(insert(subnet_closure).from_select(['ancestor_id', 'descendant_id', 'depth'], select(tree)))
+
+
+subnet_vrf_id_range_ix = Index(
+    'subnet_vrf_id_range_ix',
+    Subnet.vrf_id,
+    Subnet._range_start,
+    Subnet._range_end,
+)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_subnet_range_fields(target, conn, **kw):
+    if not column_exists(conn, Subnet._range_start):
+        column_add(conn, Subnet._range_start)
+    if not column_exists(conn, Subnet._range_end):
+        column_add(conn, Subnet._range_end)
+    if not index_exists(conn, subnet_vrf_id_range_ix.name):
+        subnet_vrf_id_range_ix.create(conn)
+
+
+# Index used to list the children of a subnet.
+subnet_parent_id_ix = Index('subnet_parent_id_ix', Subnet.parent_id)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_subnet_parent_id_ix(target, conn, **kw):
+    if not index_exists(conn, subnet_parent_id_ix.name):
+        subnet_parent_id_ix.create(conn)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_subnet_range_gist_ix(target, conn, **kw):
+    # On Postgresql, create a GiST index to lookup containing subnets.
+    if not is_sqlite(conn) and not index_exists(conn, 'subnet_range_gist_ix'):
+        index_gist_add(conn, 'subnet_range_gist_ix', Subnet.range)
+
+
 # Create a unique index subnet, vrf, estatus for foreignkey
 Index(
     'subnet_estatus_unique_ix',
@@ -383,6 +644,59 @@ CheckConstraint(
 )
 
 
+def _assign_parents(conn, vrf_id, scope, children, not_id=None):
+    """
+    Re-assign the parent of the given children subnets. `children` are rows of
+    (id, range, parent_id) within the `scope` network.
+
+    Instead of searching the parent of each children with a subquery, the
+    candidates are loaded once and matched in memory. Only children with a new
+    parent get updated.
+    """
+    if not children:
+        return
+    query = select(Subnet.id, Subnet.range).where(
+        Subnet.vrf_id == vrf_id,
+        Subnet.estatus != Subnet.STATUS_DELETED,
+        # Containers of a children are either within the scope or containing it.
+        or_(range_contains(scope, Subnet), range_contains(Subnet, scope)),
+    )
+    if not_id:
+        query = query.where(Subnet.id != not_id)
+    parents = nearest_supernets(conn.execute(query).all(), [(c.id, c.range) for c in children], strict=True)
+    # Children are sorted by range to update parents before their own children.
+    changes = [
+        {'b_id': c.id, 'b_parent_id': parents[c.id]}
+        for c in sorted(children, key=lambda c: range_sort_key(c.range))
+        if parents[c.id] != c.parent_id
+    ]
+    if not changes:
+        return
+    p1 = aliased(Subnet)
+    assign_parent = (
+        update(Subnet)
+        .where(Subnet.id == bindparam('b_id'))
+        .values(
+            {
+                tuple_(
+                    Subnet.parent_id,
+                    Subnet.parent_evlan,
+                    Subnet.parent_el2vni,
+                    Subnet.parent_el3vni,
+                    Subnet.parent_estatus,
+                    Subnet.parent_range,
+                    Subnet.parent_depth,
+                )
+                .self_group(): select(p1.id, p1.evlan, p1.el2vni, p1.el3vni, p1.estatus, p1.range, p1.depth)
+                .where(p1.id == bindparam('b_parent_id'))
+                .scalar_subquery()
+            }
+        )
+    )
+    conn.execute(assign_parent, changes)
+    _closure_move(conn, changes)
+
+
 @listens_for_before_flush(Subnet)
 def subnet_before_flush(session, flush_context, obj):
     # Trigger update of subnet search string.
@@ -418,32 +732,19 @@ def subnet_before_insert(mapper, conn, obj):
         # 2. When a parent get updated, we need to re-assigned childrens to another parent.
         #
         if obj.id:
-            unassign_children = (
-                update(Subnet)
-                .filter(
+            children = conn.execute(
+                select(Subnet.id, Subnet.range, Subnet.parent_id).where(
                     Subnet.id != obj.id,
                     Subnet.slave.is_(False),
                     Subnet.vrf_id == obj.vrf_id,
                     Subnet.parent_id == obj.id,
                     Subnet.estatus != Subnet.STATUS_DELETED,
                 )
-                .values(
-                    {
-                        tuple_(
-                            Subnet.parent_id,
-                            Subnet.parent_evlan,
-                            Subnet.parent_el2vni,
-                            Subnet.parent_el3vni,
-                            Subnet.parent_estatus,
-                            Subnet.parent_range,
-                            Subnet.parent_depth,
-                        )
-                        .self_group(): Subnet._find_parent(not_id=obj.id)
-                        .scalar_subquery()
-                    }
-                )
-            )
-            conn.execute(unassign_children, execution_options={'synchronize_session': False})
+            ).all()
+            # Children are within the previous range.
+            previous = inspect(obj).attrs.range.history.deleted
+            scope = previous[0] if previous and previous[0] else obj.range
+            _assign_parents(conn, obj.vrf_id, scope, children, not_id=obj.id)
 
 
 @listens_for_after_flush(Subnet)
@@ -453,29 +754,14 @@ def subnet_after_flush(session, flush_context, obj):
     #
     # 1. When a subnet get inserted or updated, we need to re-assign children subnet to our new subnet.
     #
-    assign_children = (
-        update(Subnet)
-        .filter(
+    conn = session.connection()
+    children = conn.execute(
+        select(Subnet.id, Subnet.range, Subnet.parent_id).where(
             Subnet.id != obj.id,
             Subnet.slave.is_(False),
             Subnet.vrf_id == obj.vrf_id,
-            func.subnet_of(Subnet.range, obj.range),
+            range_contains(obj.range, Subnet, strict=True),
             Subnet.estatus != Subnet.STATUS_DELETED,
         )
-        .values(
-            {
-                tuple_(
-                    Subnet.parent_id,
-                    Subnet.parent_evlan,
-                    Subnet.parent_el2vni,
-                    Subnet.parent_el3vni,
-                    Subnet.parent_estatus,
-                    Subnet.parent_range,
-                    Subnet.parent_depth,
-                )
-                .self_group(): Subnet._find_parent()
-                .scalar_subquery()
-            }
-        )
-    )
-    session.execute(assign_children, execution_options={'synchronize_session': False})
+    ).all()
+    _assign_parents(conn, obj.vrf_id, obj.range, children)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+In-memory index of subnet ranges used to find the best matching subnet of an
+IP address or a network without evaluating every subnet of the VRF.
+
+The index only reflect committed data. Subnets flushed by the current
+transaction are kept in the session until commit. Lookups return candidate
+identifiers that must still be validated against the database.
+'''
+import ipaddress
+import threading
+
+
+def _network(value):
+    if isinstance(value, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+        return value
+    return ipaddress.ip_network(value, strict=False)
+
+
+def range_sort_key(value):
+    """
+    Sort key of networks by family, first address and broader network first.
+    """
+    network = _network(value)
+    return network.version, int(network.network_address), -int(network.broadcast_address)
+
+
+def nearest_supernets(containers, values, strict=False):
+    """
+    Find the most specific container of each value with a single sweep over
+    the sorted ranges. `containers` and `values` are lists of (key, network).
+    When `strict` is True, a container equals to the value is ignored.
+
+    Return a dict of value key to container key or None.
+    """
+    containers = sorted((range_sort_key(v), k) for k, v in containers)
+    values = sorted((range_sort_key(v), k) for k, v in values)
+    result = {}
+    stack = []
+    idx = 0
+    for sort_key, key in values:
+        version, first, last = sort_key[0], sort_key[1], -sort_key[2]
+        # Push containers sorted before this value. Networks are either nested or disjoint.
+        while idx < len(containers) and containers[idx][0] <= sort_key:
+            (c_version, c_first, c_last), c_key = containers[idx]
+            c_last = -c_last
+            while stack and not (stack[-1][0] == c_version and stack[-1][2] >= c_last):
+                stack.pop()
+            stack.append((c_version, c_first, c_last, c_key))
+            idx += 1
+        # Drop containers ending before this value.
+        while stack and not (stack[-1][0] == version and stack[-1][2] >= last):
+            stack.pop()
+        found = None
+        for c_version, c_first, c_last, c_key in reversed(stack):
+            if not strict or c_first != first or c_last != last:
+                found = c_key
+                break
+        result[key] = found
+    return result
+
+
+class RadixTree:
+    """
+    Binary radix tree of IP networks. Each node represent a prefix and hold the
+    keys of networks defined with this prefix.
+    """
+
+    def __init__(self):
+        # Node are [child0, child1, keys]
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+
+    def _walk(self, network, create=False):
+        node = self._roots[network.version]
+        value = int(network.network_address)
+        max_prefixlen = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            bit = (value >> (max_prefixlen - depth - 1)) & 1
+            if node[bit] is None:
+                if not create:
+                    return None
+                node[bit] = [None, None, None]
+            node = node[bit]
+        return node
+
+    def add(self, network, key):
+        node = self._walk(network, create=True)
+        if node[2] is None:
+            node[2] = set()
+        node[2].add(key)
+
+    def discard(self, network, key):
+        node = self._walk(network)
+        if node is not None and node[2]:
+            node[2].discard(key)
+
+    def supernets(self, network, strict=False):
+        """
+        Return keys of networks containing the given network. Most specific first.
+        """
+        found = []
+        node = self._roots[network.version]
+        value = int(network.network_address)
+        max_prefixlen = network.max_prefixlen
+        end = network.prefixlen - 1 if strict else network.prefixlen
+        for depth in range(end + 1):
+            if node[2]:
+                found.append(node[2])
+            if depth == end:
+                break
+            node = node[(value >> (max_prefixlen - depth - 1)) & 1]
+            if node is None:
+                break
+        return [key for keys in reversed(found) for key in keys]
+
+
+class SubnetIndex:
+    """
+    Per-VRF radix trees of subnet ranges.
+    """
+
+    def __init__(self, loader):
+        # Function returning (id, vrf_id, range) of every subnets.
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._trees = None
+        self._ranges = {}
+        self._generation = 0
+
+    def clear(self):
+        """
+        Discard the index. It get rebuilt on next lookup.
+        """
+        with self._lock:
+            self._trees = None
+            self._ranges = {}
+            self._generation += 1
+
+    def _load(self):
+        with self._lock:
+            if self._trees is not None:
+                return True
+            generation = self._generation
+        trees = {}
+        ranges = {}
+        for subnet_id, vrf_id, range in self._loader():
+            network = _network(range)
+            trees.setdefault(vrf_id, RadixTree()).add(network, subnet_id)
+            ranges[subnet_id] = (vrf_id, network)
+        with self._lock:
+            # Discard the result if a commit happen while loading.
+            if generation != self._generation:
+                return False
+            self._trees = trees
+            self._ranges = ranges
+        return True
+
+    def update(self, changes):
+        """
+        Apply committed changes. `changes` is a dict of subnet id to (vrf_id, range) or None when deleted.
+        """
+        with self._lock:
+            self._generation += 1
+            if self._trees is None:
+                return
+            for subnet_id, value in changes.items():
+                previous = self._ranges.pop(subnet_id, None)
+                if previous:
+                    self._trees[previous[0]].discard(previous[1], subnet_id)
+                if value:
+                    vrf_id, network = value[0], _network(value[1])
+                    self._trees.setdefault(vrf_id, RadixTree()).add(network, subnet_id)
+                    self._ranges[subnet_id] = (vrf_id, network)
+
+    def lookup(self, vrf_id, value, strict=False, pending=None):
+        """
+        Return identifiers of the subnets containing the given IP address or
+        network. When `vrf_id` is None, search every VRF. `pending` are the
+        changes not yet committed by the current transaction.
+
+        Return None if the index is not available.
+        """
+        if pending is None:
+            pending = {}
+        if not self._load():
+            return None
+        network = _network(value)
+        with self._lock:
+            trees = self._trees
+            if trees is None:
+                return None
+            if vrf_id is None:
+                found = [key for tree in trees.values() for key in tree.supernets(network, strict)]
+            else:
+                tree = trees.get(vrf_id)
+                found = tree.supernets(network, strict) if tree else []
+        # Add subnets modified by current transaction.
+        for subnet_id, pending_value in pending.items():
+            if not pending_value or (vrf_id is not None and pending_value[0] != vrf_id):
+                continue
+            other = _network(pending_value[1])
+            if other.version == network.version and network.subnet_of(other) and not (strict and other == network):
+                found.append(subnet_id)
+        return found
@@ -136,6 +136,16 @@ def index_drop(conn, index_name):
     conn.execute(text("DROP INDEX %s" % index_name))
 
 
+def index_gist_add(conn, index_name, column):
+    """
+    Create a GiST index for the given network column. Only supported by Postgresql.
+    """
+    assert index_name
+    conn.execute(
+        text('CREATE INDEX %s ON "%s" USING gist (%s inet_ops)' % (index_name, column.table.fullname, column.name))
+    )
+
+
 def table_exists(conn, table):
     """
     Check if given table exists.
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import ipaddress
+import os
+import time
+import unittest
+from unittest import skipUnless
+
+from parameterized import parameterized
+
+from udb.core.model import _cidr
+
+NETWORKS = [
+    '192.168.1.0/24',
+    '192.168.1.15/32',
+    '192.168.0.0/16',
+    '10.0.0.0/8',
+    '0.0.0.0/0',
+    '255.255.255.255/32',
+    '2001:db8::/32',
+    '2001:db8:0:1::/64',
+    '2001:db8::1/128',
+    '::/0',
+    '::ffff:c0a8:10f/128',
+    'fe80::1:0:0:1/128',
+]
+
+
+def _encode(value):
+    return _cidr._ip_network_to_bytes(ipaddress.ip_network(value))
+
+
+def _to_network(value):
+    # Reference implementation using ipaddress.
+    if value[1] == 6:
+        return ipaddress.ip_network(value[2:18]).supernet(new_prefix=int.from_bytes(value[18:], "big"))
+    return ipaddress.ip_network(value[2:6]).supernet(new_prefix=int.from_bytes(value[6:], "big"))
+
+
+def _ref_host(value):
+    return _to_network(value).network_address.compressed
+
+
+def _ref_text(value):
+    return _to_network(value).compressed
+
+
+def _ref_broadcast(value):
+    return _cidr._ip_network_to_bytes(_to_network(value).broadcast_address)
+
+
+def _ref_masklen(value):
+    return _to_network(value).prefixlen
+
+
+def _ref_subnet_of(value, other):
+    n = _to_network(value)
+    o = _to_network(other)
+    return n.version == o.version and n != o and n.subnet_of(o)
+
+
+def _ref_subnet_of_or_equals(value, other):
+    n = _to_network(value)
+    o = _to_network(other)
+    return n.version == o.version and n.subnet_of(o)
+
+
+class CidrFunctionTest(unittest.TestCase):
+    @parameterized.expand(NETWORKS)
+    def test_host(self, value):
+        self.assertEqual(_ref_host(_encode(value)), _cidr._sqlite_host(_encode(value)))
+        self.assertEqual(_ref_host(_encode(value)), _cidr._sqlite_host(value))
+
+    @parameterized.expand(NETWORKS)
+    def test_text(self, value):
+        self.assertEqual(_ref_text(_encode(value)), _cidr._sqlite_text(_encode(value)))
+        self.assertEqual(_ref_text(_encode(value)), _cidr._sqlite_text(value))
+
+    @parameterized.expand(NETWORKS)
+    def test_broadcast(self, value):
+        self.assertEqual(_ref_broadcast(_encode(value)), _cidr._sqlite_broadcast(_encode(value)))
+
+    @parameterized.expand(NETWORKS)
+    def test_masklen(self, value):
+        self.assertEqual(_ref_masklen(_encode(value)), _cidr._sqlite_masklen(_encode(value)))
+
+    @parameterized.expand(NETWORKS)
+    def test_family(self, value):
+        self.assertEqual(ipaddress.ip_network(value).version, _cidr._sqlite_family(_encode(value)))
+
+    def test_host_bits(self):
+        # Given an encoded value with host bits
+        value = _cidr._ip_network_to_bytes(ipaddress.ip_interface('192.168.1.15/24'))
+        value = value[:-2] + (24).to_bytes(2, 'big')
+        # Then host bits are ignored
+        self.assertEqual('192.168.1.0/24', _cidr._sqlite_text(value))
+        self.assertEqual('192.168.1.255/32', _cidr._sqlite_text(_cidr._sqlite_broadcast(value)))
+
+    def test_subnet_of(self):
+        for value in NETWORKS:
+            for other in NETWORKS:
+                with self.subTest(value=value, other=other):
+                    self.assertEqual(
+                        _ref_subnet_of(_encode(value), _encode(other)),
+                        _cidr._sqlite_subnet_of(_encode(value), _encode(other)),
+                    )
+                    self.assertEqual(
+                        _ref_subnet_of_or_equals(_encode(value), _encode(other)),
+                        _cidr._sqlite_subnet_of_or_equals(_encode(value), _encode(other)),
+                    )
+
+    def test_none(self):
+        self.assertIsNone(_cidr._sqlite_host(None))
+        self.assertIsNone(_cidr._sqlite_broadcast(None))
+        self.assertFalse(_cidr._sqlite_subnet_of(None, _encode('10.0.0.0/8')))
+
+    @skipUnless(os.environ.get('TEST_BENCHMARK'), 'required TEST_BENCHMARK to run benchmark')
+    def test_benchmark(self):
+        # Given a large set of encoded networks with repeated values
+        values = [_encode('10.%s.%s.0/24' % (i % 256, (i // 256) % 64)) for i in range(20000)]
+        values += [_encode('2001:db8:%x::/48' % (i % 4096)) for i in range(20000)]
+        other = _encode('10.0.0.0/8')
+        for name, ref, func in [
+            ('host', _ref_host, _cidr._sqlite_host),
+            ('text', _ref_text, _cidr._sqlite_text),
+            ('broadcast', _ref_broadcast, _cidr._sqlite_broadcast),
+            ('masklen', _ref_masklen, _cidr._sqlite_masklen),
+            ('subnet_of', lambda v: _ref_subnet_of(v, other), lambda v: _cidr._sqlite_subnet_of(v, other)),
+        ]:
+            # When executing the reference implementation and the new one
+            start = time.perf_counter()
+            for value in values:
+                ref(value)
+            reference = time.perf_counter() - start
+            start = time.perf_counter()
+            for value in values:
+                func(value)
+            current = time.perf_counter() - start
+            # Then the new implementation is faster
+            self.assertLess(current, reference, '%s: reference %.3fs, current %.3fs' % (name, reference, current))
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import ipaddress
+import os
+import time
+import unittest
+from unittest import skipUnless
+
+from sqlalchemy import insert, select
+
+from udb.controller.tests import WebCase
+from udb.core.model import (
+    Conflict,
+    DhcpRecord,
+    DnsRecord,
+    DnsZone,
+    Ip,
+    Mac,
+    Rule,
+    Subnet,
+    Vrf,
+    find_conflicts,
+    rule_violation,
+)
+from udb.core.model._conflict import sweep_overlaps
+
+
+class SweepOverlapsTest(unittest.TestCase):
+    def test_sweep_overlaps(self):
+        intervals = [
+            (4, 0, 255, 'a'),
+            (4, 10, 20, 'b'),
+            (4, 15, 15, 'c'),
+            (4, 21, 30, 'd'),
+            (4, 256, 300, 'e'),
+            (6, 0, 2**128 - 1, 'f'),
+        ]
+        self.assertEqual(
+            [('a', 'b'), ('a', 'c'), ('a', 'd'), ('b', 'c')],
+            sorted(sweep_overlaps(intervals)),
+        )
+
+    def test_sweep_overlaps_empty(self):
+        self.assertEqual([], sweep_overlaps([]))
+
+
+class ConflictTest(WebCase):
+    def setUp(self):
+        super().setUp()
+        self.vrf1 = Vrf(name='vrf1').add()
+        self.vrf2 = Vrf(name='vrf2').add().flush()
+
+    def test_subnet_overlaps(self):
+        # Given nested subnets in the same VRF and overlapping subnets in another VRF.
+        parent = Subnet(range='10.0.0.0/16', vrf=self.vrf1).add()
+        Subnet(range='10.0.1.0/24', vrf=self.vrf1).add()
+        other = Subnet(range='10.0.0.0/24', vrf=self.vrf2).add()
+        Subnet(range='192.168.0.0/24', vrf=self.vrf2).add().commit()
+        # When searching for conflicts
+        conflicts = find_conflicts('subnet_overlap')
+        # Then only overlaps between VRFs are reported
+        self.assertEqual(
+            [
+                Conflict('subnet_overlap', 'subnet', parent.id, '10.0.0.0/16', 'subnet', other.id, '10.0.0.0/24'),
+                Conflict('subnet_overlap', 'subnet', other.id, '10.0.0.0/24', 'subnet', parent.id, '10.0.0.0/16'),
+            ],
+            conflicts,
+        )
+
+    def test_subnet_overlaps_deleted(self):
+        # Given a deleted subnet overlapping a subnet of another VRF
+        Subnet(range='10.0.0.0/16', vrf=self.vrf1).add()
+        Subnet(range='10.0.0.0/24', vrf=self.vrf2, status=Subnet.STATUS_DELETED).add().commit()
+        # Then no conflict is reported
+        self.assertEqual([], find_conflicts('subnet_overlap'))
+
+    def test_dhcp_pool_overlaps(self):
+        # Given a subnet with a DHCP pool
+        subnet = Subnet(
+            range='10.0.0.0/24',
+            vrf=self.vrf1,
+            dhcp=True,
+            dhcp_start_ip='10.0.0.100',
+            dhcp_end_ip='10.0.0.200',
+        ).add()
+        Subnet(range='10.0.0.0/24', vrf=self.vrf2).add().flush()
+        # Given static reservations inside and outside the pool
+        record = DhcpRecord(ip='10.0.0.150', mac='00:00:5e:00:53:01', vrf=self.vrf1).add()
+        DhcpRecord(ip='10.0.0.50', mac='00:00:5e:00:53:02', vrf=self.vrf1).add()
+        DhcpRecord(ip='10.0.0.150', mac='00:00:5e:00:53:03', vrf=self.vrf2).add().commit()
+        # When searching for conflicts
+        conflicts = find_conflicts('dhcp_pool')
+        # Then the reservation inside the pool of the same VRF is reported
+        self.assertEqual(
+            [Conflict('dhcp_pool', 'dhcprecord', record.id, '10.0.0.150', 'subnet', subnet.id, '10.0.0.0/24')],
+            conflicts,
+        )
+
+    def test_duplicate_ips(self):
+        # Given the same IP address used in two VRFs
+        zone = DnsZone(name='example.com').add().flush()
+        Subnet(range='10.0.0.0/24', vrf=self.vrf1).add()
+        Subnet(range='10.0.0.0/24', vrf=self.vrf2, dnszones=[zone]).add().flush()
+        DhcpRecord(ip='10.0.0.1', mac='00:00:5e:00:53:01', vrf=self.vrf1).add()
+        DnsRecord(name='foo.example.com', type='A', value='10.0.0.1', vrf=self.vrf2).add()
+        DhcpRecord(ip='10.0.0.2', mac='00:00:5e:00:53:02', vrf=self.vrf1).add().commit()
+        ip1 = Ip.query.filter_by(ip='10.0.0.1', vrf_id=self.vrf1.id).one()
+        ip2 = Ip.query.filter_by(ip='10.0.0.1', vrf_id=self.vrf2.id).one()
+        # When searching for conflicts
+        conflicts = find_conflicts('duplicate_ip')
+        # Then both addresses are reported
+        self.assertEqual(
+            sorted([(ip1.id, ip2.id), (ip2.id, ip1.id)]),
+            sorted((c.model_id, c.other_id) for c in conflicts),
+        )
+
+    def test_linter(self):
+        # Given overlapping subnets in two VRFs
+        subnet = Subnet(range='10.0.0.0/16', vrf=self.vrf1).add()
+        Subnet(range='10.0.0.0/24', vrf=self.vrf2).add().commit()
+        # When evaluating the linter
+        Rule.refresh_violations(full=True)
+        # Then violations are recorded for the analysis rule
+        rule = Rule.query.filter(Rule.name == 'subnet_overlap_other_vrf').one()
+        self.assertEqual(Rule.TYPE_ANALYSIS, rule.type)
+        self.assertIsNotNone(rule.linter_date)
+        rows = Rule.session.execute(select(rule_violation).filter_by(rule_id=rule.id)).all()
+        self.assertIn(('subnet', subnet.id, '10.0.0.0/16'), [(row.model_name, row.model_id, row.name) for row in rows])
+
+    @skipUnless(os.environ.get('TEST_BENCHMARK'), 'required TEST_BENCHMARK to run benchmark')
+    def test_benchmark(self):
+        # Given the same reservations in two VRFs
+        count = 200000
+        ips = [str(ipaddress.ip_address('10.0.0.0') + i + 1) for i in range(count)]
+        for vrf in [self.vrf1, self.vrf2]:
+            macs = ['00:%02x:5e:%02x:%02x:%02x' % (vrf.id, i >> 16 & 255, i >> 8 & 255, i & 255) for i in range(count)]
+            Subnet.session.execute(insert(Mac), [{'mac': mac} for mac in macs])
+            subnet = Subnet(range='10.0.0.0/8', vrf=vrf).add().flush()
+            Subnet.session.execute(insert(Ip), [{'ip': ip, 'vrf_id': vrf.id} for ip in ips])
+            Subnet.session.execute(
+                insert(DhcpRecord),
+                [
+                    {
+                        'ip': ip,
+                        'mac': mac,
+                        'vrf_id': vrf.id,
+                        'subnet_id': subnet.id,
+                        'subnet_estatus': subnet.estatus,
+                        'subnet_range': subnet.range,
+                    }
+                    for ip, mac in zip(ips, macs)
+                ],
+            )
+        Subnet.session.commit()
+        self.wait_for_tasks()
+        # When searching for conflicts
+        start = time.perf_counter()
+        conflicts = find_conflicts()
+        elapsed = time.perf_counter() - start
+        # Then it's computed quickly
+        self.assertEqual(2 + 2 * count, len(conflicts))
+        self.assertLess(elapsed, 10, 'conflicts: %.3fs' % elapsed)
@@ -20,7 +20,7 @@ from unittest import mock
 from sqlalchemy import func, select
 
 from udb.controller.tests import WebCase
-from udb.core.model import DhcpRecord, DnsRecord, DnsZone, Environment, Message, Subnet, User, Vrf
+from udb.core.model import Deployment, DhcpRecord, DnsRecord, DnsZone, Environment, Message, Subnet, User, Vrf
 
 
 class DeploymentTest(WebCase):
@@ -92,6 +92,55 @@ class DeploymentTest(WebCase):
             ],
         )
 
+    def test_get_delta(self):
+        # Given a successful deployment
+        dhcprecord_env = Environment(name='dhcprecord_env', model_name='dhcprecord').add()
+        vrf = Vrf(name='default').add().flush()
+        Subnet(
+            name='LAN',
+            range='192.168.14.0/24',
+            dhcp=True,
+            dhcp_start_ip='192.168.14.1',
+            dhcp_end_ip='192.168.14.254',
+            vrf=vrf,
+        ).add().flush()
+        record1 = DhcpRecord(ip='192.168.14.10', mac='5e:4b:85:7b:b4:2b', vrf=vrf).add()
+        record2 = DhcpRecord(ip='192.168.14.11', mac='5e:4b:85:7b:b4:2c', vrf=vrf).add()
+        record3 = DhcpRecord(ip='192.168.14.12', mac='5e:4b:85:7b:b4:2d', vrf=vrf).add().commit()
+        user = User.query.first()
+        previous = dhcprecord_env.create_deployment(user).add().commit()
+        previous.state = Deployment.STATE_SUCCESS
+        previous.commit()
+        # Given records added, changed and removed
+        record1.mac = '5e:4b:85:7b:b4:ff'
+        record2.status = DhcpRecord.STATUS_DELETED
+        record4 = DhcpRecord(ip='192.168.14.13', mac='5e:4b:85:7b:b4:2e', vrf=vrf).add().commit()
+        # When creating a new deployment
+        deployment = dhcprecord_env.create_deployment(user).add().commit()
+        # Then the previous deployment is found
+        self.assertEqual(previous, deployment.get_previous())
+        # Then delta contains our changes
+        delta = deployment.get_delta(deployment.get_previous())
+        self.assertEqual([r['id'] for r in delta['added']['dhcprecord']], [record4.id])
+        self.assertEqual([r['id'] for r in delta['changed']['dhcprecord']], [record1.id])
+        self.assertEqual(delta['removed']['dhcprecord'], [record2.id])
+        self.assertNotIn(record3.id, [r['id'] for r in delta['changed']['dhcprecord']])
+        self.assertEqual(delta['added']['slave_subnets'], [])
+
+    def test_get_delta_without_previous(self):
+        # Given a deployment without previous successful deployment
+        subnet_env = Environment(name='subnet_env', model_name='subnet').add()
+        vrf = Vrf(name='default').add().flush()
+        Subnet(name='LAN', range='192.168.14.0/24', vrf=vrf).add().commit()
+        deployment = subnet_env.create_deployment(User.query.first()).add().commit()
+        # When computing the delta
+        self.assertIsNone(deployment.get_previous())
+        delta = deployment.get_delta(None)
+        # Then every record is added
+        self.assertEqual(1, len(delta['added']['subnet']))
+        self.assertEqual([], delta['changed']['subnet'])
+        self.assertEqual([], delta['removed']['subnet'])
+
 
 class EnvironmentTest(WebCase):
     def test_pending_changes(self):
@@ -124,3 +173,61 @@ class EnvironmentTest(WebCase):
             .first()
         )
         self.assertEqual((mock.ANY, mock.ANY, 2), row)
+
+    def test_last_deployed_message_id(self):
+        # Given a database with a environment with changes
+        subnet_env = Environment(name='subnet_env', model_name='subnet').add()
+        vrf = Vrf(name='default').add().flush()
+        Subnet(name='LAN', range='192.168.14.0/24', vrf=vrf).add().commit()
+        self.assertIsNone(subnet_env.last_deployed_message_id)
+        # When creating a deployment
+        deployment = subnet_env.create_deployment(User.query.first()).add().commit()
+        # Then last deployed message is updated
+        subnet_env.expire()
+        self.assertEqual(deployment.end_id, subnet_env.last_deployed_message_id)
+        self.assertEqual(0, len(subnet_env.pending_changes))
+        self.assertEqual(0, Environment.count_pending_changes())
+        # When creating a deployment without changes
+        subnet_env.create_deployment(User.query.first()).add().commit()
+        # Then last deployed message is not changed
+        subnet_env.expire()
+        self.assertEqual(deployment.end_id, subnet_env.last_deployed_message_id)
+
+    def test_last_deployed_message_id_with_model_name_updated(self):
+        # Given an environment that was deployed
+        subnet_env = Environment(name='subnet_env', model_name='subnet').add()
+        vrf = Vrf(name='default').add().flush()
+        Subnet(name='LAN', range='192.168.14.0/24', vrf=vrf).add().commit()
+        deployment = subnet_env.create_deployment(User.query.first()).add().commit()
+        # When updating the model_name
+        subnet_env.expire()
+        subnet_env.model_name = 'dhcprecord'
+        subnet_env.add().commit()
+        # Then last deployed message is reset
+        self.assertIsNone(subnet_env.last_deployed_message_id)
+        self.assertEqual(2, len(subnet_env.pending_changes))
+        # When restoring the model_name
+        subnet_env.model_name = 'subnet'
+        subnet_env.add().commit()
+        # Then last deployed message is restored
+        self.assertEqual(deployment.end_id, subnet_env.last_deployed_message_id)
+        self.assertEqual(2, len(subnet_env.pending_changes))
+
+    def test_count_pending_changes(self):
+        # Given a database with a environment
+        subnet_env = Environment(name='subnet_env', model_name='subnet').add().commit()
+        self.assertEqual(1, Environment.count_pending_changes())
+        # When adding changes
+        vrf = Vrf(name='default').add().flush()
+        Subnet(name='LAN', range='192.168.14.0/24', vrf=vrf).add().commit()
+        # Then the count is updated
+        self.assertEqual(2, Environment.count_pending_changes())
+        # When changes are rollback
+        Subnet(name='WAN', range='192.168.15.0/24', vrf=vrf).add().flush()
+        Subnet.session.rollback()
+        # Then the count is not updated
+        self.assertEqual(2, Environment.count_pending_changes())
+        # When creating a deployment
+        subnet_env.create_deployment(User.query.first()).add().commit()
+        # Then the count is updated
+        self.assertEqual(0, Environment.count_pending_changes())
@@ -15,12 +15,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from unittest import mock
+from unittest import mock, skipIf
 
+import cherrypy
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import with_parent
 
 from udb.controller.tests import WebCase
-from udb.core.model import DhcpRecord, Ip, Rule, Subnet, Vrf
+from udb.core.model import DhcpRecord, DnsRecord, Ip, Rule, Subnet, Vrf
 
 
 class DhcpRecordTest(WebCase):
@@ -297,3 +300,14 @@ class DhcpRecordTest(WebCase):
         dhcp.add().commit()
         # Then the subnet parent get updated.
         self.assertEqual(subnet2.id, dhcp.subnet_id)
+
+    @skipIf('postgresql' in str(cherrypy.config.get('tools.db.uri')), 'required sqlite database')
+    def test_related_dnsrecord_query_plan(self):
+        # Given a DHCP Record
+        vrf = Vrf(name='default').add()
+        Subnet(range='192.168.0.0/24', vrf=vrf).add().commit()
+        dhcp = DhcpRecord(ip='192.168.0.23', mac='00:00:5e:00:53:af').add().commit()
+        # When explaining the query to load related DNS Records
+        plan = self.query_plan(select(DnsRecord).where(with_parent(dhcp, DhcpRecord.related_dnsrecord)))
+        # Then the index on generated ip is used
+        self.assertIn('dnsrecord_generated_ip_vrf_id_type_estatus_ix', plan)
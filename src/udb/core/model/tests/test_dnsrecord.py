@@ -16,11 +16,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from unittest import skipIf
+
+import cherrypy
 from parameterized import parameterized
+from sqlalchemy import select, text
 from sqlalchemy.exc import IntegrityError
 
 from udb.controller.tests import WebCase
 from udb.core.model import DnsRecord, DnsZone, Rule, RuleError, Subnet, Vrf
+from udb.core.model._dnsrecord import create_dnsrecord_rule_ix, create_dnsrecord_sort_name
+from udb.core.model._update import index_exists
 
 
 class DnsRecordTest(WebCase):
@@ -718,3 +724,135 @@ class DnsRecordTest(WebCase):
         dns.add().commit()
         # Then the subnet parent get updated.
         self.assertEqual(subnet2.id, dns.subnet_id)
+
+    @parameterized.expand(
+        [
+            ('A', 'foo.example.com', '192.168.0.25', 'com example foo'),
+            ('CNAME', '*.example.com', 'foo.example.com', 'com example ~'),
+            ('PTR', '25.0.168.192.in-addr.arpa', 'foo.example.com', 'com example foo'),
+        ]
+    )
+    def test_sort_name(self, type, name, value, expected):
+        # Given a DNS Zone
+        vrf = Vrf(name='default').add()
+        builtin_zones = DnsZone.query.all()
+        subnet = Subnet(range='192.168.0.0/24', vrf=vrf, dnszones=builtin_zones).add().flush()
+        DnsZone(name='example.com', subnets=[subnet]).add().flush()
+        # When creating a record
+        dns = DnsRecord(name=name, type=type, value=value).add().commit()
+        # Then the sort name is defined with labels in reverse order
+        self.assertEqual(expected, dns._sort_name)
+
+    def test_sort_order(self):
+        # Given DNS records in a zone and a sub zone
+        vrf = Vrf(name='default').add()
+        subnet = Subnet(range='192.168.0.0/24', vrf=vrf).add().flush()
+        DnsZone(name='example.com', subnets=[subnet]).add().flush()
+        DnsZone(name='sub.example.com', subnets=[subnet]).add().flush()
+        DnsRecord(name='*.example.com', type='CNAME', value='bar.example.com').add().flush()
+        DnsRecord(name='foo.sub.example.com', type='A', value='192.168.0.24').add().flush()
+        DnsRecord(name='foo-bar.example.com', type='A', value='192.168.0.25').add().flush()
+        DnsRecord(name='example.com', type='A', value='192.168.0.23').add().flush()
+        DnsRecord(
+            name='example.com', type='SOA', value='ns1.example.com. hostmaster.example.com. 1 3600 600 86400 3600'
+        ).add().flush()
+        DnsRecord(name='sub.example.com', type='A', value='192.168.0.26').add().commit()
+        # When querying the records of the zone
+        records = DnsRecord.query.filter(DnsRecord.in_domain('example.com')).order_by(*DnsRecord.sort_order()).all()
+        # Then the records are sorted by reversed domain name with SOA first
+        self.assertEqual(
+            [
+                ('example.com', 'SOA'),
+                ('example.com', 'A'),
+                ('foo-bar.example.com', 'A'),
+                ('sub.example.com', 'A'),
+                ('foo.sub.example.com', 'A'),
+                ('*.example.com', 'CNAME'),
+            ],
+            [(r.name, r.type) for r in records],
+        )
+        # When querying the records of a sub domain
+        records = DnsRecord.query.filter(DnsRecord.in_domain('sub.example.com')).order_by(*DnsRecord.sort_order()).all()
+        # Then only the records of this domain are returned
+        self.assertEqual(['sub.example.com', 'foo.sub.example.com'], [r.name for r in records])
+        # When querying the records of a fully qualified domain name
+        records = (
+            DnsRecord.query.filter(DnsRecord.in_domain('Sub.Example.COM.')).order_by(*DnsRecord.sort_order()).all()
+        )
+        # Then the domain is normalized
+        self.assertEqual(['sub.example.com', 'foo.sub.example.com'], [r.name for r in records])
+        # When querying the records of an unknown domain
+        # Then nothing is returned
+        self.assertEqual([], DnsRecord.query.filter(DnsRecord.in_domain('ample.com')).all())
+
+    def test_sort_name_populate(self):
+        # Given DNS records
+        vrf = Vrf(name='default').add()
+        subnet = Subnet(range='192.168.0.0/24', vrf=vrf).add().flush()
+        DnsZone(name='example.com', subnets=[subnet]).add().flush()
+        dns = DnsRecord(name='foo.example.com', type='A', value='192.168.0.25').add().commit()
+        # Given a database without sort name
+        DnsRecord.session.execute(text('DROP INDEX dnsrecord_sort_name_ix'))
+        DnsRecord.session.execute(text('ALTER TABLE dnsrecord DROP COLUMN _sort_name'))
+        DnsRecord.session.commit()
+        # When creating the database
+        create_dnsrecord_sort_name(None, DnsRecord.session.connection())
+        DnsRecord.session.commit()
+        # Then the sort name is populated
+        dns.expire()
+        self.assertEqual('com example foo', dns._sort_name)
+
+    def test_hostname_populate(self):
+        # Given DNS records
+        vrf = Vrf(name='default').add()
+        builtin_zones = DnsZone.query.all()
+        subnet = Subnet(range='192.168.0.0/24', vrf=vrf, dnszones=builtin_zones).add().flush()
+        DnsZone(name='example.com', subnets=[subnet]).add().flush()
+        dns = DnsRecord(name='25.0.168.192.in-addr.arpa', type='PTR', value='foo.example.com').add().commit()
+        # Given a database without hostname and rule indexes
+        DnsRecord.session.execute(text('DROP INDEX dnsrecord_hostname_ix'))
+        DnsRecord.session.execute(text('DROP INDEX dnsrecord_generated_ip_vrf_id_type_estatus_ix'))
+        DnsRecord.session.execute(text('ALTER TABLE dnsrecord DROP COLUMN _hostname'))
+        DnsRecord.session.commit()
+        # When creating the database
+        conn = DnsRecord.session.connection()
+        create_dnsrecord_rule_ix(None, conn)
+        DnsRecord.session.commit()
+        # Then the hostname is available
+        dns.expire()
+        self.assertEqual('foo.example.com', dns._hostname)
+        # Then indexes are created
+        conn = DnsRecord.session.connection()
+        self.assertTrue(index_exists(conn, 'dnsrecord_generated_ip_vrf_id_type_estatus_ix'))
+        self.assertTrue(index_exists(conn, 'dnsrecord_hostname_ix'))
+
+    @skipIf('postgresql' in str(cherrypy.config.get('tools.db.uri')), 'required sqlite database')
+    def test_in_domain_query_plan(self):
+        # Given a query to lookup records of a domain
+        query = DnsRecord.query.filter(DnsRecord.in_domain('example.com'))
+        # When explaining the query
+        plan = self.query_plan(query.statement)
+        # Then the index on sort name is used
+        self.assertIn('dnsrecord_sort_name_ix', plan)
+
+    @skipIf('postgresql' in str(cherrypy.config.get('tools.db.uri')), 'required sqlite database')
+    def test_related_dns_record_query_plan(self):
+        # Given a DNS Record
+        dns = DnsRecord(name='foo.example.com', type='CNAME', value='bar.example.com')
+        # When explaining the query to lookup related records
+        plan = self.query_plan(dns.related_dns_record_query().statement)
+        # Then the index on hostname is used
+        self.assertIn('dnsrecord_hostname_ix', plan)
+
+    @skipIf('postgresql' in str(cherrypy.config.get('tools.db.uri')), 'required sqlite database')
+    def test_generated_ip_query_plan(self):
+        # Given a query to lookup the PTR record of an IP as used by deployment
+        query = select(DnsRecord.value).filter(
+            DnsRecord.type == 'PTR',
+            DnsRecord.generated_ip == '192.168.1.1',
+            DnsRecord.estatus == DnsRecord.STATUS_ENABLED,
+        )
+        # When explaining the query
+        plan = self.query_plan(query)
+        # Then the index on generated ip is used
+        self.assertIn('dnsrecord_generated_ip_vrf_id_type_estatus_ix', plan)
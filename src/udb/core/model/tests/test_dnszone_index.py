@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import time
+import unittest
+from unittest import skipUnless
+
+from parameterized import parameterized
+from sqlalchemy import insert
+
+from udb.controller.tests import WebCase
+from udb.core.model import DnsRecord, DnsZone, Subnet, Vrf
+from udb.core.model._dnszone import dnszone_index
+from udb.core.model._dnszone_index import DnsZoneIndex, LabelTrie
+
+
+class LabelTrieTest(unittest.TestCase):
+    def setUp(self):
+        self.trie = LabelTrie()
+        for key, value in [
+            (1, 'example.com'),
+            (2, 'sub.example.com'),
+            (3, 'example.net'),
+            (4, '10.in-addr.arpa'),
+        ]:
+            self.trie.add(value, key)
+
+    @parameterized.expand(
+        [
+            ('example.com', [1]),
+            ('foo.example.com', [1]),
+            ('foo.sub.example.com', [2, 1]),
+            ('sub.example.com', [2, 1]),
+            ('FOO.Example.COM', [1]),
+            ('myexample.com', []),
+            ('com', []),
+            ('1.0.0.10.in-addr.arpa', [4]),
+            ('', []),
+        ]
+    )
+    def test_suffixes(self, name, expected):
+        self.assertEqual(expected, self.trie.suffixes(name))
+
+    def test_discard(self):
+        # When removing a zone
+        self.trie.discard('sub.example.com', 2)
+        # Then it's not returned
+        self.assertEqual([1], self.trie.suffixes('foo.sub.example.com'))
+        # When removing an unknown zone
+        self.trie.discard('unknown.org', 5)
+        # Then nothing happen
+        self.assertEqual([1], self.trie.suffixes('foo.example.com'))
+
+    def test_discard_prune(self):
+        # When removing zones
+        self.trie.discard('sub.example.com', 2)
+        self.trie.discard('example.net', 3)
+        # Then empty nodes are removed
+        self.assertEqual({'com', 'arpa'}, set(self.trie._root[0]))
+        self.assertEqual({}, self.trie._root[0]['com'][0]['example'][0])
+        # When removing a zone with sub zones
+        self.trie.add('sub.example.com', 2)
+        self.trie.discard('example.com', 1)
+        # Then the sub zone is kept
+        self.assertEqual([2], self.trie.suffixes('foo.sub.example.com'))
+
+
+class DnsZoneIndexTest(unittest.TestCase):
+    def test_lookup(self):
+        # Given an index
+        index = DnsZoneIndex(lambda: [(1, 'example.com'), (2, 'sub.example.com')])
+        # When searching a hostname
+        # Then the longest zone is returned first
+        self.assertEqual([2, 1], index.lookup('www.sub.example.com'))
+        self.assertEqual([], index.lookup('example.org'))
+
+    def test_lookup_pending(self):
+        # Given an index
+        index = DnsZoneIndex(lambda: [(1, 'example.com'), (2, 'sub.example.com')])
+        # When searching with pending changes
+        # Then pending zones are returned and deleted or renamed zones are ignored.
+        self.assertEqual(
+            [3, 1],
+            index.lookup('www.sub.example.com', pending={2: None, 3: 'www.sub.example.com', 4: 'other.com'}),
+        )
+
+    def test_update(self):
+        # Given an index
+        index = DnsZoneIndex(lambda: [(1, 'example.com'), (2, 'sub.example.com')])
+        self.assertEqual([2, 1], index.lookup('www.sub.example.com'))
+        # When a zone get renamed and another one deleted
+        index.update({1: 'example.org', 2: None})
+        # Then the index is updated.
+        self.assertEqual([], index.lookup('www.sub.example.com'))
+        self.assertEqual([1], index.lookup('www.example.org'))
+
+
+class DnsZoneIndexDatabaseTest(WebCase):
+    def test_pending(self):
+        # Given a zone not yet committed
+        zone = DnsZone(name='example.com').add().flush()
+        # When adding a record
+        record = DnsRecord(name='www.example.com', type='CNAME', value='example.com').add().commit()
+        # Then the zone is found.
+        self.assertEqual(zone.id, record.dnszone_id)
+        self.assertEqual([zone.id], dnszone_index.lookup('www.example.com'))
+
+    def test_rollback(self):
+        # Given a zone renamed and rollback
+        zone = DnsZone(name='example.com').add().commit()
+        zone.name = 'example.org'
+        zone.add().flush()
+        DnsZone.session.rollback()
+        # When adding a record
+        record = DnsRecord(name='www.example.com', type='CNAME', value='example.com').add().commit()
+        # Then the zone is found.
+        self.assertEqual(zone.id, record.dnszone_id)
+
+    def test_deleted(self):
+        # Given a deleted zone
+        zone = DnsZone(name='example.com').add().commit()
+        zone.status = DnsZone.STATUS_DELETED
+        zone.add().commit()
+        # Then it's not returned by the index
+        self.assertEqual([], dnszone_index.lookup('www.example.com'))
+        # When restoring the zone
+        zone.status = DnsZone.STATUS_ENABLED
+        zone.add().commit()
+        # Then it's returned by the index
+        self.assertEqual([zone.id], dnszone_index.lookup('www.example.com'))
+
+    @skipUnless(os.environ.get('TEST_BENCHMARK'), 'required TEST_BENCHMARK to run benchmark')
+    def test_benchmark(self):
+        # Given many zones
+        vrf = Vrf(name='default').add().flush()
+        DnsZone.session.execute(insert(DnsZone), [{'name': 'zone%s.example.com' % i} for i in range(5000)])
+        zone = DnsZone(name='example.com', subnets=[Subnet(range='10.0.0.0/8', vrf=vrf)]).add().commit()
+        self.wait_for_tasks()
+        # When creating many records
+        start = time.perf_counter()
+        for i in range(1000):
+            DnsRecord(name='host%s.example.com' % i, type='A', value='10.0.%s.%s' % (i // 256, i % 256)).add()
+        DnsRecord.session.commit()
+        elapsed = time.perf_counter() - start
+        # Then the zone get assigned quickly
+        self.assertEqual(
+            1000, DnsRecord.query.filter(DnsRecord.dnszone_id == zone.id).count(), 'dnszone lookup: %.3fs' % elapsed
+        )
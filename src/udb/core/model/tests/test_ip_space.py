@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import ipaddress
+import os
+import time
+import unittest
+from unittest import skipUnless
+
+from parameterized import parameterized
+from sqlalchemy import insert
+
+from udb.controller.tests import WebCase
+from udb.core.model import DhcpRecord, DnsRecord, DnsZone, Ip, IpSpace, Mac, Subnet, Vrf
+from udb.core.model._ip_space import first_fit, free_ranges, merge_ranges, range_to_networks
+
+
+class IpSpaceFunctionTest(unittest.TestCase):
+    def test_merge_ranges(self):
+        self.assertEqual([], merge_ranges([]))
+        self.assertEqual([(1, 5), (7, 7)], merge_ranges([(3, 5), (1, 2), (7, 7), (2, 4)]))
+        self.assertEqual([(1, 10)], merge_ranges([(1, 10), (2, 3)]))
+
+    def test_free_ranges(self):
+        self.assertEqual([(0, 255)], free_ranges(0, 255, []))
+        self.assertEqual([(0, 9), (21, 255)], free_ranges(0, 255, [(10, 20)]))
+        self.assertEqual([(11, 19)], free_ranges(0, 255, [(0, 10), (20, 300)]))
+        self.assertEqual([], free_ranges(0, 255, [(0, 255)]))
+
+    @parameterized.expand(
+        [
+            ('10.0.0.0', '10.0.0.255', ['10.0.0.0/24']),
+            ('10.0.0.1', '10.0.0.254', ['10.0.0.1/32', '10.0.0.2/31', '10.0.0.4/30', '10.0.0.8/29', '10.0.0.16/28']),
+            ('0.0.0.0', '255.255.255.255', ['0.0.0.0/0']),
+            ('2001:db8::', '2001:db8:0:ffff:ffff:ffff:ffff:ffff', ['2001:db8::/48']),
+            ('::1', '::1', ['::1/128']),
+        ]
+    )
+    def test_range_to_networks(self, first, last, expected):
+        first = ipaddress.ip_address(first)
+        networks = range_to_networks(first.version, int(first), int(ipaddress.ip_address(last)))
+        self.assertEqual(expected, [str(n) for n in networks][: len(expected)])
+        # Networks cover the interval without overlap.
+        self.assertEqual(int(first), int(networks[0].network_address))
+        self.assertEqual(int(ipaddress.ip_address(last)), int(networks[-1].broadcast_address))
+        for a, b in zip(networks, networks[1:]):
+            self.assertEqual(int(a.broadcast_address) + 1, int(b.network_address))
+
+    def test_first_fit(self):
+        self.assertEqual(32, first_fit([(1, 100)], 32))
+        self.assertEqual(None, first_fit([(1, 64)], 64))
+        self.assertEqual(128, first_fit([(1, 64), (100, 255)], 64))
+
+
+class IpSpaceTest(WebCase):
+    def setUp(self):
+        super().setUp()
+        self.vrf = Vrf(name='default').add().commit()
+
+    def test_empty(self):
+        # Given an empty subnet
+        subnet = Subnet(range='10.0.0.0/24', vrf=self.vrf).add().commit()
+        # When computing the space
+        data = IpSpace(subnet).to_json(prefixlen=26)
+        # Then everything is free
+        self.assertEqual(
+            {
+                'range': '10.0.0.0/24',
+                'size': 256,
+                'used': 0,
+                'free': 256,
+                'utilization': 0.0,
+                'free_blocks': ['10.0.0.0/24'],
+                'next_ip': '10.0.0.1',
+                'next_subnet': '10.0.0.0/26',
+            },
+            data,
+        )
+
+    def test_used(self):
+        # Given a subnet with child subnets, DHCP pool and records
+        zone = DnsZone(name='example.com').add().flush()
+        subnet = (
+            Subnet(
+                range='10.0.0.0/24',
+                vrf=self.vrf,
+                dnszones=[zone],
+                dhcp=True,
+                dhcp_start_ip='10.0.0.200',
+                dhcp_end_ip='10.0.0.254',
+            )
+            .add()
+            .flush()
+        )
+        Subnet(range='10.0.0.0/26', vrf=self.vrf).add().flush()
+        deleted = Subnet(range='10.0.0.128/26', vrf=self.vrf).add().flush()
+        deleted.status = Subnet.STATUS_DELETED
+        DhcpRecord(ip='10.0.0.64', mac='00:00:5e:00:53:01', vrf=self.vrf).add().flush()
+        DnsRecord(name='foo.example.com', type='A', value='10.0.0.65', vrf=self.vrf).add().flush()
+        DnsRecord(name='bar.example.com', type='A', value='10.0.0.67', vrf=self.vrf).add().commit()
+        # When computing the space
+        space = IpSpace(subnet)
+        data = space.to_json(prefixlen=26)
+        # Then used space is excluded
+        self.assertEqual([(0, 65), (67, 67), (200, 254)], [(a - space.first, b - space.first) for a, b in space.used])
+        self.assertEqual(64 + 2 + 1 + 55, data['used'])
+        self.assertEqual(256 - 122, data['free'])
+        self.assertEqual(47.66, data['utilization'])
+        self.assertEqual(
+            [
+                '10.0.0.66/32',
+                '10.0.0.68/30',
+                '10.0.0.72/29',
+                '10.0.0.80/28',
+                '10.0.0.96/27',
+                '10.0.0.128/26',
+                '10.0.0.192/29',
+                '10.0.0.255/32',
+            ],
+            data['free_blocks'],
+        )
+        self.assertEqual('10.0.0.66', data['next_ip'])
+        self.assertEqual('10.0.0.128/26', data['next_subnet'])
+        self.assertIsNone(space.next_subnet(25))
+
+    def test_next_ip_full(self):
+        # Given a full subnet
+        subnet = Subnet(range='10.0.0.0/30', vrf=self.vrf).add().flush()
+        DhcpRecord(ip='10.0.0.1', mac='00:00:5e:00:53:01', vrf=self.vrf).add().flush()
+        DhcpRecord(ip='10.0.0.2', mac='00:00:5e:00:53:02', vrf=self.vrf).add().commit()
+        # Then no address is available. Network and broadcast are reserved.
+        self.assertIsNone(IpSpace(subnet).next_ip())
+
+    def test_ipv6(self):
+        # Given a large IPv6 subnet with a few records
+        subnet = Subnet(range='2001:db8::/48', vrf=self.vrf).add().flush()
+        DhcpRecord(ip='2001:db8::', mac='00:00:5e:00:53:01', vrf=self.vrf).add().commit()
+        # When computing the space
+        data = IpSpace(subnet).to_json(prefixlen=64)
+        # Then the network address is available
+        self.assertEqual(2**80, data['size'])
+        self.assertEqual(1, data['used'])
+        self.assertEqual('2001:db8::1', data['next_ip'])
+        self.assertEqual('2001:db8:0:1::/64', data['next_subnet'])
+        self.assertEqual(80, len(data['free_blocks']))
+
+    def test_lookup(self):
+        # Given nested subnets
+        Subnet(range='10.0.0.0/16', vrf=self.vrf).add().flush()
+        subnet = Subnet(range='10.0.1.0/24', vrf=self.vrf).add().commit()
+        # When looking for the space of an address
+        space = IpSpace.lookup('10.0.1.15')
+        # Then the most specific subnet is returned
+        self.assertEqual(subnet.id, space.subnet.id)
+        self.assertIsNone(IpSpace.lookup('192.168.1.1'))
+        self.assertIsNone(IpSpace.lookup('10.0.1.15', vrf_id=self.vrf.id + 1))
+
+    @skipUnless(os.environ.get('TEST_BENCHMARK'), 'required TEST_BENCHMARK to run benchmark')
+    def test_benchmark(self):
+        # Given a large IPv6 subnet with many reservations
+        subnet = Subnet(range='2001:db8::/48', vrf=self.vrf).add().commit()
+        ips = [str(ipaddress.ip_address('2001:db8::') + i * 7919) for i in range(20000)]
+        macs = ['00:00:5e:%02x:%02x:%02x' % (i >> 16 & 255, i >> 8 & 255, i & 255) for i in range(20000)]
+        DhcpRecord.session.execute(insert(Ip), [{'ip': ip, 'vrf_id': self.vrf.id} for ip in ips])
+        DhcpRecord.session.execute(insert(Mac), [{'mac': mac} for mac in macs])
+        DhcpRecord.session.execute(
+            insert(DhcpRecord),
+            [
+                {
+                    'ip': ip,
+                    'mac': mac,
+                    'vrf_id': self.vrf.id,
+                    'subnet_id': subnet.id,
+                    'subnet_estatus': subnet.estatus,
+                    'subnet_range': subnet.range,
+                }
+                for ip, mac in zip(ips, macs)
+            ],
+        )
+        DhcpRecord.session.commit()
+        # When computing the space
+        start = time.perf_counter()
+        data = IpSpace(subnet).to_json(prefixlen=64)
+        elapsed = time.perf_counter() - start
+        # Then it's computed quickly
+        self.assertEqual(20000, data['used'])
+        self.assertLess(elapsed, 5, 'ip space: %.3fs' % elapsed)
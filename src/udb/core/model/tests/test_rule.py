@@ -15,11 +15,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import time
+from unittest import mock, skipIf, skipUnless
 
+import cherrypy
 from parameterized import parameterized
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
 
 from udb.controller.tests import WebCase
-from udb.core.model import Rule
+from udb.core.model import DnsRecord, Rule, Subnet, User, Vrf, rule_violation
+from udb.core.model._rule import _create_index_statement, _execute_parallel, _statement_timeout
 
 
 class RuleTest(WebCase):
@@ -27,6 +34,10 @@ class RuleTest(WebCase):
         super().setUp()
         self.add_records()
 
+    def tearDown(self):
+        cherrypy.config.update({'linter.timeout': 30, 'linter.max_failures': 3})
+        super().tearDown()
+
     @parameterized.expand(
         [
             # Invalid SQL
@@ -54,3 +65,275 @@ class RuleTest(WebCase):
             self.assertEqual('statement', context.exception.args[0])
         else:
             rule.add().commit()
+
+    def test_builtin_object_statement(self):
+        # Given builtin rules
+        rules = Rule.query.filter(Rule.builtin.is_(True), Rule.type == Rule.TYPE_SQL).all()
+        # Then each rule define a statement filtered on a single record
+        self.assertTrue(rules)
+        for rule in rules:
+            self.assertIn(':object_id', rule.object_statement)
+
+    def test_verify_with_obj(self):
+        # Given a database with invalid records
+        errors = Rule.verify()
+        self.assertTrue(errors)
+        # When verifying each record individually
+        for dnsrecord in DnsRecord.query.all():
+            # Then the errors are the same as verifying every records
+            expected = [row for row in errors if row.model_name == 'dnsrecord' and row.id == dnsrecord.id]
+            self.assertEqual(sorted(expected), sorted(Rule.verify(dnsrecord)))
+
+    def test_verify_with_object_statement(self):
+        # Given a custom rule with a statement for a single record.
+        Rule(
+            name='test',
+            description='test',
+            statement="SELECT id, name from subnet WHERE name = 'DMZ'",
+            object_statement="SELECT id, name from subnet WHERE name = 'DMZ' AND id = :object_id",
+            model_name='subnet',
+        ).add().commit()
+        subnet = Subnet.query.filter(Subnet.name == 'DMZ').first()
+        # When verifying a record
+        errors = Rule.verify(subnet)
+        # Then the rule is reported
+        self.assertEqual(['test'], [row.rule_name for row in errors])
+        # When verifying another record
+        other = Subnet.query.filter(Subnet.name == 'ARZ').first()
+        # Then the rule is not reported
+        self.assertEqual([], Rule.verify(other))
+
+    @parameterized.expand(
+        [
+            # Invalid SQL
+            ('INVALID STATEMENT',),
+            # Missing object filter
+            ("SELECT id, name from subnet",),
+            # Wrong column name
+            ("SELECT id, notes from subnet WHERE id = :object_id",),
+        ]
+    )
+    def test_with_invalid_object_statement(self, object_statement):
+        # Given an invalid object statement
+        rule = Rule(
+            name='test',
+            description='test',
+            statement="SELECT id, name from subnet",
+            object_statement=object_statement,
+            model_name='subnet',
+        )
+        # When trying to create the rule
+        # Then an error is raised
+        with self.assertRaises(ValueError) as context:
+            rule.add().commit()
+        self.assertEqual('object_statement', context.exception.args[0])
+
+    def test_refresh_violations(self):
+        # Given a custom rule on VRF
+        Rule(
+            name='test_vrf',
+            model_name='vrf',
+            statement="SELECT id, name from vrf where name != lower(name)",
+            description='VRF Name must be in lower case',
+        ).add().commit()
+        # Given rules evaluated in background
+        self.wait_for_tasks()
+        self.assertEqual(0, Rule.refresh_violations())
+        self.assertIsNotNone(Rule.get_linter_date())
+        linter_dates = dict(Rule.query.with_entities(Rule.name, Rule.linter_date).all())
+        # When creating a VRF infringing the rule
+        vrf = Vrf(name='UPPERCASE').add().commit()
+        self.wait_for_tasks()
+        # Then a violation is recorded
+        rows = Rule.session.execute(select(rule_violation)).all()
+        self.assertIn(('vrf', vrf.id, 'UPPERCASE'), [(row.model_name, row.model_id, row.name) for row in rows])
+        # Then only the rules related to VRF were evaluated
+        updated = [
+            name
+            for name, linter_date in Rule.query.with_entities(Rule.name, Rule.linter_date)
+            if linter_date != linter_dates[name]
+        ]
+        self.assertEqual(['test_vrf'], updated)
+
+    def test_refresh_violations_disabled_rule(self):
+        # Given a rule with violations
+        rule = Rule(
+            name='test_vrf',
+            model_name='vrf',
+            statement="SELECT id, name from vrf where name != lower(name)",
+            description='VRF Name must be in lower case',
+        ).add()
+        Vrf(name='UPPERCASE').add().commit()
+        Rule.refresh_violations(full=True)
+        self.assertTrue(Rule.session.execute(select(rule_violation).filter_by(rule_id=rule.id)).all())
+        # When the rule get disabled
+        rule.status = Rule.STATUS_DISABLED
+        rule.add().commit()
+        self.wait_for_tasks()
+        Rule.refresh_violations()
+        # Then violations are removed
+        self.assertFalse(Rule.session.execute(select(rule_violation).filter_by(rule_id=rule.id)).all())
+
+    def test_refresh_violations_duration(self):
+        # Given rules
+        # When evaluating every rules
+        Rule.refresh_violations(full=True)
+        # Then the execution time of each rule is recorded
+        rules = Rule.query.filter(Rule.type == Rule.TYPE_SQL).all()
+        self.assertTrue(rules)
+        for rule in rules:
+            self.assertIsNotNone(rule.linter_duration)
+            self.assertEqual(0, rule.linter_failures)
+
+    def test_refresh_violations_timeout(self):
+        # Given a linter timeout
+        cherrypy.config.update({'linter.timeout': 0.5, 'linter.max_failures': 2})
+        # Given a rule taking forever to evaluate a VRF named "slow"
+        rule = Rule(
+            name='test_slow',
+            model_name='vrf',
+            statement=(
+                "SELECT id, name FROM vrf WHERE name = 'slow' AND ("
+                "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000000 + length(vrf.name)) "
+                "SELECT max(x) FROM c) < 0"
+            ),
+            description='Slow rule',
+        ).add()
+        Vrf(name='slow').add().commit()
+        # When the rules get evaluated in background
+        start = time.time()
+        self.wait_for_tasks()
+        # Then the evaluation is interrupted
+        self.assertLess(time.time() - start, 10)
+        rule.expire()
+        self.assertEqual(1, rule.linter_failures)
+        self.assertEqual(Rule.STATUS_ENABLED, rule.status)
+        # When the rule failed again
+        Rule.refresh_violations(full=True, timeout=0.5, max_failures=2)
+        # Then the rule is disabled with a message.
+        rule.expire()
+        self.assertEqual(2, rule.linter_failures)
+        self.assertEqual(Rule.STATUS_DISABLED, rule.status)
+        self.assertIn('Rule disabled automatically', rule.messages[-1].body)
+
+    def test_statement_timeout_reset(self):
+        # Given a statement executed with a timeout
+        with _statement_timeout(Rule.session, 0.1):
+            Rule.session.execute(text('SELECT 1')).scalar()
+        # When executing a longer statement within the same transaction
+        value = Rule.session.execute(
+            text(
+                "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000) SELECT max(x) FROM c"
+            )
+        ).scalar()
+        # Then the statement is not interrupted
+        self.assertEqual(1000000, value)
+
+    def test_verify_with_workers(self):
+        # Given a database with invalid records
+        expected = Rule.verify()
+        self.assertTrue(expected)
+        self.wait_for_tasks()
+        # When verifying every records using multiple workers
+        with mock.patch.object(Rule, '_use_parallel', return_value=True), mock.patch(
+            'udb.core.model._rule._execute_parallel', wraps=_execute_parallel
+        ) as execute_parallel:
+            errors = Rule.verify(workers=4)
+        # Then rules are executed concurrently
+        execute_parallel.assert_called_once()
+        # Then the same errors are returned
+        self.assertEqual(sorted(expected), sorted(errors))
+
+    def test_refresh_violations_with_workers(self):
+        # Given violations evaluated sequentially
+        Rule.refresh_violations(full=True)
+        expected = Rule.session.execute(select(rule_violation.c.rule_id, rule_violation.c.model_id)).all()
+        self.assertTrue(expected)
+        self.wait_for_tasks()
+        # When evaluating every rules using multiple workers
+        with mock.patch.object(Rule, '_use_parallel', return_value=True), mock.patch(
+            'udb.core.model._rule._execute_parallel', wraps=_execute_parallel
+        ) as execute_parallel:
+            Rule.refresh_violations(full=True, workers=4)
+        # Then rules are executed concurrently
+        execute_parallel.assert_called_once()
+        # Then the same violations are stored
+        violations = Rule.session.execute(select(rule_violation.c.rule_id, rule_violation.c.model_id)).all()
+        self.assertEqual(sorted(expected), sorted(violations))
+
+    def test_advise(self):
+        # Given a rule filtering records on a column without index
+        Rule(
+            name='test_value_rule',
+            model_name='dnsrecord',
+            statement="SELECT id, name FROM dnsrecord WHERE value = 'invalid'",
+            description='Invalid value',
+        ).add().commit()
+        # When looking for sequential scans
+        advices = [a for a in Rule.advise(min_rows=0) if a.rule_name == 'test_value_rule']
+        # Then an index is suggested
+        self.assertEqual(1, len(advices))
+        self.assertEqual('dnsrecord', advices[0].table)
+        self.assertEqual('CREATE INDEX IF NOT EXISTS dnsrecord_value_ix ON dnsrecord (value)', advices[0].index)
+        # When creating the index
+        Rule.session.execute(text(advices[0].index))
+        Rule.session.commit()
+        # Then the rule no longer scan the table
+        self.assertFalse([a for a in Rule.advise(min_rows=0) if a.rule_name == 'test_value_rule'])
+
+    @parameterized.expand(
+        [
+            (sqlite.dialect(), 'CREATE INDEX IF NOT EXISTS user_fullname_email_ix ON user (fullname, email)'),
+            (
+                postgresql.dialect(),
+                'CREATE INDEX IF NOT EXISTS user_fullname_email_ix ON "user" (fullname, email)',
+            ),
+        ]
+    )
+    def test_create_index_statement(self, dialect, expected):
+        # Given a table named with a reserved word
+        table = User.__table__
+        # When creating the index statement
+        # Then identifiers are quoted according to the dialect
+        self.assertEqual(expected, _create_index_statement(dialect, table, ['fullname', 'email']))
+
+    def test_advise_min_rows(self):
+        # Given a database with few records
+        # When looking for sequential scans on large tables
+        advices = Rule.advise()
+        # Then small tables are ignored
+        self.assertEqual([], advices)
+
+    @skipIf('postgresql' in str(cherrypy.config.get('tools.db.uri')), 'required sqlite database')
+    def test_builtin_rules_query_plan(self):
+        # Given a builtin rule looking up related records
+        rule = Rule.query.filter(Rule.name == 'dnsrecord_ptr_forward_required_rule').one()
+        # When planning the statement
+        plan = self.query_plan(text(rule.statement))
+        # Then forward records are looked up using an index
+        self.assertIn('dnsrecord_generated_ip_vrf_id_type_estatus_ix', plan)
+
+    @skipUnless(os.environ.get('TEST_BENCHMARK'), 'required TEST_BENCHMARK to run benchmark')
+    def test_benchmark_refresh_violations_workers(self):
+        if Rule.session.get_bind().dialect.name == 'sqlite':
+            self.skipTest('rules are not evaluated concurrently with SQLite')
+        # Given multiple slow rules
+        for i in range(8):
+            Rule(
+                name='test_slow_%s' % i,
+                model_name='vrf',
+                statement="SELECT id, name FROM vrf WHERE pg_sleep(0.25) IS NOT NULL",
+                description='Slow rule',
+            ).add()
+        Rule.session.commit()
+        self.wait_for_tasks()
+        # When evaluating the rules one by one
+        start = time.perf_counter()
+        Rule.refresh_violations(full=True, workers=1)
+        sequential = time.perf_counter() - start
+        # When evaluating the rules concurrently
+        start = time.perf_counter()
+        Rule.refresh_violations(full=True, workers=8)
+        concurrent = time.perf_counter() - start
+        # Then the evaluation is faster
+        self.assertLess(concurrent, sequential / 2, 'sequential: %.3fs, concurrent: %.3fs' % (sequential, concurrent))
@@ -15,14 +15,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from unittest import mock
+import os
+import time
+from unittest import mock, skipUnless
 
+import cherrypy
 from parameterized import parameterized
-from sqlalchemy import func
+from sqlalchemy import delete, func, insert, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import DatabaseError, IntegrityError
 
 from udb.controller.tests import WebCase
 from udb.core.model import DnsZone, Subnet, Vrf
+from udb.core.model._subnet import create_subnet_closure, range_contains, subnet_closure
+from udb.core.model._update import index_exists
 
 
 class SubnetTest(WebCase):
@@ -68,6 +74,76 @@ class SubnetTest(WebCase):
             },
         )
 
+    @parameterized.expand(
+        [
+            ('192.168.1.15', ['192.168.0.0/16', '192.168.1.0/24']),
+            ('192.168.1.0', ['192.168.0.0/16', '192.168.1.0/24']),
+            ('192.168.1.255', ['192.168.0.0/16', '192.168.1.0/24']),
+            ('192.168.2.1', ['192.168.0.0/16']),
+            ('10.0.0.1', []),
+            ('2001:db8::1', ['2001:db8::/32']),
+            ('::ffff:192.168.1.15', []),
+        ]
+    )
+    def test_range_contains(self, ip, expected):
+        # Given subnets with IPv4 and IPv6 ranges
+        vrf = Vrf(name='default').add().flush()
+        for range in ['192.168.0.0/16', '192.168.1.0/24', '2001:db8::/32']:
+            Subnet(range=range, vrf=vrf).add().flush()
+        Subnet.session.commit()
+        # When searching subnets containing an IP
+        subnets = Subnet.query.filter(range_contains(Subnet, ip)).order_by(Subnet.range).all()
+        # Then subnets of the same family are returned.
+        self.assertEqual(expected, [s.range for s in subnets])
+
+    def test_range_contains_strict(self):
+        # Given subnets
+        vrf = Vrf(name='default').add().flush()
+        Subnet(range='192.168.0.0/16', vrf=vrf).add().flush()
+        Subnet(range='192.168.1.0/24', vrf=vrf).add().commit()
+        # When searching subnets containing a range
+        subnets = Subnet.query.filter(range_contains(Subnet, '192.168.1.0/24', strict=True)).all()
+        # Then the range itself is excluded.
+        self.assertEqual(['192.168.0.0/16'], [s.range for s in subnets])
+
+    def test_range_contains_sql(self):
+        # Given a range_contains expression
+        expr = range_contains(Subnet, '192.168.1.0/24', strict=True)
+        # When compiled for Postgresql
+        sql = str(expr.compile(dialect=postgresql.dialect()))
+        # Then network operator is used.
+        self.assertEqual('subnet.range >> %(param_1)s', sql)
+        # When compiled for SQLite
+        sql = str(expr.compile(dialect=sqlite.dialect()))
+        # Then first and last address are compared.
+        self.assertIn('subnet._range_start <= ?', sql)
+        self.assertIn('subnet._range_end >= ?', sql)
+
+    @skipUnless('postgresql' in str(cherrypy.config.get('tools.db.uri')), 'required postgresql database')
+    def test_gist_index(self):
+        # Given a Postgresql database
+        # Then network columns are indexed with GiST
+        conn = Subnet.session.connection()
+        for name in [
+            'subnet_range_gist_ix',
+            'dnsrecord_generated_ip_gist_ix',
+            'dhcprecord_ip_gist_ix',
+            'ip_ip_gist_ix',
+        ]:
+            self.assertTrue(index_exists(conn, name), name)
+        # Given subnets
+        vrf = Vrf(name='default').add().flush()
+        Subnet(range='192.168.0.0/16', vrf=vrf).add().flush()
+        subnet = Subnet(range='192.168.1.0/24', vrf=vrf).add().commit()
+        # When looking for the parent of a subnet without sequential scan
+        Subnet.session.execute(text('SET LOCAL enable_seqscan = off'))
+        query = subnet._find_parent().statement.compile(
+            dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}
+        )
+        plan = '\n'.join(row[0] for row in Subnet.session.execute(text('EXPLAIN %s' % query)))
+        # Then the GiST index is used
+        self.assertIn('subnet_range_gist_ix', plan)
+
     def test_add_ipv4(self):
         # Given an empty database
         self.assertEqual(0, Subnet.query.count())
@@ -430,3 +506,146 @@ class SubnetTest(WebCase):
         subnet.add().commit()
         # Then a message is added in history.
         self.assertEqual(subnet.messages[-1].changes, {'slave_subnets': [['192.168.2.0/24'], []]})
+
+    def test_reparent_many_children(self):
+        # Given a hierarchy of subnets
+        vrf = Vrf(name='default').add().flush()
+        a = Subnet(range='10.1.0.0/16', vrf=vrf).add().flush()
+        b = Subnet(range='10.1.1.0/24', vrf=vrf).add().flush()
+        c = Subnet(range='10.2.1.0/24', vrf=vrf).add().flush()
+        d = Subnet(range='10.1.1.128/25', vrf=vrf).add().commit()
+        # When inserting a broader subnet
+        parent = Subnet(range='10.0.0.0/8', vrf=vrf).add().commit()
+        Subnet.session.expire_all()
+        # Then only top level subnets are re-assigned
+        self.assertEqual(parent.id, a.parent_id)
+        self.assertEqual(a.id, b.parent_id)
+        self.assertEqual(parent.id, c.parent_id)
+        self.assertEqual(b.id, d.parent_id)
+        self.assertEqual([1, 2, 1, 3], [a.depth, b.depth, c.depth, d.depth])
+        # When moving the intermediate subnet
+        a.range = '10.3.0.0/16'
+        a.add().commit()
+        Subnet.session.expire_all()
+        # Then children are re-assigned to the broader subnet.
+        self.assertEqual(parent.id, b.parent_id)
+        self.assertEqual([1, 2], [b.depth, d.depth])
+
+    def _closure(self):
+        return sorted(Subnet.session.execute(select(subnet_closure)).all())
+
+    def _expected_closure(self):
+        # Compute the closure by walking the parent_id.
+        parents = dict(Subnet.session.execute(select(Subnet.id, Subnet.parent_id)).all())
+        expected = []
+        for subnet_id in parents:
+            ancestor_id, depth = subnet_id, 0
+            while ancestor_id:
+                expected.append((ancestor_id, subnet_id, depth))
+                ancestor_id, depth = parents[ancestor_id], depth + 1
+        return sorted(expected)
+
+    def test_closure(self):
+        # Given a hierarchy of subnets
+        vrf = Vrf(name='default').add().flush()
+        a = Subnet(range='10.1.0.0/16', vrf=vrf).add().flush()
+        b = Subnet(range='10.1.1.0/24', vrf=vrf).add().flush()
+        c = Subnet(range='10.2.1.0/24', vrf=vrf).add().flush()
+        d = Subnet(range='10.1.1.128/25', vrf=vrf).add().commit()
+        # Then closure table is populated
+        self.assertEqual(self._expected_closure(), self._closure())
+        self.assertEqual([a], b.ancestors)
+        self.assertEqual([a, b], d.ancestors)
+        self.assertEqual([b, d], a.descendants)
+        self.assertEqual(2, a.subtree_count)
+        self.assertEqual(0, c.subtree_count)
+        # When inserting a broader subnet
+        parent = Subnet(range='10.0.0.0/8', vrf=vrf).add().commit()
+        # Then closure table is updated
+        self.assertEqual(self._expected_closure(), self._closure())
+        self.assertEqual([parent, a, b], d.ancestors)
+        self.assertEqual(4, parent.subtree_count)
+        # When moving the intermediate subnet
+        a.range = '10.3.0.0/16'
+        a.add().commit()
+        # Then closure table is updated
+        self.assertEqual(self._expected_closure(), self._closure())
+        self.assertEqual([parent, b], d.ancestors)
+        self.assertEqual([], a.descendants)
+        # When deleting a subnet
+        a.delete()
+        a.commit()
+        # Then closure table is updated
+        self.assertEqual(self._expected_closure(), self._closure())
+        self.assertEqual(
+            sorted([b.id, c.id, d.id, parent.id]),
+            sorted(s.id for s in Subnet.query.filter(Subnet.in_subtree(parent.id)).all()),
+        )
+        self.assertEqual([b.id, d.id], sorted(s.id for s in Subnet.query.filter(Subnet.in_subtree(b.id)).all()))
+
+    def test_closure_populate(self):
+        # Given a hierarchy of subnets
+        vrf = Vrf(name='default').add().flush()
+        Subnet(range='10.0.0.0/8', vrf=vrf).add().flush()
+        Subnet(range='10.1.0.0/16', vrf=vrf).add().flush()
+        Subnet(range='10.1.1.0/24', vrf=vrf).add().commit()
+        expected = self._closure()
+        # Given an empty closure table
+        Subnet.session.execute(delete(subnet_closure))
+        Subnet.session.commit()
+        # When creating the database
+        create_subnet_closure(None, Subnet.session.connection())
+        Subnet.session.commit()
+        # Then the closure table is populated
+        self.assertEqual(expected, self._closure())
+        self.assertEqual(self._expected_closure(), self._closure())
+
+    @skipUnless(os.environ.get('TEST_BENCHMARK'), 'required TEST_BENCHMARK to run benchmark')
+    def test_benchmark_reparent(self):
+        # Given a VRF with many subnets
+        vrf = Vrf(name='default').add().commit()
+        Subnet.session.execute(
+            insert(Subnet),
+            [
+                {
+                    'name': '',
+                    'range': '10.%s.%s.0/24' % (i // 250, i % 250),
+                    'vrf_id': vrf.id,
+                    'vrf_estatus': vrf.estatus,
+                }
+                for i in range(2000)
+            ],
+        )
+        Subnet.session.commit()
+        # When inserting a subnet containing all of them
+        start = time.perf_counter()
+        parent = Subnet(range='10.0.0.0/8', vrf=vrf).add().commit()
+        current = time.perf_counter() - start
+        # Then all subnets are re-assigned
+        self.assertEqual(2000, Subnet.query.filter(Subnet.parent_id == parent.id).count())
+        # When executing the same reassignment with a correlated subquery
+        start = time.perf_counter()
+        Subnet.session.execute(
+            update(Subnet)
+            .filter(Subnet.id != parent.id, range_contains(parent.range, Subnet, strict=True))
+            .values(
+                {
+                    tuple_(
+                        Subnet.parent_id,
+                        Subnet.parent_evlan,
+                        Subnet.parent_el2vni,
+                        Subnet.parent_el3vni,
+                        Subnet.parent_estatus,
+                        Subnet.parent_range,
+                        Subnet.parent_depth,
+                    )
+                    .self_group(): Subnet._find_parent()
+                    .scalar_subquery()
+                }
+            ),
+            execution_options={'synchronize_session': False},
+        )
+        reference = time.perf_counter() - start
+        Subnet.session.rollback()
+        # Then the set-based reassignment is faster
+        self.assertLess(current, reference, 'set-based: %.3fs, correlated: %.3fs' % (current, reference))
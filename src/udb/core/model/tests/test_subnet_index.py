@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import ipaddress
+import unittest
+
+from parameterized import parameterized
+
+from udb.controller.tests import WebCase
+from udb.core.model import Subnet, Vrf
+from udb.core.model._subnet import subnet_index
+from udb.core.model._subnet_index import RadixTree, SubnetIndex, nearest_supernets
+
+
+class RadixTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = RadixTree()
+        for key, value in [
+            (1, '10.0.0.0/8'),
+            (2, '10.1.0.0/16'),
+            (3, '10.1.1.0/24'),
+            (4, '192.168.0.0/24'),
+            (5, '2001:db8::/32'),
+            (6, '0.0.0.0/0'),
+        ]:
+            self.tree.add(ipaddress.ip_network(value), key)
+
+    @parameterized.expand(
+        [
+            ('10.1.1.5/32', False, [3, 2, 1, 6]),
+            ('10.1.1.0/24', False, [3, 2, 1, 6]),
+            ('10.1.1.0/24', True, [2, 1, 6]),
+            ('10.2.0.0/16', False, [1, 6]),
+            ('192.168.1.1/32', False, [6]),
+            ('0.0.0.0/0', True, []),
+            ('2001:db8::1/128', False, [5]),
+            ('2001:db9::1/128', False, []),
+        ]
+    )
+    def test_supernets(self, value, strict, expected):
+        self.assertEqual(expected, self.tree.supernets(ipaddress.ip_network(value), strict))
+
+    def test_discard(self):
+        # When removing a network
+        self.tree.discard(ipaddress.ip_network('10.1.0.0/16'), 2)
+        # Then it's not returned
+        self.assertEqual([3, 1, 6], self.tree.supernets(ipaddress.ip_network('10.1.1.5/32')))
+
+
+class NearestSupernetsTest(unittest.TestCase):
+    containers = [
+        (1, '10.0.0.0/8'),
+        (2, '10.1.0.0/16'),
+        (3, '10.1.1.0/24'),
+        (4, '10.2.0.0/16'),
+        (5, '2001:db8::/32'),
+        (6, '10.1.2.3/32'),
+    ]
+
+    @parameterized.expand(
+        [
+            ('10.1.1.5', False, 3),
+            ('10.1.2.3', False, 6),
+            ('10.1.2.3', True, 2),
+            ('10.1.1.0/24', False, 3),
+            ('10.1.1.0/24', True, 2),
+            ('10.3.0.1', False, 1),
+            ('10.0.0.0/8', True, None),
+            ('192.168.1.1', False, None),
+            ('2001:db8::1', False, 5),
+            ('::ffff:10.1.1.5', False, None),
+        ]
+    )
+    def test_nearest_supernets(self, value, strict, expected):
+        self.assertEqual({'v': expected}, nearest_supernets(self.containers, [('v', value)], strict=strict))
+
+    def test_nearest_supernets_many(self):
+        # Given many values
+        values = [(i, value) for i, value in enumerate(['10.2.0.1', '10.1.1.1', '2001:db8::1', '10.1.0.1', '10.1.1.2'])]
+        # When searching containers
+        # Then each value get assigned to their container.
+        self.assertEqual(
+            {0: 4, 1: 3, 2: 5, 3: 2, 4: 3},
+            nearest_supernets(self.containers, values),
+        )
+
+
+class SubnetIndexTest(unittest.TestCase):
+    def test_lookup(self):
+        # Given an index with subnets in two VRF
+        index = SubnetIndex(lambda: [(1, 1, '10.0.0.0/8'), (2, 2, '10.0.0.0/8'), (3, 1, '10.1.0.0/16')])
+        # When searching a VRF
+        # Then only subnets of this VRF are returned.
+        self.assertEqual([3, 1], index.lookup(1, '10.1.2.3'))
+        self.assertEqual([2], index.lookup(2, '10.1.2.3'))
+        # When searching every VRF
+        # Then subnets of every VRF are returned
+        self.assertEqual([1, 2, 3], sorted(index.lookup(None, '10.1.2.3')))
+
+    def test_lookup_pending(self):
+        # Given an index
+        index = SubnetIndex(lambda: [(1, 1, '10.0.0.0/8')])
+        # When searching with pending changes
+        # Then pending subnets are returned
+        self.assertEqual([1, 2], index.lookup(1, '10.1.2.3', pending={2: (1, '10.1.0.0/16'), 3: None}))
+
+    def test_update(self):
+        # Given an index
+        index = SubnetIndex(lambda: [(1, 1, '10.0.0.0/8'), (2, 1, '10.1.0.0/16')])
+        self.assertEqual([2, 1], index.lookup(1, '10.1.2.3'))
+        # When a subnet get updated and another one deleted
+        index.update({1: (1, '10.1.2.0/24'), 2: None})
+        # Then the index is updated.
+        self.assertEqual([1], index.lookup(1, '10.1.2.3'))
+        self.assertEqual([], index.lookup(1, '10.2.0.1'))
+
+
+class SubnetIndexDatabaseTest(WebCase):
+    def test_rollback(self):
+        # Given a subnet
+        vrf = Vrf(name='default').add().flush()
+        Subnet(range='192.168.0.0/16', vrf=vrf).add().commit()
+        # Given a subnet modified and rollback
+        subnet = Subnet.query.first()
+        subnet.range = '10.0.0.0/8'
+        subnet.add().flush()
+        Subnet.session.rollback()
+        # When adding a child subnet
+        child = Subnet(range='192.168.1.0/24', vrf=vrf).add().commit()
+        # Then the parent is found.
+        self.assertEqual(subnet.id, child.parent_id)
+
+    def test_pending(self):
+        # Given a subnet not yet committed
+        vrf = Vrf(name='default').add().flush()
+        parent = Subnet(range='192.168.0.0/16', vrf=vrf).add().flush()
+        # When adding a child subnet
+        child = Subnet(range='192.168.1.0/24', vrf=vrf).add().commit()
+        # Then the parent is found.
+        self.assertEqual(parent.id, child.parent_id)
+        self.assertEqual([parent.id], subnet_index.lookup(vrf.id, '192.168.1.0/24', strict=True))
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# udb, A web interface to manage IT network
+# Copyright (C) 2022 IKUS Software inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import time
+
+import cherrypy
+
+from udb.controller import url_for
+from udb.controller.tests import WebCase
+from udb.core.model import Deployment, DnsRecord, DnsZone, Environment, Subnet, User, Vrf
+
+
+class DeploymentPluginTest(WebCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.query.filter_by(username=self.username).first()
+
+    def tearDown(self):
+        cherrypy.config.update({'deployment.timeout': 3600})
+        super().tearDown()
+
+    def _create_deployment(self, name, script, model_name='subnet'):
+        env = Environment(name=name, model_name=model_name, script=script).add().commit()
+        return env.create_deployment(self.user).add().commit()
+
+    def _get_deployment(self, deployment_id):
+        Deployment.session.expire_all()
+        return Deployment.query.filter(Deployment.id == deployment_id).one()
+
+    def test_deploy(self):
+        # Given a deployment
+        deployment = self._create_deployment('test', 'echo FOO\necho $UDB_DEPLOYMENT_TOKEN\n')
+        # When scheduling the deployment
+        deployment.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then the output is stored in database without the token
+        deployment = self._get_deployment(deployment.id)
+        self.assertEqual(Deployment.STATE_SUCCESS, deployment.state)
+        self.assertEqual('FOO\n********\n\nSUCCESS', deployment.output)
+
+    def test_deploy_failure(self):
+        # Given a deployment with a failing script
+        deployment = self._create_deployment('test', 'echo FOO\nexit 3\n')
+        # When scheduling the deployment
+        deployment.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then deployment is failed
+        deployment = self._get_deployment(deployment.id)
+        self.assertEqual(Deployment.STATE_FAILURE, deployment.state)
+        self.assertEqual('FOO\n\nreturn code: 3\nFAILED', deployment.output)
+
+    def test_deploy_long_line(self):
+        # Given a deployment printing a line longer then the limit
+        deployment = self._create_deployment('test', 'printf "%0.sA" $(seq 1 70000)\necho\necho BAR\n')
+        # When scheduling the deployment
+        deployment.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then the complete output is stored.
+        deployment = self._get_deployment(deployment.id)
+        self.assertEqual(Deployment.STATE_SUCCESS, deployment.state)
+        self.assertEqual('A' * 70000 + '\nBAR\n\nSUCCESS', deployment.output)
+
+    def test_deploy_timeout(self):
+        # Given a deployment timeout
+        cherrypy.config.update({'deployment.timeout': 1})
+        # Given a script spawning a child process that never exit
+        deployment = self._create_deployment('test', 'echo FOO\nsleep 60 &\nsleep 60\n')
+        # When scheduling the deployment
+        start = time.time()
+        deployment.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then the deployment get killed
+        self.assertLess(time.time() - start, 30)
+        deployment = self._get_deployment(deployment.id)
+        self.assertEqual(Deployment.STATE_FAILURE, deployment.state)
+        self.assertEqual('FOO\n\ntimeout after 1 seconds\nFAILED', deployment.output)
+
+    def test_deploy_concurrent_environments(self):
+        # Given two environments with a slow deployment script
+        deployment1 = self._create_deployment('env1', 'sleep 1\n')
+        deployment2 = self._create_deployment('env2', 'sleep 1\n')
+        # When scheduling both deployments
+        start = time.time()
+        deployment1.schedule_task(base_url=url_for('/'))
+        deployment2.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then both deployments are executed in parallel
+        self.assertLess(time.time() - start, 1.9)
+        self.assertEqual(Deployment.STATE_SUCCESS, self._get_deployment(deployment1.id).state)
+        self.assertEqual(Deployment.STATE_SUCCESS, self._get_deployment(deployment2.id).state)
+
+    def test_deploy_same_environment(self):
+        # Given two deployments of the same environment
+        env = Environment(name='test', model_name='subnet', script='date +%s.%N\nsleep 1\n').add().commit()
+        deployment1 = env.create_deployment(self.user).add().commit()
+        deployment2 = env.create_deployment(self.user).add().commit()
+        # When scheduling both deployments
+        deployment1.schedule_task(base_url=url_for('/'))
+        deployment2.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then deployments are executed one after the other.
+        start1 = float(self._get_deployment(deployment1.id).output.split('\n')[0])
+        start2 = float(self._get_deployment(deployment2.id).output.split('\n')[0])
+        self.assertGreaterEqual(abs(start2 - start1), 1)
+
+    def test_deploy_data_file(self):
+        # Given a database with a subnet
+        vrf = Vrf(name='default').add().flush()
+        Subnet(name='LAN', range='192.168.14.0/24', vrf=vrf).add().commit()
+        # Given a deployment reading the data file
+        deployment = self._create_deployment('test', 'cat "$UDB_DEPLOYMENT_DATA_FILE"\necho\n')
+        # When scheduling the deployment
+        deployment.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then the data file contains the deployment data.
+        deployment = self._get_deployment(deployment.id)
+        self.assertEqual(Deployment.STATE_SUCCESS, deployment.state)
+        self.assertEqual(deployment.data, json.loads(deployment.output.split('\n')[0]))
+
+    def test_deploy_zones_dir(self):
+        # Given a database with DNS Records
+        vrf = Vrf(name='default').add().flush()
+        zone = DnsZone(name='example.com')
+        Subnet(name='LAN', range='192.168.14.0/24', vrf=vrf, dnszones=[zone]).add().flush()
+        DnsRecord(name='foo.example.com', type='A', value='192.168.14.15', vrf=vrf).add().commit()
+        # Given a deployment reading the zone files
+        deployment = self._create_deployment(
+            'test', 'ls "$UDB_DEPLOYMENT_ZONES_DIR"\ncat "$UDB_DEPLOYMENT_ZONES_DIR/example.com.zone"\n', 'dnsrecord'
+        )
+        # When scheduling the deployment
+        deployment.schedule_task(base_url=url_for('/'))
+        self.wait_for_tasks()
+        # Then a zone file is available for each zone.
+        deployment = self._get_deployment(deployment.id)
+        self.assertEqual(Deployment.STATE_SUCCESS, deployment.state)
+        self.assertIn('example.com.zone\n', deployment.output)
+        self.assertIn('foo.example.com. 3600 IN A 192.168.14.15', deployment.output)
@@ -21,9 +21,11 @@ import sys
 
 import cherrypy
 from cherrypy.process.plugins import DropPrivileges
+from sqlalchemy import text
 
 from udb.app import UdbApplication
 from udb.config import parse_args
+from udb.core.model import Rule
 
 
 def _setup_logging(log_file, log_access_file, level):
@@ -86,6 +88,24 @@ def _setup_logging(log_file, log_access_file, level):
     cherrypy_error.addHandler(default_handler)
 
 
+def _rule_advisor(create_indexes=False):
+    """
+    Print the sequential scans executed by the rules and create the suggested indexes if requested.
+    """
+    try:
+        advices = Rule.advise()
+        for advice in advices:
+            print('%s: %s (%s rows)' % (advice.rule_name, advice.detail, advice.rows))
+            if advice.index:
+                print('  %s' % advice.index)
+        if create_indexes:
+            for index in sorted({advice.index for advice in advices if advice.index}):
+                Rule.session.execute(text(index))
+            Rule.session.commit()
+    finally:
+        cherrypy.tools.db.on_end_resource()
+
+
 def main(args=None):
     """
     Main entry point of the web server.
@@ -109,6 +129,12 @@ def main(args=None):
     cherrypy.drop_privileges = DropPrivileges(cherrypy.engine, umask=cfg.umask, uid=cfg.user, gid=cfg.group)
     cherrypy.drop_privileges.subscribe()
 
+    # Report missing indexes without starting the web server.
+    if cfg.rule_advisor:
+        UdbApplication(cfg=cfg)
+        _rule_advisor(create_indexes=cfg.rule_advisor_create_indexes)
+        return
+
     # start app
     cherrypy.quickstart(UdbApplication(cfg=cfg))
 
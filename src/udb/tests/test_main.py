@@ -53,3 +53,10 @@ class Test(unittest.TestCase):
             with self.assertRaises(SystemExit):
                 main(['--version'])
         self.assertRegex(f.getvalue(), r'udb (DEV|[0-9].*)')
+
+    def test_main_rule_advisor(self, quickstart):
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            main(['--rule-advisor'])
+        # Web server is not started.
+        quickstart.assert_not_called()